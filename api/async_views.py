@@ -0,0 +1,151 @@
+import asyncio
+import functools
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import HttpResponse, JsonResponse
+from django.views import View
+from rest_framework import exceptions
+from rest_framework.views import APIView
+
+from api.es_client import async_execute, async_healthy
+from api.search_queries import CursorExpired, InvalidFilter, check_window, page_links, restart_link
+from api.views import SearchAllView, SearchAllView_70, SearchComplaintsView, SearchComplaintsView_70, \
+    SearchPrescriptionsView, SearchPrescriptionsView_70, SearchSolutionsView, SearchSolutionsView_70, \
+    SearchUnavailable, cache_params, search_cache
+
+# Django 4.2 runs even the async ORM methods on one shared thread, so the blocking work of these views
+# (authentication, highlight sources, the search cache) goes to a pool of its own. Its size bounds the
+# Postgres connections these views hold; the Elasticsearch waits need no thread at all.
+db_executor = ThreadPoolExecutor(max_workers=settings.ASYNC_DB_THREADS, thread_name_prefix='async-db')
+# Searches in flight on each event loop, by cache key.
+_in_flight = weakref.WeakKeyDictionary()
+
+
+def _call(func, *args):
+    close_old_connections()
+    return func(*args)
+
+
+async def run_blocking(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(db_executor, _call, func, *args)
+
+
+def check_access(request):
+    # The DRF authentication, permission and throttle checks of the sync views, on a plain Django request.
+    view = APIView()
+    view.args, view.kwargs = (), {}
+    drf_request = view.initialize_request(request)
+    view.request = drf_request
+    try:
+        view.initial(drf_request)
+    except (exceptions.NotAuthenticated, exceptions.AuthenticationFailed) as e:
+        e.auth_header = view.get_authenticate_header(drf_request)
+        if e.auth_header is None:
+            e.status_code = 403
+        raise
+
+
+def cached_result(scope, query, params):
+    key = search_cache.key(scope, query, params)
+    return key, search_cache.get(key)
+
+
+async def compute_and_cache(key, compute):
+    result = await compute()
+    await run_blocking(search_cache.set, key, result)
+    return result
+
+
+async def get_or_compute(key, cached, compute):
+    # search_cache.get_or_compute for the event loop: identical requests arriving together await the search of
+    # the first one instead of all hitting Elasticsearch. Shielded, so a client that goes away cancels only its
+    # own wait.
+    if cached is not None:
+        return cached
+    in_flight = _in_flight.setdefault(asyncio.get_running_loop(), {})
+    task = in_flight.get(key)
+    if task is None:
+        task = in_flight[key] = asyncio.ensure_future(compute_and_cache(key, compute))
+        task.add_done_callback(lambda done: in_flight.pop(key, None))
+    return await asyncio.shield(task)
+
+
+class AsyncSearchView(View):
+    # Same query, filters, cache keys and response as `sync_view`, served from the event loop under ASGI:
+    # a slow phrase search keeps a connection of the async Elasticsearch pool busy, not a worker thread.
+    sync_view = SearchComplaintsView
+
+    async def get(self, request, query):
+        try:
+            await run_blocking(check_access, request)
+            view = self.sync_view()
+            if 'cursor' in request.GET:
+                # Cursor pages open and close points in time through the sync client; few requests use them.
+                return JsonResponse(await run_blocking(view.search, request, query),
+                                    json_dumps_params={'ensure_ascii': False})
+            key, cached = await run_blocking(cached_result, [self.sync_view.__name__, request.get_host()], query,
+                                             cache_params(request.GET))
+            result = await get_or_compute(key, cached, lambda: self.search(request, view, query))
+            return JsonResponse(result, json_dumps_params={'ensure_ascii': False})
+        except exceptions.APIException as e:
+            response = JsonResponse({'detail': str(e.detail)}, status=e.status_code)
+            if getattr(e, 'auth_header', None):
+                response['WWW-Authenticate'] = e.auth_header
+            return response
+        except SearchUnavailable:
+            return HttpResponse('Search is temporarily unavailable', status=503)
+        except InvalidFilter as e:
+            return HttpResponse(str(e), status=400)
+        except CursorExpired as e:
+            return HttpResponse(f'{e}; restart the walk from {restart_link(request)}', status=410)
+        except Exception as e:
+            return HttpResponse(str(e), status=500)
+
+    async def search(self, request, view, query):
+        if not await async_healthy():
+            raise SearchUnavailable()
+        size = int(request.GET.get('size', 10))
+        from_value = int(request.GET.get('from', 0))
+        check_window(from_value, size)
+        search = view.prepare(query, request.GET).extra(size=size, from_=from_value, track_total_hits=True)
+        response = await async_execute(search)
+        count = response.hits.total.value
+        # Serializing looks up the attachment of every highlight in Postgres.
+        return await run_blocking(functools.partial(view.render, response, count,
+                                                    *page_links(request, count, size, from_value),
+                                                    **view.render_options(request, query, request.GET)))
+
+
+class AsyncSearchComplaintsView(AsyncSearchView):
+    sync_view = SearchComplaintsView
+
+
+class AsyncSearchComplaintsView_70(AsyncSearchView):
+    sync_view = SearchComplaintsView_70
+
+
+class AsyncSearchSolutionsView(AsyncSearchView):
+    sync_view = SearchSolutionsView
+
+
+class AsyncSearchSolutionsView_70(AsyncSearchView):
+    sync_view = SearchSolutionsView_70
+
+
+class AsyncSearchPrescriptionsView(AsyncSearchView):
+    sync_view = SearchPrescriptionsView
+
+
+class AsyncSearchPrescriptionsView_70(AsyncSearchView):
+    sync_view = SearchPrescriptionsView_70
+
+
+class AsyncSearchAllView(AsyncSearchView):
+    sync_view = SearchAllView
+
+
+class AsyncSearchAllView_70(AsyncSearchView):
+    sync_view = SearchAllView_70
@@ -0,0 +1,69 @@
+import contextlib
+import time
+
+from elasticsearch.helpers import parallel_bulk
+
+
+def indexed_columns(document):
+    # Every field of the document maps straight onto a Complaint column of the same name.
+    return [field._path[0] for field in document._fields.values()]
+
+
+def iter_actions(document, index_name, queryset, fetch_size=2000):
+    # values_list().iterator() streams over a Postgres server-side cursor and skips model instantiation,
+    # so json_data and other unindexed columns are never read.
+    columns = indexed_columns(document)
+    pk_position = columns.index(queryset.model._meta.pk.attname)
+    for row in queryset.values_list(*columns).iterator(chunk_size=fetch_size):
+        yield {
+            '_op_type': 'index',
+            '_index': index_name,
+            '_id': row[pk_position],
+            '_source': dict(zip(columns, row)),
+        }
+
+
+@contextlib.contextmanager
+def bulk_load_settings(client, index_name):
+    # No refreshes and no replicas while loading; the previous values come back even if the load fails.
+    current = client.indices.get_settings(index=index_name, name=['index.refresh_interval',
+                                                                  'index.number_of_replicas'],
+                                          include_defaults=True)
+    restore = {}
+    for settings in current.values():
+        for key in ('refresh_interval', 'number_of_replicas'):
+            restore[key] = settings.get('settings', {}).get('index', {}).get(
+                key, settings.get('defaults', {}).get('index', {}).get(key))
+    client.indices.put_settings(index=index_name, body={'index': {'refresh_interval': '-1',
+                                                                  'number_of_replicas': 0}})
+    try:
+        yield
+    finally:
+        client.indices.put_settings(index=index_name, body={'index': restore})
+        client.indices.refresh(index=index_name)
+
+
+def bulk_index(client, actions, chunk_size=500, thread_count=4, max_chunk_bytes=100 * 1024 ** 2,
+               on_progress=None, progress_every=10):
+    started = time.monotonic()
+    last_progress = started
+    indexed = 0
+    errors = []
+    for ok, item in parallel_bulk(client, actions, thread_count=thread_count, chunk_size=chunk_size,
+                                  max_chunk_bytes=max_chunk_bytes, raise_on_error=False):
+        if ok:
+            indexed += 1
+        else:
+            errors.append(item)
+        if on_progress is not None and time.monotonic() - last_progress >= progress_every:
+            last_progress = time.monotonic()
+            on_progress({'indexed': indexed, 'failed': len(errors),
+                         'docs_per_s': round(indexed / (last_progress - started), 1)})
+    elapsed = time.monotonic() - started
+    return {
+        'indexed': indexed,
+        'failed': len(errors),
+        'elapsed_s': round(elapsed, 1),
+        'docs_per_s': round(indexed / elapsed, 1) if elapsed else None,
+        'errors': errors[:20],
+    }
@@ -0,0 +1,193 @@
+import datetime
+import json
+from collections import namedtuple
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+
+NO_DATA = 'Нет данных'
+
+FieldSpec = namedtuple('FieldSpec', ['name', 'paths', 'default', 'transform'], defaults=[NO_DATA, None])
+
+
+def parse_date(value):
+    if value:
+        return datetime.datetime.strptime(value, '%d.%m.%Y').date()
+    return None
+
+
+def upper(value):
+    return value.upper() if isinstance(value, str) else value
+
+
+def or_default(default):
+    return lambda value: value or default
+
+
+# Paths are relative to the complaint card, the single top-level object keyed by the complaint number.
+# Alternatives are tried in order; the first one present in the document wins.
+FIELD_SPEC = [
+    FieldSpec('complaint_id', [('cardHeaderBlock_dict', 'number')], None),
+    FieldSpec('status', [('cardHeaderBlock_dict', 'status')], 'Статус не определён'),
+    FieldSpec('date', [('cardHeaderBlock_dict', 'dates_dict', 'Поступление жалобы'),
+                       ('cardHeaderBlock_dict', 'dates_dict', 'Размещено')], None, parse_date),
+    FieldSpec('region', [('cardHeaderBlock_dict', 'dop_data', 'Орган контроля')], NO_DATA.upper(), upper),
+    FieldSpec('customer_name', [('section_card_common_dict', 'Информация о субъекте контроля',
+                                 'Наименование организации')]),
+    FieldSpec('customer_inn', [('section_card_common_dict', 'Информация о субъекте контроля', 'ИНН')]),
+    FieldSpec('complainant_name', [('cardHeaderBlock_dict', 'dop_data', 'Лицо, подавшее жалобу')]),
+    FieldSpec('complainant_inn', [('section_card_common_dict',
+                                   'Данные участника контрактной системы в сфере закупок, подавшего жалобу', 'ИНН')]),
+    FieldSpec('justification', [('cardHeaderBlock_dict', 'obosnovanie')], 'Статус еще не определён',
+              or_default('Статус еще не определён')),
+    FieldSpec('numb_purchase', [('section_card_common_dict', 'Сведения о закупке', 'Номер извещения')]),
+    FieldSpec('prescription', [('cardHeaderBlock_dict', 'predpisnaie')], NO_DATA, or_default(NO_DATA)),
+]
+
+DEFAULT_PROJECTION = [('cardHeaderBlock_dict',), ('section_card_common_dict',)]
+
+
+def parse_projection(value):
+    # "cardHeaderBlock_dict,section_card_common_dict/Сведения о закупке"; "*" keeps the whole card.
+    if value.strip() == '*':
+        return None
+    return [tuple(part for part in path.strip().split('/') if part) for path in value.split(',') if path.strip()]
+
+
+class FieldExtractor:
+    def __init__(self, spec=FIELD_SPEC, projection=DEFAULT_PROJECTION, streaming_threshold=None):
+        self.spec = spec
+        self.projection = projection
+        self.streaming_threshold = streaming_threshold
+        # Every wanted path is compiled into one trie, so the card is walked once for all fields.
+        self.trie = {}
+        for field_index, field in enumerate(spec):
+            for priority, path in enumerate(field.paths):
+                node = self.trie
+                for key in path:
+                    node = node.setdefault(key, {})
+                node.setdefault(None, []).append((field_index, priority))
+        self.projection_paths = set(projection) if projection is not None else None
+
+    def extract(self, json_path, card_key):
+        if self.streaming_threshold is not None and ijson is not None:
+            with open(json_path, 'rb') as f:
+                f.seek(0, 2)
+                if f.tell() >= self.streaming_threshold:
+                    f.seek(0)
+                    return self.extract_stream(f, card_key)
+        with open(json_path, 'r') as f:
+            return self.extract_data(json.load(f), card_key)
+
+    def extract_data(self, json_data, card_key):
+        card = json_data.get(card_key) if isinstance(json_data, dict) else None
+        found = {}
+        if isinstance(card, dict):
+            self._walk(card, self.trie, found)
+        return self._fields(found), self._project(card_key, card)
+
+    def _walk(self, node, trie, found):
+        for key, child in trie.items():
+            if key is None:
+                for field_index, priority in child:
+                    found.setdefault(field_index, {})[priority] = node
+            elif isinstance(node, dict) and key in node:
+                self._walk(node[key], child, found)
+
+    def _fields(self, found):
+        fields = {}
+        for field_index, field in enumerate(self.spec):
+            candidates = found.get(field_index)
+            if not candidates:
+                fields[field.name] = field.default
+                continue
+            value = candidates[min(candidates)]
+            fields[field.name] = field.transform(value) if field.transform is not None else value
+        return fields
+
+    def _project(self, card_key, card):
+        if card is None:
+            return {}
+        if self.projection_paths is None:
+            return {card_key: card}
+        projected = {}
+        for path in self.projection:
+            node = card
+            for key in path:
+                if not isinstance(node, dict) or key not in node:
+                    break
+                node = node[key]
+            else:
+                target = projected
+                for key in path[:-1]:
+                    target = target.setdefault(key, {})
+                target[path[-1]] = node
+        return {card_key: projected}
+
+    def extract_stream(self, f, card_key):
+        found = {}
+        projected = {}
+        path = []  # keys of the enclosing objects; the last one is the key being read
+        array_depth = 0
+        builder = None
+        builder_depth = 0
+        builder_path = None
+        card_seen = False
+        for _, event, value in ijson.parse(f, use_float=True):
+            if (builder is None and array_depth == 0 and event not in ('map_key', 'end_map', 'end_array')
+                    and self._projected(path, card_key)):
+                builder = ijson.ObjectBuilder()
+                builder_depth = 0
+                builder_path = path[1:]
+            if builder is not None:
+                builder.event(event, value)
+                if event in ('start_map', 'start_array'):
+                    builder_depth += 1
+                elif event in ('end_map', 'end_array'):
+                    builder_depth -= 1
+                if builder_depth == 0:
+                    self._store(projected, builder_path, builder.value)
+                    builder = None
+            if event == 'map_key':
+                path[-1] = value
+            elif event == 'start_map':
+                path.append(None)
+            elif event == 'end_map':
+                path.pop()
+            elif event == 'start_array':
+                array_depth += 1
+            elif event == 'end_array':
+                array_depth -= 1
+            if path and path[0] == card_key:
+                card_seen = True
+            if event in ('map_key', 'start_map', 'end_map', 'start_array', 'end_array'):
+                continue
+            if array_depth == 0 and path and path[0] == card_key:
+                node = self.trie
+                for key in path[1:]:
+                    node = node.get(key)
+                    if node is None:
+                        break
+                else:
+                    for field_index, priority in node.get(None, []):
+                        found.setdefault(field_index, {})[priority] = value
+        return self._fields(found), {card_key: projected} if card_seen else {}
+
+    def _projected(self, path, card_key):
+        if not path or path[0] != card_key:
+            return False
+        if self.projection_paths is None:
+            return len(path) == 1
+        return tuple(path[1:]) in self.projection_paths
+
+    @staticmethod
+    def _store(projected, path, value):
+        if not path:
+            projected.update(value)
+            return
+        for key in path[:-1]:
+            projected = projected.setdefault(key, {})
+        projected[path[-1]] = value
@@ -0,0 +1,143 @@
+import json
+
+from psycopg2.extras import execute_values
+
+
+COMPLAINT_COLUMNS = [
+    'complaint_id', 'status', 'date', 'region', 'customer_name', 'customer_inn', 'complainant_name',
+    'complainant_inn', 'justification', 'numb_purchase', 'prescription', 'list_docs', 'json_data',
+]
+DOCUMENT_COLUMNS = ['complaint_id', 'kind', 'path', 'size', 'sha256', 'page_count', 'text', 'page_offsets']
+DOCS_FIELDS = {
+    'docs_complaints': 'complaint',
+    'docs_solutions': 'solution',
+    'docs_prescriptions': 'prescription',
+}
+
+UPSERT_SQL = (
+    f"INSERT INTO api_complaint ({', '.join(COMPLAINT_COLUMNS)}) VALUES %s "
+    "ON CONFLICT (complaint_id) DO UPDATE SET "
+    + ', '.join(f'{column} = EXCLUDED.{column}' for column in COMPLAINT_COLUMNS[1:])
+)
+
+DELETE_REMOVED_DOCUMENTS_SQL = (
+    "DELETE FROM api_complaintdocument d USING (VALUES %s) AS current (complaint_id, paths) "
+    "WHERE d.complaint_id = current.complaint_id AND NOT d.path = ANY(current.paths::text[]) "
+    "RETURNING d.complaint_id"
+)
+
+UPSERT_DOCUMENTS_SQL = (
+    f"INSERT INTO api_complaintdocument ({', '.join(DOCUMENT_COLUMNS)}) VALUES %s "
+    "ON CONFLICT (complaint_id, path) DO UPDATE SET "
+    + ', '.join(f'{column} = EXCLUDED.{column}' for column in DOCUMENT_COLUMNS[1:] if column != 'path')
+)
+
+# The per-kind texts on api_complaint are rebuilt from api_complaintdocument inside Postgres, so unchanged
+# attachments are never sent over the wire again; and only for complaints whose attachments changed.
+AGGREGATE_DOCS_SQL = (
+    "UPDATE api_complaint c SET "
+    + ', '.join(f'{field} = agg.{field}' for field in DOCS_FIELDS)
+    + " FROM (SELECT c2.complaint_id, "
+    + ', '.join(f"string_agg(d.text || ' ', '' ORDER BY d.path) "
+                f"FILTER (WHERE d.kind = '{kind}' AND d.text ~ '[^[:space:]]{{4}}') AS {field}"
+                for field, kind in DOCS_FIELDS.items())
+    + " FROM api_complaint c2 LEFT JOIN api_complaintdocument d ON d.complaint_id = c2.complaint_id "
+    "WHERE c2.complaint_id = ANY(%s) GROUP BY c2.complaint_id) agg "
+    "WHERE c.complaint_id = agg.complaint_id"
+)
+
+# Queued in the same transaction as the rows; `manage.py drain_index_outbox` updates the search index.
+OUTBOX_SQL = (
+    "INSERT INTO api_indexoutbox (complaint_id, action, created, attempts, available_at) "
+    "SELECT complaint_id, %s, now(), 0, now() FROM unnest(%s::text[]) AS complaint_id"
+)
+
+
+class ComplaintWriter:
+    def __init__(self, connect, batch_size=500, on_flush=None):
+        self.db, self.cur = connect()
+        self.batch_size = batch_size
+        self.on_flush = on_flush
+        self.rows = {}
+        self.written = 0
+        self.documents_written = 0
+        self.errors = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                self.flush()
+        finally:
+            self.close()
+
+    def add(self, row):
+        # Keyed by complaint_id: ON CONFLICT cannot touch the same row twice in one statement.
+        self.rows[row['complaint_id']] = row
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        rows = list(self.rows.values())
+        self.rows = {}
+        try:
+            self._execute(rows)
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            self._flush_one_by_one(rows)
+            return
+        self._flushed(rows)
+
+    def _flush_one_by_one(self, rows):
+        for row in rows:
+            try:
+                self._execute([row])
+                self.db.commit()
+            except Exception as e:
+                self.db.rollback()
+                self.errors.append((row.get('folder_name', row['complaint_id']), f'{type(e).__name__}: {e}'))
+                continue
+            self._flushed([row])
+
+    def _flushed(self, rows):
+        self.written += len(rows)
+        self.documents_written += sum(len(row['documents']) for row in rows)
+        if self.on_flush is not None:
+            self.on_flush(rows)
+
+    def _execute(self, rows):
+        values = [tuple(row[column] for column in COMPLAINT_COLUMNS) for row in rows]
+        execute_values(self.cur, UPSERT_SQL, values, page_size=len(values))
+        removed = execute_values(self.cur, DELETE_REMOVED_DOCUMENTS_SQL,
+                                 [(row['complaint_id'], row['document_paths']) for row in rows], page_size=len(rows),
+                                 fetch=True)
+        documents = [
+            (row['complaint_id'], document['kind'], document['path'], document['size'], document['sha256'],
+             document['page_count'], document['text'], json.dumps(document['page_offsets']))
+            for row in rows for document in row['documents']
+        ]
+        if documents:
+            execute_values(self.cur, UPSERT_DOCUMENTS_SQL, documents, page_size=len(documents))
+        changed = {complaint_id for complaint_id, in removed}
+        changed.update(row['complaint_id'] for row in rows if row['documents'])
+        if changed:
+            self.cur.execute(AGGREGATE_DOCS_SQL, (list(changed),))
+        self.cur.execute(OUTBOX_SQL, ('index', [row['complaint_id'] for row in rows]))
+
+    def delete(self, complaint_ids):
+        complaint_ids = list(complaint_ids)
+        self.cur.execute("DELETE FROM api_complaintdocument WHERE complaint_id = ANY(%s)", (complaint_ids,))
+        self.cur.execute("DELETE FROM api_complaint WHERE complaint_id = ANY(%s)", (complaint_ids,))
+        deleted = self.cur.rowcount
+        self.cur.execute(OUTBOX_SQL, ('delete', complaint_ids))
+        self.db.commit()
+        return deleted
+
+    def close(self):
+        self.cur.close()
+        self.db.close()
@@ -0,0 +1,249 @@
+import os
+import queue
+import shutil
+import subprocess
+import threading
+import time
+
+try:
+    import uno
+    from com.sun.star.beans import PropertyValue
+except ImportError:
+    uno = None
+    PropertyValue = None
+
+
+class ConversionError(Exception):
+    pass
+
+
+class ConversionTimeout(ConversionError):
+    pass
+
+
+def profile_url(index):
+    # LibreOffice refuses to run two instances on one profile, so every worker gets its own.
+    return f'file:///tmp/soffice_worker_{index}'
+
+
+class SofficeConverter:
+    # One soffice process per file, but on a per-worker profile that stays initialised between files.
+    def __init__(self, index, binary='soffice'):
+        self.index = index
+        self.binary = binary
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def convert(self, src, outdir, timeout):
+        process = subprocess.Popen([self.binary, '--headless', '--norestore', f'-env:UserInstallation={profile_url(self.index)}',
+                                    '--convert-to', 'docx', '--outdir', outdir, src],
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, start_new_session=True)
+        try:
+            _, stderr = process.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            os.killpg(process.pid, 9)
+            process.wait()
+            raise ConversionTimeout(f'Timeout expired for file: {src}')
+        dst = os.path.join(outdir, os.path.splitext(os.path.basename(src))[0] + '.docx')
+        if process.returncode != 0 or not os.path.exists(dst):
+            raise ConversionError(stderr.decode('utf-8', 'ignore').strip() or f'soffice exited with {process.returncode}')
+        return dst
+
+
+class UnoConverter:
+    # A warm headless LibreOffice listening on a named pipe; files are converted over UNO without a restart.
+    def __init__(self, index, binary='soffice', connect_timeout=60):
+        self.index = index
+        self.binary = binary
+        self.connect_timeout = connect_timeout
+        self.pipe_name = f'soffice_worker_{os.getpid()}_{index}'
+        self.process = None
+        self.desktop = None
+
+    def start(self):
+        self.process = subprocess.Popen([self.binary, '--headless', '--invisible', '--norestore', '--nologo',
+                                         f'-env:UserInstallation={profile_url(self.index)}',
+                                         f'--accept=pipe,name={self.pipe_name};urp;StarOffice.ComponentContext'],
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+        local_context = uno.getComponentContext()
+        resolver = local_context.ServiceManager.createInstanceWithContext(
+            'com.sun.star.bridge.UnoUrlResolver', local_context)
+        deadline = time.monotonic() + self.connect_timeout
+        while True:
+            try:
+                context = resolver.resolve(
+                    f'uno:pipe,name={self.pipe_name};urp;StarOffice.ComponentContext')
+                break
+            except Exception:
+                if time.monotonic() > deadline or self.process.poll() is not None:
+                    self.stop()
+                    raise ConversionError('LibreOffice worker did not start')
+                time.sleep(0.5)
+        self.desktop = context.ServiceManager.createInstanceWithContext('com.sun.star.frame.Desktop', context)
+
+    def stop(self):
+        self.desktop = None
+        if self.process is not None:
+            try:
+                os.killpg(self.process.pid, 9)
+            except ProcessLookupError:
+                pass
+            self.process.wait()
+            self.process = None
+
+    @staticmethod
+    def _properties(**values):
+        properties = []
+        for name, value in values.items():
+            prop = PropertyValue()
+            prop.Name = name
+            prop.Value = value
+            properties.append(prop)
+        return tuple(properties)
+
+    def convert(self, src, outdir, timeout):
+        dst = os.path.join(outdir, os.path.splitext(os.path.basename(src))[0] + '.docx')
+        # A hung UNO call only returns once the office process is gone, so the watchdog kills it.
+        watchdog = threading.Timer(timeout, self.stop)
+        watchdog.start()
+        try:
+            document = self.desktop.loadComponentFromURL(uno.systemPathToFileUrl(os.path.abspath(src)), '_blank', 0,
+                                                         self._properties(Hidden=True, ReadOnly=True))
+            if document is None:
+                raise ConversionError(f'LibreOffice could not open {src}')
+            try:
+                document.storeToURL(uno.systemPathToFileUrl(os.path.abspath(dst)),
+                                    self._properties(FilterName='MS Word 2007 XML'))
+            finally:
+                document.close(True)
+        except ConversionError:
+            raise
+        except Exception as e:
+            if not watchdog.is_alive():
+                raise ConversionTimeout(f'Timeout expired for file: {src}')
+            raise ConversionError(f'{type(e).__name__}: {e}')
+        finally:
+            watchdog.cancel()
+        return dst
+
+
+class FakeConverter:
+    # For tests: "converts" by copying, and can be told to hang or fail on chosen files.
+    def __init__(self, index, delay=0, fail=(), hang=()):
+        self.index = index
+        self.delay = delay
+        self.fail = set(fail)
+        self.hang = set(hang)
+        self.started = 0
+        self.converted = []
+
+    def start(self):
+        self.started += 1
+
+    def stop(self):
+        pass
+
+    def convert(self, src, outdir, timeout):
+        if src in self.hang:
+            time.sleep(timeout)
+            raise ConversionTimeout(f'Timeout expired for file: {src}')
+        if src in self.fail:
+            raise ConversionError(f'Cannot convert {src}')
+        time.sleep(self.delay)
+        dst = os.path.join(outdir, os.path.splitext(os.path.basename(src))[0] + '.docx')
+        shutil.copyfile(src, dst)
+        self.converted.append(src)
+        return dst
+
+
+def make_converter(kind='auto', binary='soffice'):
+    if kind == 'uno' or (kind == 'auto' and uno is not None):
+        return lambda index: UnoConverter(index, binary)
+    return lambda index: SofficeConverter(index, binary)
+
+
+class ConversionPool:
+    # N workers, each owning one converter; a failed or timed out worker's converter is restarted.
+    def __init__(self, converter_factory, workers=4, timeout=60, max_files_per_worker=500):
+        self.converter_factory = converter_factory
+        self.workers = workers
+        self.timeout = timeout
+        self.max_files_per_worker = max_files_per_worker
+        self.tasks = queue.Queue(maxsize=workers * 4)
+        self.results = queue.Queue()
+        self.threads = []
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def start(self):
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._run, args=(index,), daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def _run(self, index):
+        converter = self.converter_factory(index)
+        running = False
+        converted = 0
+        while True:
+            src = self.tasks.get()
+            if src is None:
+                break
+            started = time.monotonic()
+            try:
+                if not running or converted >= self.max_files_per_worker:
+                    converter.stop()
+                    converter.start()
+                    running = True
+                    converted = 0
+                dst = converter.convert(src, os.path.dirname(src), self.timeout)
+                converted += 1
+                self.results.put((src, dst, None, time.monotonic() - started))
+            except Exception as e:
+                converter.stop()
+                running = False
+                self.results.put((src, None, e, time.monotonic() - started))
+        converter.stop()
+
+    def submit(self, src):
+        self.tasks.put(src)
+
+    def get(self, timeout=None):
+        # One finished (src, dst, error, elapsed), or None if nothing finished within `timeout`.
+        try:
+            return self.results.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def map(self, files):
+        # Yields (src, dst, error, elapsed) in completion order while keeping the task queue bounded.
+        pending = 0
+        for src in files:
+            while True:
+                try:
+                    self.tasks.put(src, timeout=0.1)
+                    break
+                except queue.Full:
+                    while not self.results.empty():
+                        pending -= 1
+                        yield self.results.get()
+            pending += 1
+        while pending:
+            pending -= 1
+            yield self.results.get()
+
+    def close(self):
+        for _ in self.threads:
+            self.tasks.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
@@ -0,0 +1,64 @@
+import bisect
+import re
+import urllib.parse
+
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.db.models.functions import StrIndex
+
+from api.models import ComplaintDocument
+
+
+SITE_FILE_URL = "http://svoyaproverka.ru/file"
+DOCS_KINDS = {
+    'docs_complaints': 'complaint',
+    'docs_solutions': 'solution',
+    'docs_prescriptions': 'prescription',
+}
+HIGHLIGHT_TAGS = re.compile(r'</?b>')
+HIGHLIGHTED_TERM = re.compile(r'<b>(.*?)</b>')
+
+
+def needle_position(needles, index):
+    # Where needles[(complaint_id, kind)][index] starts in the text of each attachment of that complaint and kind.
+    return Case(*[When(complaint_id=complaint_id, kind=kind, then=StrIndex('text', Value(needle[index])))
+                  for (complaint_id, kind), needle in needles.items() if needle[index]],
+                default=Value(0), output_field=IntegerField())
+
+
+def locate_highlights(fragments):
+    # Highlights come from the concatenated docs_* text; find the attachment and page they were taken from.
+    # `fragments` maps (complaint_id, docs_* field) to a highlight; the result maps the ones found to their
+    # source. One query covers a whole page of hits.
+    needles = {}
+    for (complaint_id, field), fragment in fragments.items():
+        kind = DOCS_KINDS.get(field)
+        if kind is None or not fragment:
+            continue
+        # The fragment may straddle two attachments; the first highlighted term is the fallback.
+        term = HIGHLIGHTED_TERM.search(fragment)
+        needles[(complaint_id, kind)] = (field, HIGHLIGHT_TAGS.sub('', fragment).strip(), term and term.group(1))
+    if not needles:
+        return {}
+    documents = (ComplaintDocument.objects
+                 .filter(complaint_id__in={complaint_id for complaint_id, kind in needles},
+                         kind__in={kind for complaint_id, kind in needles})
+                 .annotate(position=needle_position(needles, 1), term_position=needle_position(needles, 2))
+                 .filter(Q(position__gt=0) | Q(term_position__gt=0))
+                 .order_by('path')
+                 .values('complaint_id', 'kind', 'path', 'page_offsets', 'position', 'term_position'))
+    by_fragment, by_term = {}, {}
+    for document in documents:
+        key = (document['complaint_id'], document['kind'])
+        # The first attachment by path holding the whole fragment, else the first holding its term.
+        if document['position'] > 0:
+            by_fragment.setdefault(key, (document, document['position']))
+        else:
+            by_term.setdefault(key, (document, document['term_position']))
+    sources = {}
+    for (complaint_id, kind), (document, position) in {**by_term, **by_fragment}.items():
+        page_offsets = document['page_offsets'] or [0]
+        sources[(complaint_id, needles[(complaint_id, kind)][0])] = {
+            'file': f"{SITE_FILE_URL}{urllib.parse.quote(document['path'])}",
+            'page': bisect.bisect_right(page_offsets, position - 1),
+        }
+    return sources
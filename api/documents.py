@@ -1,106 +1,43 @@
+from django.conf import settings
 from django_elasticsearch_dsl import Document, fields
 from django_elasticsearch_dsl.registries import registry
+from elasticsearch_dsl import MetaField
 from api.models import Complaint
 
+# With ES_DOCS_OUTSIDE_SOURCE the texts are left out of _source and stored as separate fields,
+# which is all the highlighters need; nothing reads them back from the index.
+DOCS_OUTSIDE_SOURCE = getattr(settings, 'ES_DOCS_OUTSIDE_SOURCE', False)
 
-@registry.register_document
-class ComplaintsDocument(Document):
-    complaint_id = fields.TextField(attr='complaint_id')
-    status = fields.TextField(attr='status')
-    date = fields.DateField(attr='date')
-    region = fields.TextField(attr='region')
-    customer_name = fields.TextField(attr='customer_name')
-    customer_inn = fields.TextField(attr='customer_inn')
-    complainant_name = fields.TextField(attr='complainant_name')
-    complainant_inn = fields.TextField(attr='complainant_inn')
-    justification = fields.TextField(attr='justification')
-    numb_purchase = fields.TextField(attr='numb_purchase')
-    prescription = fields.TextField(attr='prescription')
-    list_docs = fields.TextField(attr='list_docs')
-    docs_complaints = fields.TextField(attr='docs_complaints')
 
-    class Index:
-        name = 'complaints'
-        settings = {
-            'number_of_shards': 1,
-            'number_of_replicas': 0,
-        }
-
-    class Django:
-        model = Complaint
-
-
-@registry.register_document
-class SolutionsDocument(Document):
-    complaint_id = fields.TextField(attr='complaint_id')
-    status = fields.TextField(attr='status')
-    date = fields.DateField(attr='date')
-    region = fields.TextField(attr='region')
-    customer_name = fields.TextField(attr='customer_name')
-    customer_inn = fields.TextField(attr='customer_inn')
-    complainant_name = fields.TextField(attr='complainant_name')
-    complainant_inn = fields.TextField(attr='complainant_inn')
-    justification = fields.TextField(attr='justification')
-    numb_purchase = fields.TextField(attr='numb_purchase')
-    prescription = fields.TextField(attr='prescription')
-    list_docs = fields.TextField(attr='list_docs')
-    docs_solutions = fields.TextField(attr='docs_solutions')
-
-    class Index:
-        name = 'solutions'
-        settings = {
-            'number_of_shards': 1,
-            'number_of_replicas': 0,
-        }
-
-    class Django:
-        model = Complaint
-
-
-@registry.register_document
-class PrescriptionsDocument(Document):
-    complaint_id = fields.TextField(attr='complaint_id')
-    status = fields.TextField(attr='status')
-    date = fields.DateField(attr='date')
-    region = fields.TextField(attr='region')
-    customer_name = fields.TextField(attr='customer_name')
-    customer_inn = fields.TextField(attr='customer_inn')
-    complainant_name = fields.TextField(attr='complainant_name')
-    complainant_inn = fields.TextField(attr='complainant_inn')
-    justification = fields.TextField(attr='justification')
-    numb_purchase = fields.TextField(attr='numb_purchase')
-    prescription = fields.TextField(attr='prescription')
-    list_docs = fields.TextField(attr='list_docs')
-    docs_prescriptions = fields.TextField(attr='docs_prescriptions')
-
-    class Index:
-        name = 'prescriptions'
-        settings = {
-            'number_of_shards': 1,
-            'number_of_replicas': 0,
-        }
-
-    class Django:
-        model = Complaint
+def docs_text_field(attr):
+    # Offsets are stored at index time, so highlighting never re-analyzes the (multi-megabyte) text and
+    # finds matches anywhere in it: in the postings for the unified highlighter, in term vectors for fvh.
+    options = {'store': True} if DOCS_OUTSIDE_SOURCE else {}
+    if getattr(settings, 'ES_DOCS_OFFSETS', 'postings') == 'term_vectors':
+        return fields.TextField(attr=attr, term_vector='with_positions_offsets', **options)
+    return fields.TextField(attr=attr, index_options='offsets', **options)
 
 
+# One index for every search: complaint metadata once, plus one text field per kind of attachment.
+# The exact/inexact views for a single kind query only that kind's field. The .raw keyword subfields
+# serve the ComplaintFilter-style filters as cacheable non-scoring clauses.
 @registry.register_document
 class AllDocument(Document):
-    complaint_id = fields.TextField(attr='complaint_id')
-    status = fields.TextField(attr='status')
+    complaint_id = fields.TextField(attr='complaint_id', fields={'raw': fields.KeywordField()})
+    status = fields.TextField(attr='status', fields={'raw': fields.KeywordField()})
     date = fields.DateField(attr='date')
-    region = fields.TextField(attr='region')
-    customer_name = fields.TextField(attr='customer_name')
-    customer_inn = fields.TextField(attr='customer_inn')
-    complainant_name = fields.TextField(attr='complainant_name')
-    complainant_inn = fields.TextField(attr='complainant_inn')
-    justification = fields.TextField(attr='justification')
-    numb_purchase = fields.TextField(attr='numb_purchase')
+    region = fields.TextField(attr='region', fields={'raw': fields.KeywordField()})
+    customer_name = fields.TextField(attr='customer_name', fields={'raw': fields.KeywordField()})
+    customer_inn = fields.TextField(attr='customer_inn', fields={'raw': fields.KeywordField()})
+    complainant_name = fields.TextField(attr='complainant_name', fields={'raw': fields.KeywordField()})
+    complainant_inn = fields.TextField(attr='complainant_inn', fields={'raw': fields.KeywordField()})
+    justification = fields.TextField(attr='justification', fields={'raw': fields.KeywordField()})
+    numb_purchase = fields.TextField(attr='numb_purchase', fields={'raw': fields.KeywordField()})
     prescription = fields.TextField(attr='prescription')
     list_docs = fields.TextField(attr='list_docs')
-    docs_complaints = fields.TextField(attr='docs_complaints')
-    docs_prescriptions = fields.TextField(attr='docs_prescriptions')
-    docs_solutions = fields.TextField(attr='docs_solutions')
+    docs_complaints = docs_text_field('docs_complaints')
+    docs_prescriptions = docs_text_field('docs_prescriptions')
+    docs_solutions = docs_text_field('docs_solutions')
 
     class Index:
         name = 'alldocuments'
@@ -111,3 +48,7 @@ class AllDocument(Document):
 
     class Django:
         model = Complaint
+
+    class Meta:
+        if DOCS_OUTSIDE_SOURCE:
+            source = MetaField(excludes=['docs_complaints', 'docs_prescriptions', 'docs_solutions'])
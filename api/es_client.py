@@ -0,0 +1,134 @@
+import asyncio
+import threading
+import time
+import weakref
+
+from django.conf import settings
+from elasticsearch.exceptions import ConnectionError, TransportError
+from elasticsearch_dsl.connections import connections
+
+try:
+    from elasticsearch import AsyncElasticsearch
+except ImportError:
+    # Only exported by elasticsearch-py when aiohttp is installed.
+    AsyncElasticsearch = None
+
+# Seconds per kind of operation; the client-wide timeout in ELASTICSEARCH_DSL stays the ceiling for bulk loads.
+DEFAULT_TIMEOUTS = {
+    'search': 30,
+    'msearch': 60,
+    'count': 10,
+    'pit': 10,
+    'health': 2,
+}
+# Overload answers worth another try after a pause; anything else, a timeout above all, is raised at once.
+OVERLOADED_STATUSES = (429, 503)
+DEFAULT_RETRY = {'attempts': 3, 'backoff': 0.2, 'max_backoff': 1}
+_health = {'checked': 0, 'healthy': True}
+_health_lock = threading.Lock()
+# aiohttp sessions belong to the event loop that created them: one async client per loop.
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_client(alias='default'):
+    # The one client of the process, configured from ELASTICSEARCH_DSL by django-elasticsearch-dsl.
+    # Its urllib3 pools keep connections alive, so requests after the first skip TCP and TLS setup.
+    return connections.get_connection(alias)
+
+
+def timeout(operation):
+    return getattr(settings, 'ELASTICSEARCH_TIMEOUTS', {}).get(operation, DEFAULT_TIMEOUTS[operation])
+
+
+def retry_delays():
+    # Pauses before each further attempt: backoff, doubled every time up to max_backoff.
+    retry = dict(DEFAULT_RETRY, **getattr(settings, 'ELASTICSEARCH_RETRY', {}))
+    return [min(retry['backoff'] * 2 ** attempt, retry['max_backoff']) for attempt in range(retry['attempts'] - 1)]
+
+
+def overloaded(e):
+    return isinstance(e, TransportError) and e.status_code in OVERLOADED_STATUSES
+
+
+def execute(search, operation='search', **options):
+    # Works for a MultiSearch as well; `options` go to its execute() (raise_on_error).
+    # The transport moves on to another node on 502/504 and connection errors without waiting; a 429 or 503
+    # says the cluster is overloaded, so it is retried here after a bounded backoff (ELASTICSEARCH_RETRY).
+    # A search that timed out is never run again, it would only add load to a cluster that is already slow.
+    search = search.params(request_timeout=timeout(operation))
+    for delay in retry_delays():
+        try:
+            return search.execute(**options)
+        except TransportError as e:
+            if not overloaded(e):
+                raise
+        time.sleep(delay)
+    return search.execute(**options)
+
+
+def healthy(ttl=5):
+    # Cached for `ttl` seconds so a down cluster costs one quick probe, not a timeout per request.
+    # A red cluster counts as down: with a primary shard missing, searches would silently return partial
+    # results, so the views answer 503 (or serve what is cached) until it is yellow again.
+    now = time.monotonic()
+    if now - _health['checked'] < ttl:
+        return _health['healthy']
+    with _health_lock:
+        if now - _health['checked'] >= ttl:
+            try:
+                status = get_client().cluster.health(request_timeout=timeout('health'))['status']
+                _health['healthy'] = status in ('green', 'yellow')
+            except ConnectionError:
+                # Unreachable or timed out (ConnectionTimeout is a ConnectionError). Any other error, such as a
+                # 403 for a user without cluster:monitor, says nothing about searches: let them through.
+                _health['healthy'] = False
+            except Exception:
+                _health['healthy'] = True
+            _health['checked'] = time.monotonic()
+    return _health['healthy']
+
+
+def get_async_client(alias='default'):
+    # Same hosts, pool size and retry policy as the sync client, over aiohttp: a request waiting on
+    # Elasticsearch holds a pooled connection but no thread.
+    if AsyncElasticsearch is None:
+        raise ImportError('The async search views need aiohttp installed next to elasticsearch')
+    loop = asyncio.get_running_loop()
+    clients = _async_clients.setdefault(loop, {})
+    if alias not in clients:
+        options = dict(settings.ELASTICSEARCH_DSL[alias])
+        options['maxsize'] = getattr(settings, 'ELASTICSEARCH_ASYNC_MAXSIZE', options.get('maxsize', 10))
+        clients[alias] = AsyncElasticsearch(**options)
+    return clients[alias]
+
+
+async def async_execute(search, operation='search'):
+    # What Search.execute() does, awaited; elasticsearch-dsl 7 has no async Search of its own.
+    # Same overload retries as execute().
+    client = get_async_client()
+    for delay in retry_delays() + [None]:
+        try:
+            raw = await client.search(index=search._index, body=search.to_dict(),
+                                      request_timeout=timeout(operation), **search._params)
+            return search._response_class(search, raw)
+        except TransportError as e:
+            if delay is None or not overloaded(e):
+                raise
+        await asyncio.sleep(delay)
+
+
+async def async_healthy(ttl=5):
+    # As healthy(): red or unreachable is down.
+    now = time.monotonic()
+    if now - _health['checked'] < ttl:
+        return _health['healthy']
+    _health['checked'] = now
+    try:
+        status = (await get_async_client().cluster.health(request_timeout=timeout('health')))['status']
+        _health['healthy'] = status in ('green', 'yellow')
+    except ConnectionError:
+        _health['healthy'] = False
+    except Exception:
+        _health['healthy'] = True
+    _health['checked'] = time.monotonic()
+    return _health['healthy']
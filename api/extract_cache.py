@@ -0,0 +1,97 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+from api.search_text import EXTRACTOR_VERSION
+
+
+HASH_CHUNK_SIZE = 1024 * 1024
+EVICTION_CHECK_EVERY = 100
+
+
+def file_sha256(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ExtractCache:
+    def __init__(self, path, max_bytes, version=EXTRACTOR_VERSION):
+        self.max_bytes = max_bytes
+        self.version = version
+        self.inserts = 0
+        self.hits = 0
+        self.misses = 0
+        self.db = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS files '
+                        '(path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, hash TEXT)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS texts '
+                        '(hash TEXT, version INTEGER, text TEXT, size INTEGER, last_used REAL, '
+                        'PRIMARY KEY (hash, version))')
+        self.db.execute('CREATE INDEX IF NOT EXISTS texts_last_used ON texts (last_used)')
+        columns = [column[1] for column in self.db.execute('PRAGMA table_info(texts)')]
+        if 'page_offsets' not in columns:
+            self.db.execute('ALTER TABLE texts ADD COLUMN page_offsets TEXT')
+
+    def file_hash(self, file_path, stat=None):
+        # An unchanged (size, mtime) pair reuses the stored digest, so a hit costs a stat and a lookup.
+        stat = stat or os.stat(file_path)
+        row = self.db.execute('SELECT size, mtime_ns, hash FROM files WHERE path = ?', (file_path,)).fetchone()
+        if row is not None and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+            return row[2]
+        digest = file_sha256(file_path)
+        self.db.execute('INSERT OR REPLACE INTO files (path, size, mtime_ns, hash) VALUES (?, ?, ?, ?)',
+                        (file_path, stat.st_size, stat.st_mtime_ns, digest))
+        return digest
+
+    def get_text(self, file_path, extract, digest=None):
+        return self.get_document(file_path, extract, digest)[0]
+
+    def get_document(self, file_path, extract, digest=None):
+        digest = digest or self.file_hash(file_path)
+        row = self.db.execute('SELECT text, page_offsets FROM texts WHERE hash = ? AND version = ?',
+                              (digest, self.version)).fetchone()
+        if row is not None:
+            self.hits += 1
+            self.db.execute('UPDATE texts SET last_used = ? WHERE hash = ? AND version = ?',
+                            (time.time(), digest, self.version))
+            return row[0], json.loads(row[1]) if row[1] is not None else None
+        self.misses += 1
+        result = extract(file_path)
+        if not result.transient:
+            self.put(digest, result.text, result.page_offsets)
+        return result.text, result.page_offsets
+
+    def put(self, digest, text, page_offsets=None):
+        size = len(text.encode('utf-8')) if text is not None else 0
+        offsets = json.dumps(page_offsets) if page_offsets is not None else None
+        self.db.execute('INSERT OR REPLACE INTO texts (hash, version, text, size, last_used, page_offsets) '
+                        'VALUES (?, ?, ?, ?, ?, ?)', (digest, self.version, text, size, time.time(), offsets))
+        self.inserts += 1
+        if self.inserts % EVICTION_CHECK_EVERY == 0:
+            self.evict()
+
+    def evict(self):
+        self.db.execute('DELETE FROM texts WHERE version != ?', (self.version,))
+        total = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM texts').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Drop least recently used entries until the cache is back to 90% of its budget.
+        excess = total - int(self.max_bytes * 0.9)
+        freed = 0
+        stale = []
+        for digest, version, size in self.db.execute('SELECT hash, version, size FROM texts ORDER BY last_used'):
+            stale.append((digest, version))
+            freed += size
+            if freed >= excess:
+                break
+        self.db.executemany('DELETE FROM texts WHERE hash = ? AND version = ?', stale)
+
+    def close(self):
+        self.db.close()
@@ -1,9 +1,13 @@
 from django_filters import rest_framework as filters
+from django.db.models import Case, IntegerField, Value, When
+from rest_framework import serializers
 from api.models import Complaint
+from api.pagination import RankedPagination
 
-from elasticsearch import Elasticsearch
 from elasticsearch_dsl import Search
 from elasticsearch_dsl.query import MultiMatch
+from api.es_client import execute, get_client
+from api.search_queries import SEARCH_INDEX, InvalidFilter, apply_filters, check_window, highlight
 from svoyaproverka_api import settings
 
 
@@ -51,127 +55,71 @@ class ComplaintFilter(filters.FilterSet):
     #     queryset = queryset.filter(complaint_id__in=complaint_ids)
     #     return queryset
     def search_docs_complaints(self, queryset, name, value, page_number=1, page_size=10):
-        client = Elasticsearch(timeout=60)
-        s = Search(using=client, index='complaints')
-        s = s.query('match_phrase', docs_complaints=value)
-        s = s.highlight('docs_complaints', fragment_size=400, number_of_fragments=1, max_analyzed_offset=1000000,
-                        pre_tags='<b>', post_tags='</b>')
-        s = s[0:10000]
-        response = s.execute()
-        complaint_ids = [hit.meta.id for hit in response.hits]
-        highlights_dict = {}
-        for hit in response.hits:
-            if 'highlight' in hit.meta:
-                highlights_dict[hit.meta.id] = hit.meta.highlight.docs_complaints[0]
-        complaints = queryset.filter(complaint_id__in=complaint_ids)
-        for complaint in complaints:
-            complaint.highlights = highlights_dict.get(complaint.complaint_id, [])
-        return complaints
+        return self.search_docs(queryset, name, 'docs_complaints', value)
 
     def search_docs_complaints_2(self, queryset, name, value):
-        client = Elasticsearch(timeout=60)
-        s = Search(using=client, index='complaints')
-        s = s.query('match_phrase', docs_complaints={
-            'query': value,
-            'slop': 2
-        })
-        s = s.highlight('docs_complaints', fragment_size=400, number_of_fragments=1, max_analyzed_offset=1000000,
-                        pre_tags='<b>', post_tags='</b>')
-        s = s[0:10000]
-        response = s.execute()
-        complaint_ids = [hit.meta.id for hit in response.hits]
-        highlights_dict = {}
-        for hit in response.hits:
-            if 'highlight' in hit.meta:
-                highlights_dict[hit.meta.id] = hit.meta.highlight.docs_complaints[0]
-        complaints = queryset.filter(complaint_id__in=complaint_ids)
-        for complaint in complaints:
-            complaint.highlights = highlights_dict.get(complaint.complaint_id, [])
-        return complaints
+        return self.search_docs(queryset, name, 'docs_complaints', value, slop=2)
 
     def search_docs_solutions(self, queryset, name, value):
-        client = Elasticsearch(timeout=60)
-        s = Search(using=client, index='solutions')
-        s = s.query('match_phrase', docs_solutions=value)
-        s = s.highlight('docs_solutions', fragment_size=400, number_of_fragments=1, max_analyzed_offset=1000000,
-                        pre_tags='<b>', post_tags='</b>')
-        s = s[0:10000]
-        response = s.execute()
-        complaint_ids = [hit.meta.id for hit in response.hits]
-        highlights_dict = {}
-        for hit in response.hits:
-            if 'highlight' in hit.meta:
-                highlights_dict[hit.meta.id] = hit.meta.highlight.docs_solutions[0]
-        complaints = queryset.filter(complaint_id__in=complaint_ids)
-        for complaint in complaints:
-            complaint.highlights = highlights_dict.get(complaint.complaint_id, [])
-
-        return complaints
+        return self.search_docs(queryset, name, 'docs_solutions', value)
 
     def search_docs_solutions_2(self, queryset, name, value):
-        client = Elasticsearch(timeout=60)
-        s = Search(using=client, index='solutions')
-        s = s.query('match_phrase', docs_solutions={
-            'query': value,
-            'slop': 2
-        })
-        s = s.highlight('docs_solutions', fragment_size=200, number_of_fragments=1, max_analyzed_offset=1000000,
-                        pre_tags='<b>', post_tags='</b>')
-        s = s[0:10000]
-        response = s.execute()
-        complaint_ids = [hit.meta.id for hit in response.hits]
-        highlights_dict = {}
-        for hit in response.hits:
-            if 'highlight' in hit.meta:
-                highlights_dict[hit.meta.id] = hit.meta.highlight.docs_solutions[0]
-        complaints = queryset.filter(complaint_id__in=complaint_ids)
-        for complaint in complaints:
-            complaint.highlights = highlights_dict.get(complaint.complaint_id, [])
-
-        return complaints
+        return self.search_docs(queryset, name, 'docs_solutions', value, slop=2, fragment_size=200)
 
     def search_docs_prescriptions(self, queryset, name, value):
-        client = Elasticsearch(timeout=60)
-        s = Search(using=client, index='prescriptions')
-        s = s.query('match_phrase', docs_prescriptions=value)
-        s = s.highlight('docs_prescriptions', fragment_size=400, number_of_fragments=1, max_analyzed_offset=1000000,
-                        pre_tags='<b>', post_tags='</b>')
-        s = s[0:10000]
-        response = s.execute()
-        complaint_ids = [hit.meta.id for hit in response.hits]
-        highlights_dict = {}
-        for hit in response.hits:
-            if 'highlight' in hit.meta:
-                highlights_dict[hit.meta.id] = hit.meta.highlight.docs_prescriptions[0]
-        complaints = queryset.filter(complaint_id__in=complaint_ids)
-        for complaint in complaints:
-            complaint.highlights = highlights_dict.get(complaint.complaint_id, [])
-
-        return complaints
+        return self.search_docs(queryset, name, 'docs_prescriptions', value)
 
     def search_docs_prescriptions_2(self, queryset, name, value):
-        client = Elasticsearch(timeout=60)
-        s = Search(using=client, index='prescriptions')
-        s = s.query('match_phrase', docs_prescriptions={
-            'query': value,
-            'slop': 2
-        })
-        s = s.highlight('docs_prescriptions', fragment_size=400, number_of_fragments=1, max_analyzed_offset=1000000,
-                        pre_tags='<b>', post_tags='</b>')
-        s = s[0:10000]
-        response = s.execute()
+        return self.search_docs(queryset, name, 'docs_prescriptions', value, slop=2)
+
+    def search_page(self, name):
+        # The other filters are applied in Elasticsearch as well (filter_clauses mirrors their semantics), so the
+        # requested page can be cut there. Two text filters at once still intersect their hits in Postgres.
+        if self.request is None:
+            return None
+        for filter_name in self.filters:
+            if filter_name != name and filter_name.startswith('docs_') and self.data.get(filter_name):
+                return None
+        paginator = RankedPagination()
+        offset, limit = paginator.get_offset(self.request), paginator.get_limit(self.request)
+        try:
+            check_window(offset, limit)
+        except InvalidFilter as e:
+            raise serializers.ValidationError({'offset': str(e)})
+        return offset, limit
+
+    def search_docs(self, queryset, name, field, value, slop=None, fragment_size=400):
+        s = Search(using=get_client(), index=SEARCH_INDEX)
+        s = s.source(False)
+        s = s.query('match_phrase', **{field: {'query': value, 'slop': slop} if slop is not None else value})
+        s = highlight(s, [field], fragment_size)
+        page = self.search_page(name)
+        if page is not None:
+            offset, limit = page
+            # The date range as ComplaintFilter parsed it, in whichever format it was given.
+            s = apply_filters(s, self.data, self.form.cleaned_data.get('date'))
+            s = s.extra(from_=offset, size=limit, track_total_hits=True)
+        else:
+            s = s[0:10000]
+        response = execute(s)
         complaint_ids = [hit.meta.id for hit in response.hits]
         highlights_dict = {}
         for hit in response.hits:
             if 'highlight' in hit.meta:
-                highlights_dict[hit.meta.id] = hit.meta.highlight.docs_prescriptions[0]
+                highlights_dict[hit.meta.id] = hit.meta.highlight[field][0]
         complaints = queryset.filter(complaint_id__in=complaint_ids)
+        if page is not None:
+            # Only this page was fetched: keep the Elasticsearch ranking and let RankedPagination report its total.
+            if complaint_ids:
+                complaints = complaints.order_by(Case(
+                    *[When(complaint_id=complaint_id, then=Value(rank)) for rank, complaint_id in enumerate(complaint_ids)],
+                    output_field=IntegerField()))
+            self.request.search_page = {'count': response.hits.total.value}
         for complaint in complaints:
             complaint.highlights = highlights_dict.get(complaint.complaint_id, [])
-
+            complaint.highlight_field = field
         return complaints
 
-
     class Meta:
         model = Complaint
         fields = [
@@ -0,0 +1,93 @@
+import datetime
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from elasticsearch.helpers import bulk
+
+from api.bulk_index import iter_actions
+from api.documents import AllDocument
+from api.index_versions import write_targets
+from api.models import IndexOutbox
+
+
+def retry_delay(attempts, backoff, max_backoff):
+    # `attempts` made so far, counting the one that just failed.
+    return datetime.timedelta(seconds=min(backoff * 2 ** (attempts - 1), max_backoff))
+
+
+def claim(batch_size, lease):
+    # Several drainers can run side by side: SKIP LOCKED hands each of them a different batch. The claim is
+    # committed as a lease on available_at, so no row lock is held while Elasticsearch is busy; entries of a
+    # drainer that died are claimed again once the lease runs out, and that counts as an attempt.
+    now = timezone.now()
+    with transaction.atomic():
+        entries = list(IndexOutbox.objects.select_for_update(skip_locked=True)
+                       .filter(applied_at__isnull=True, dead_at__isnull=True, available_at__lte=now)
+                       .order_by('id')
+                       .values_list('id', 'complaint_id', 'action', 'attempts')[:batch_size])
+        IndexOutbox.objects.filter(id__in=[entry[0] for entry in entries]).update(
+            attempts=F('attempts') + 1, available_at=now + lease)
+    return [(entry_id, complaint_id, action, attempts + 1) for entry_id, complaint_id, action, attempts in entries]
+
+
+def drain_batch(client, document=AllDocument, batch_size=1000, backoff=5, max_backoff=600, max_attempts=10,
+                lease=datetime.timedelta(minutes=10)):
+    alias = document._index._name
+    entries = claim(batch_size, lease)
+    if not entries:
+        return None
+    # Repeated changes to one complaint collapse into one operation; the latest action wins.
+    latest = {}
+    for _, complaint_id, action, _ in entries:
+        latest[complaint_id] = action
+    index_ids = [complaint_id for complaint_id, action in latest.items() if action == 'index']
+    sources = list(iter_actions(document, alias, document.django.model.objects.filter(pk__in=index_ids)))
+    found = {action['_id'] for action in sources}
+    # A complaint queued for indexing but deleted since is removed from the index instead.
+    sources += [{'_op_type': 'delete', '_index': alias, '_id': complaint_id}
+                for complaint_id in latest if complaint_id not in found]
+    # During a rebuild the version being loaded gets every change as well.
+    targets = write_targets(client, alias)
+    actions = [dict(action, _index=target) for target in targets for action in sources]
+    failed = {}
+    try:
+        _, errors = bulk(client, actions, raise_on_error=False)
+    except Exception as e:
+        failed = dict.fromkeys(latest, f'{type(e).__name__}: {e}')
+    else:
+        for error in errors:
+            op_type, result = next(iter(error.items()))
+            if op_type == 'delete' and result.get('status') == 404:
+                continue
+            failed[result['_id']] = str(result.get('error'))
+    done = [entry_id for entry_id, complaint_id, _, _ in entries if complaint_id not in failed]
+    dead = 0
+    now = timezone.now()
+    with transaction.atomic():
+        if len(targets) > 1:
+            # The rebuild replays these over its snapshot before it switches (see index_versions.rebuild).
+            IndexOutbox.objects.filter(id__in=done).update(applied_at=now)
+        else:
+            IndexOutbox.objects.filter(id__in=done).delete()
+        for entry_id, complaint_id, _, attempts in entries:
+            if complaint_id not in failed:
+                continue
+            if attempts >= max_attempts:
+                # E.g. a mapping error: retrying will not help. Parked with its error for `--dead`.
+                IndexOutbox.objects.filter(id=entry_id).update(error=failed[complaint_id], dead_at=now)
+                dead += 1
+            else:
+                IndexOutbox.objects.filter(id=entry_id).update(
+                    error=failed[complaint_id], available_at=now + retry_delay(attempts, backoff, max_backoff))
+    return {'entries': len(entries), 'operations': len(actions), 'failed': len(failed), 'dead': dead}
+
+
+def dead_entries():
+    return list(IndexOutbox.objects.filter(dead_at__isnull=False).order_by('dead_at')
+                .values('complaint_id', 'action', 'attempts', 'error', 'dead_at'))
+
+
+def retry_dead():
+    return IndexOutbox.objects.filter(dead_at__isnull=False).update(
+        dead_at=None, attempts=0, available_at=timezone.now())
@@ -0,0 +1,141 @@
+import datetime
+
+from django.utils import timezone
+from elasticsearch.exceptions import NotFoundError
+from elasticsearch.helpers import bulk
+
+from api.bulk_index import bulk_index, bulk_load_settings, iter_actions
+from api.models import IndexOutbox
+
+
+class RebuildError(Exception):
+    pass
+
+
+# Searched once on a new version before it goes live, so the first users do not pay for cold caches.
+WARMUP_QUERIES = ['жалоба', 'закупка', 'предписание', 'решение комиссии']
+# Outbox entries are stamped with their transaction's start time, which can precede the load's snapshot
+# while the change itself is committed after it; replay that far back to cover such transactions.
+REPLAY_MARGIN = datetime.timedelta(minutes=10)
+
+
+def building_alias(alias):
+    # Points at a version while it is being loaded, so the outbox drainer writes to it too.
+    return f'{alias}_building'
+
+
+def version_name(alias, now=None):
+    return f'{alias}_v{(now or datetime.datetime.utcnow()).strftime("%Y%m%d%H%M%S")}'
+
+
+def versions(client, alias):
+    try:
+        return sorted(client.indices.get(index=f'{alias}_v*'))
+    except NotFoundError:
+        return []
+
+
+def alias_targets(client, alias):
+    try:
+        return sorted(client.indices.get_alias(name=alias))
+    except NotFoundError:
+        return []
+
+
+def write_targets(client, alias):
+    return [alias] + alias_targets(client, building_alias(alias))
+
+
+def create_version(client, document, alias):
+    name = version_name(alias)
+    document._index.clone(name).create(using=client)
+    client.indices.put_alias(index=name, name=building_alias(alias))
+    return name
+
+
+def warm_up(client, name, fields, queries=WARMUP_QUERIES):
+    client.cluster.health(index=name, wait_for_status='yellow', timeout='60s')
+    for query in queries:
+        client.search(index=name, body={
+            'size': 10,
+            'query': {'multi_match': {'query': query, 'fields': fields, 'type': 'phrase'}},
+            'highlight': {'fields': {field: {} for field in fields}},
+        })
+
+
+def replay_changes(client, document, name, queryset, since):
+    # The bulk load streams a snapshot taken when it started. The outbox drainer writes newer versions of
+    # changed complaints to the new index meanwhile, and the load overwrites them when it reaches the same
+    # ids. Applying the current rows of every complaint changed since the start puts them back.
+    complaint_ids = set(IndexOutbox.objects.filter(created__gte=since).values_list('complaint_id', flat=True))
+    if not complaint_ids:
+        return 0
+    actions = list(iter_actions(document, name, queryset.filter(pk__in=complaint_ids)))
+    found = {action['_id'] for action in actions}
+    actions += [{'_op_type': 'delete', '_index': name, '_id': complaint_id}
+                for complaint_id in complaint_ids - found]
+    _, errors = bulk(client, actions, raise_on_error=False)
+    errors = [error for error in errors if next(iter(error.values())).get('status') != 404]
+    if errors:
+        raise RebuildError(f'{len(errors)} changes made during the load failed to apply to {name}')
+    return len(complaint_ids)
+
+
+def check_count(client, alias, name, indexed, min_ratio):
+    count = client.count(index=name)['count']
+    # The outbox drainer also writes to the new version while it loads, so allow for a little drift.
+    if abs(count - indexed) > max(indexed * 0.001, 10):
+        raise RebuildError(f'{name} holds {count} documents, {indexed} were indexed')
+    live = sum(client.count(index=target)['count'] for target in alias_targets(client, alias))
+    if live and count < live * min_ratio:
+        raise RebuildError(f'{name} holds {count} documents, the live index {live}; refusing to switch')
+    return count
+
+
+def swap_alias(client, alias, name):
+    # One _aliases call, so searches see either the old version or the new one, never neither.
+    actions = [{'remove': {'index': old, 'alias': alias}} for old in alias_targets(client, alias)]
+    if client.indices.exists(index=alias) and not client.indices.exists_alias(name=alias):
+        # The legacy unversioned index carries the alias's name and has to go in the same call.
+        actions.append({'remove_index': {'index': alias}})
+    actions.append({'add': {'index': name, 'alias': alias}})
+    actions.append({'remove': {'index': name, 'alias': building_alias(alias)}})
+    client.indices.update_aliases(body={'actions': actions})
+
+
+def collect_garbage(client, alias, keep=1):
+    # Keeps the live version plus the `keep` newest previous ones for a quick rollback.
+    live = set(alias_targets(client, alias))
+    building = set(alias_targets(client, building_alias(alias)))
+    old = [name for name in versions(client, alias) if name not in live and name not in building]
+    deleted = old[:-keep] if keep else old
+    for name in deleted:
+        client.indices.delete(index=name)
+    return deleted
+
+
+def rebuild(client, document, queryset, fetch_size=2000, keep=1, min_ratio=0.9, max_failed=0, **bulk_options):
+    alias = document._index._name
+    name = create_version(client, document, alias)
+    # Taken after the _building alias exists: from here on the drainer writes every change to the new version.
+    since = timezone.now() - REPLAY_MARGIN
+    try:
+        try:
+            with bulk_load_settings(client, name):
+                summary = bulk_index(client, iter_actions(document, name, queryset, fetch_size), **bulk_options)
+                summary['replayed'] = replay_changes(client, document, name, queryset, since)
+            if summary['failed'] > max_failed:
+                raise RebuildError(f'{summary["failed"]} documents failed to index into {name}')
+            check_count(client, alias, name, summary['indexed'], min_ratio)
+            warm_up(client, name, [field for field in document._fields if field.startswith('docs_')])
+        except BaseException:
+            # Ctrl-C included: a version left behind with its _building alias would keep receiving writes.
+            client.indices.delete(index=name, ignore=[404])
+            raise
+        swap_alias(client, alias, name)
+    finally:
+        # The drainer keeps applied entries while a version loads, for the replay above.
+        IndexOutbox.objects.filter(applied_at__isnull=False).delete()
+    summary['index'] = name
+    summary['deleted_versions'] = collect_garbage(client, alias, keep)
+    return summary
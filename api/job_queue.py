@@ -0,0 +1,123 @@
+import json
+import random
+import sqlite3
+import time
+from collections import namedtuple
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+DEAD = 'dead'
+
+Job = namedtuple('Job', ['id', 'kind', 'key', 'payload', 'attempts'])
+
+
+class JobQueue:
+    # At-least-once: a claimed job holds a lease, and a job whose worker died is claimed again once the lease runs out.
+    def __init__(self, path, max_attempts=5, backoff=30, max_backoff=3600):
+        self.db = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS jobs '
+                        '(id INTEGER PRIMARY KEY, kind TEXT, key TEXT, payload TEXT, state TEXT, '
+                        'attempts INTEGER DEFAULT 0, available_at REAL, lease_until REAL, error TEXT, '
+                        'rerun INTEGER DEFAULT 0, created REAL, updated REAL, UNIQUE (kind, key))')
+        self.db.execute('CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (kind, state, available_at)')
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+    def enqueue(self, kind, key, payload=None):
+        self.enqueue_many(kind, [(key, payload)])
+
+    def enqueue_many(self, kind, items):
+        # A queued key is left alone, a finished one is queued afresh, and a running one is queued again
+        # as soon as its current attempt completes. A dead one stays dead until retry_dead().
+        now = time.time()
+        self.db.execute('BEGIN IMMEDIATE')
+        try:
+            for key, payload in items:
+                payload = json.dumps(payload)
+                inserted = self.db.execute('INSERT OR IGNORE INTO jobs (kind, key, payload, state, available_at, '
+                                           'created, updated) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                           (kind, key, payload, PENDING, now, now, now)).rowcount
+                if inserted:
+                    continue
+                self.db.execute('UPDATE jobs SET state = ?, payload = ?, attempts = 0, available_at = ?, error = NULL, '
+                                'updated = ? WHERE kind = ? AND key = ? AND state = ?',
+                                (PENDING, payload, now, now, kind, key, DONE))
+                self.db.execute('UPDATE jobs SET rerun = 1, payload = ? WHERE kind = ? AND key = ? AND state = ?',
+                                (payload, kind, key, RUNNING))
+            self.db.execute('COMMIT')
+        except Exception:
+            self.db.execute('ROLLBACK')
+            raise
+
+    def claim(self, kind, limit=1, lease=600):
+        if limit <= 0:
+            return []
+        now = time.time()
+        self.db.execute('BEGIN IMMEDIATE')
+        try:
+            # A job whose worker died or hung on it (e.g. a file that crashes the converter) used its last
+            # attempt as well: it is parked as dead like a job that failed max_attempts times.
+            self.db.execute('UPDATE jobs SET state = ?, rerun = 0, error = ?, updated = ? '
+                            'WHERE kind = ? AND state = ? AND lease_until < ? AND attempts >= ?',
+                            (DEAD, 'lease expired', now, kind, RUNNING, now, self.max_attempts))
+            rows = self.db.execute('SELECT id, kind, key, payload, attempts FROM jobs '
+                                   'WHERE kind = ? AND ((state = ? AND available_at <= ?) '
+                                   'OR (state = ? AND lease_until < ?)) ORDER BY available_at LIMIT ?',
+                                   (kind, PENDING, now, RUNNING, now, limit)).fetchall()
+            self.db.executemany('UPDATE jobs SET state = ?, attempts = attempts + 1, lease_until = ?, updated = ? '
+                                'WHERE id = ?', [(RUNNING, now + lease, now, row[0]) for row in rows])
+            self.db.execute('COMMIT')
+        except Exception:
+            self.db.execute('ROLLBACK')
+            raise
+        return [Job(job_id, kind, key, json.loads(payload), attempts + 1)
+                for job_id, kind, key, payload, attempts in rows]
+
+    def complete(self, job):
+        now = time.time()
+        self.db.execute('UPDATE jobs SET state = CASE WHEN rerun THEN ? ELSE ? END, '
+                        'attempts = CASE WHEN rerun THEN 0 ELSE attempts END, '
+                        'available_at = ?, rerun = 0, error = NULL, updated = ? WHERE id = ?',
+                        (PENDING, DONE, now, now, job.id))
+
+    def fail(self, job, reason):
+        # Exponential backoff with jitter; after max_attempts the job is parked as dead together with its reason.
+        now = time.time()
+        if job.attempts >= self.max_attempts:
+            self.db.execute('UPDATE jobs SET state = ?, rerun = 0, error = ?, updated = ? WHERE id = ?',
+                            (DEAD, reason, now, job.id))
+            return False
+        delay = min(self.backoff * 2 ** (job.attempts - 1), self.max_backoff) * random.uniform(0.8, 1.2)
+        self.db.execute('UPDATE jobs SET state = ?, error = ?, available_at = ?, updated = ? WHERE id = ?',
+                        (PENDING, reason, now + delay, now, job.id))
+        return True
+
+    def dead(self, kind=None):
+        query = 'SELECT kind, key, attempts, error, updated FROM jobs WHERE state = ?'
+        params = [DEAD]
+        if kind is not None:
+            query += ' AND kind = ?'
+            params.append(kind)
+        return [dict(zip(('kind', 'key', 'attempts', 'error', 'updated'), row))
+                for row in self.db.execute(query + ' ORDER BY updated', params)]
+
+    def retry_dead(self, kind=None):
+        # The only way out of the dead state: re-enqueueing the same key leaves a dead job alone.
+        query = 'UPDATE jobs SET state = ?, attempts = 0, available_at = ? WHERE state = ?'
+        params = [PENDING, time.time(), DEAD]
+        if kind is not None:
+            query += ' AND kind = ?'
+            params.append(kind)
+        return self.db.execute(query, params).rowcount
+
+    def stats(self):
+        stats = {}
+        for kind, state, count in self.db.execute('SELECT kind, state, COUNT(*) FROM jobs GROUP BY kind, state'):
+            stats.setdefault(kind, {})[state] = count
+        return stats
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,88 @@
+import base64
+import json
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+def percentile(values, share):
+    return values[min(len(values) - 1, int(len(values) * share))] if values else None
+
+
+class Command(BaseCommand):
+    help = 'Load a running server with concurrent searches and compare the sync and async search endpoints'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://localhost:8000/api/v2/')
+        parser.add_argument('--endpoint', default='complaints/exact/search',
+                            help='Search endpoint under the base URL; the async one is under async/')
+        parser.add_argument('--query', action='append', default=[], help='Phrase to search; may repeat')
+        parser.add_argument('--queries-file', help='File with one phrase per line')
+        parser.add_argument('--requests', type=int, default=500, help='Requests per endpoint')
+        parser.add_argument('--concurrency', type=int, default=100, help='Requests in flight at once')
+        parser.add_argument('--only', choices=['sync', 'async'], help='Benchmark one of the two endpoints')
+        parser.add_argument('--user')
+        parser.add_argument('--password')
+        parser.add_argument('--timeout', type=float, default=120)
+        parser.add_argument('--cached', action='store_true',
+                            help='Let the search cache answer repeats (by default every request is a distinct key)')
+
+    def handle(self, *args, **options):
+        queries = list(options['query'])
+        if options['queries_file']:
+            with open(options['queries_file'], encoding='utf-8') as f:
+                queries += [line.strip() for line in f if line.strip()]
+        if not queries:
+            raise CommandError('Give at least one --query or a --queries-file')
+        headers = {}
+        if options['user']:
+            credentials = '{}:{}'.format(options['user'], options['password'] or '')
+            headers['Authorization'] = 'Basic ' + base64.b64encode(credentials.encode()).decode()
+        for mode in [options['only']] if options['only'] else ['sync', 'async']:
+            prefix = options['base_url'].rstrip('/') + ('/async/' if mode == 'async' else '/')
+            urls = []
+            for number in range(options['requests']):
+                url = '{}{}/{}/'.format(prefix, options['endpoint'].strip('/'),
+                                        urllib.parse.quote(queries[number % len(queries)]))
+                if not options['cached']:
+                    # An unknown parameter is ignored by the search but makes a cache key of its own.
+                    url += '?bench=' + uuid.uuid4().hex
+                urls.append(url)
+            summary = self.run(urls, headers, options['concurrency'], options['timeout'])
+            self.stdout.write(json.dumps({'mode': mode, **summary}))
+
+    def run(self, urls, headers, concurrency, timeout):
+        def fetch(url):
+            started = time.monotonic()
+            try:
+                with urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=timeout) as response:
+                    response.read()
+                    status = response.status
+            except urllib.error.HTTPError as e:
+                status = e.code
+            except OSError as e:
+                status = type(e).__name__
+            return status, time.monotonic() - started
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(fetch, urls))
+        elapsed = time.monotonic() - started
+        latencies = sorted(round(latency * 1000, 1) for status, latency in results if status == 200)
+        return {
+            'requests': len(urls),
+            'concurrency': concurrency,
+            'statuses': dict(Counter(str(status) for status, latency in results)),
+            'seconds': round(elapsed, 2),
+            'requests_per_second': round(len(urls) / elapsed, 1) if elapsed else None,
+            'p50_ms': percentile(latencies, 0.5),
+            'p90_ms': percentile(latencies, 0.9),
+            'p99_ms': percentile(latencies, 0.99),
+            'max_ms': latencies[-1] if latencies else None,
+        }
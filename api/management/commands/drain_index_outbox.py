@@ -0,0 +1,53 @@
+import datetime
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.conf import settings
+
+from api.documents import AllDocument
+from api.es_client import get_client
+from api.index_outbox import dead_entries, drain_batch, retry_dead
+from api.search_cache import bump_generation
+
+
+class Command(BaseCommand):
+    help = 'Apply queued search index changes from the IndexOutbox table to Elasticsearch'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--idle-sleep', type=float, default=1, help='Seconds to wait when the outbox is empty')
+        parser.add_argument('--backoff', type=float, default=5, help='First retry delay in seconds, doubled per attempt')
+        parser.add_argument('--max-backoff', type=float, default=600)
+        parser.add_argument('--max-attempts', type=int, default=10,
+                            help='Attempts before an entry is parked as dead with its error')
+        parser.add_argument('--lease', type=float, default=600,
+                            help='Seconds a claimed batch is reserved before another drainer may take it over')
+        parser.add_argument('--once', action='store_true', help='Exit once the outbox is empty')
+        parser.add_argument('--dead', action='store_true', help='List the dead entries and exit')
+        parser.add_argument('--retry-dead', action='store_true', help='Queue the dead entries again and exit')
+
+    def handle(self, *args, **options):
+        if options['dead']:
+            for entry in dead_entries():
+                self.stdout.write(json.dumps(entry, default=str, ensure_ascii=False))
+            return
+        if options['retry_dead']:
+            self.stdout.write(json.dumps({'requeued': retry_dead()}))
+            return
+        client = get_client()
+        try:
+            while True:
+                stats = drain_batch(client, AllDocument, options['batch_size'], options['backoff'],
+                                    options['max_backoff'], options['max_attempts'],
+                                    datetime.timedelta(seconds=options['lease']))
+                if stats is None:
+                    if options['once']:
+                        break
+                    time.sleep(options['idle_sleep'])
+                    continue
+                if stats['failed'] < stats['operations']:
+                    bump_generation(settings.SEARCH_CACHE_URL, settings.DATA_GENERATION_PATH)
+                self.stderr.write(json.dumps(stats))
+        except KeyboardInterrupt:
+            pass
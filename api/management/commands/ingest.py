@@ -0,0 +1,55 @@
+import datetime
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+import database_script
+
+
+class Command(BaseCommand):
+    help = 'Ingest new and changed complaint folders from DATA_FOLDER into Postgres'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=database_script.INGEST_WORKERS)
+        parser.add_argument('--queue-size', type=int, default=database_script.INGEST_QUEUE_SIZE)
+        parser.add_argument('--batch-size', type=int, default=database_script.INGEST_BATCH_SIZE)
+        parser.add_argument('--data-folder', default=database_script.DATA_FOLDER)
+        parser.add_argument('--since', help='Only folders with a file modified on or after this date (YYYY-MM-DD)')
+        parser.add_argument('--only', nargs='+', metavar='FOLDER', help='Only these complaint folders')
+        parser.add_argument('--force', action='store_true', help='Re-ingest selected folders even if unchanged')
+        parser.add_argument('--resume', action='store_true', help='Continue the last interrupted full run')
+        parser.add_argument('--queue', action='store_true',
+                            help='Ingest the folders queued as extract jobs by docx_script.py')
+        parser.add_argument('--progress-every', type=float, default=10, help='Seconds between progress lines')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = datetime.datetime.strptime(options['since'], '%Y-%m-%d').timestamp()
+            except ValueError:
+                raise CommandError('--since must be a date in YYYY-MM-DD format')
+        if options['queue']:
+            summary = database_script.script_queued(
+                workers=options['workers'],
+                queue_size=options['queue_size'],
+                data_folder=options['data_folder'],
+                batch_size=options['batch_size'],
+                on_progress=lambda progress: self.stderr.write(json.dumps(progress)),
+                progress_every=options['progress_every'],
+            )
+            self.stdout.write(json.dumps(summary, ensure_ascii=False))
+            return
+        summary = database_script.script(
+            workers=options['workers'],
+            queue_size=options['queue_size'],
+            data_folder=options['data_folder'],
+            batch_size=options['batch_size'],
+            only=options['only'],
+            since=since,
+            force=options['force'],
+            resume=options['resume'],
+            on_progress=lambda progress: self.stderr.write(json.dumps(progress)),
+            progress_every=options['progress_every'],
+        )
+        self.stdout.write(json.dumps(summary, ensure_ascii=False))
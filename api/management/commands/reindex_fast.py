@@ -0,0 +1,52 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+
+from api.bulk_index import bulk_index, bulk_load_settings, iter_actions
+from api.documents import AllDocument
+from api.es_client import get_client
+from api.index_versions import RebuildError, rebuild
+from api.search_cache import bump_generation
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the search index straight from Postgres with parallel bulk requests'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help='Documents per bulk request')
+        parser.add_argument('--thread-count', type=int, default=4, help='Concurrent bulk requests')
+        parser.add_argument('--max-chunk-bytes', type=int, default=100 * 1024 ** 2)
+        parser.add_argument('--fetch-size', type=int, default=2000, help='Rows per server-side cursor fetch')
+        parser.add_argument('--progress-every', type=float, default=10, help='Seconds between progress lines')
+        parser.add_argument('--in-place', action='store_true',
+                            help='Load into the live index instead of building a new version behind the alias')
+        parser.add_argument('--keep', type=int, default=1, help='Previous versions to keep for rollback')
+        parser.add_argument('--min-ratio', type=float, default=0.9,
+                            help='Refuse to switch if the new version holds fewer documents than this share of the live one')
+
+    def handle(self, *args, **options):
+        client = get_client()
+        queryset = AllDocument.django.model.objects.order_by()
+        bulk_options = {
+            'chunk_size': options['chunk_size'],
+            'thread_count': options['thread_count'],
+            'max_chunk_bytes': options['max_chunk_bytes'],
+            'on_progress': lambda progress: self.stderr.write(json.dumps(progress)),
+            'progress_every': options['progress_every'],
+        }
+        if options['in_place']:
+            index_name = AllDocument._index._name
+            if not AllDocument._index.exists():
+                AllDocument._index.create()
+            with bulk_load_settings(client, index_name):
+                summary = bulk_index(client, iter_actions(AllDocument, index_name, queryset, options['fetch_size']),
+                                     **bulk_options)
+        else:
+            try:
+                summary = rebuild(client, AllDocument, queryset, options['fetch_size'], options['keep'],
+                                  options['min_ratio'], **bulk_options)
+            except RebuildError as e:
+                raise CommandError(str(e))
+        bump_generation(settings.SEARCH_CACHE_URL, settings.DATA_GENERATION_PATH)
+        self.stdout.write(json.dumps(summary, ensure_ascii=False, default=str))
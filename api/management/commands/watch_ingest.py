@@ -0,0 +1,36 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+import database_script
+from api.watcher import Debouncer, make_watcher, watch
+
+
+class Command(BaseCommand):
+    help = 'Watch DATA_FOLDER and ingest complaint folders as soon as they change'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=database_script.INGEST_WORKERS)
+        parser.add_argument('--data-folder', default=database_script.DATA_FOLDER)
+        parser.add_argument('--debounce', type=float, default=30,
+                            help='Seconds a folder must stay quiet before it is ingested')
+        parser.add_argument('--max-batch', type=int, default=500)
+        parser.add_argument('--poll-interval', type=float, default=30)
+        parser.add_argument('--force-polling', action='store_true', help='Do not use inotify even if available')
+
+    def handle(self, *args, **options):
+        watcher = make_watcher(options['data_folder'], database_script.SKIP_NAMES, options['force_polling'],
+                               options['poll_interval'])
+        self.stderr.write(f'Watching {options["data_folder"]} with {type(watcher).__name__}')
+
+        def ingest(folders):
+            summary = database_script.script(workers=min(options['workers'], len(folders)),
+                                             data_folder=options['data_folder'], only=folders, force=True)
+            self.stdout.write(json.dumps(summary, ensure_ascii=False))
+
+        try:
+            watch(watcher, Debouncer(options['debounce']), ingest, options['max_batch'])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            watcher.close()
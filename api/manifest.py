@@ -0,0 +1,169 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+
+def scan_files(folder_path):
+    files = []
+    stack = [folder_path]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    stat = entry.stat(follow_symlinks=False)
+                    files.append((entry.path, stat.st_size, stat.st_mtime_ns))
+    files.sort()
+    return files
+
+
+def files_signature(files):
+    digest = hashlib.sha1()
+    for path, size, mtime_ns in files:
+        digest.update(f'{path}\0{size}\0{mtime_ns}\n'.encode('utf-8', 'surrogateescape'))
+    return digest.hexdigest()
+
+
+def process_alive(pid):
+    # This process's own unfinished runs were interrupted by an exception, not still going.
+    if pid is None or pid == os.getpid():
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+# Runs that scan the whole data folder and detect deletions, as opposed to a given list of folders.
+FULL_RUN = 'full'
+PARTIAL_RUN = 'partial'
+# Bump when ingest starts writing something new per folder, so every folder is ingested once more.
+MANIFEST_VERSION = 2
+
+
+class Manifest:
+    def __init__(self, path, version=MANIFEST_VERSION):
+        self.db = sqlite3.connect(path, timeout=60)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        if self.db.execute('PRAGMA user_version').fetchone()[0] != version:
+            self.db.execute('DROP TABLE IF EXISTS folders')
+            self.db.execute('DROP TABLE IF EXISTS files')
+            self.db.execute(f'PRAGMA user_version = {int(version)}')
+        self.db.execute('CREATE TABLE IF NOT EXISTS folders '
+                        '(name TEXT PRIMARY KEY, complaint_id TEXT, signature TEXT)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS files '
+                        '(folder TEXT, path TEXT, size INTEGER, mtime_ns INTEGER, hash TEXT, '
+                        'PRIMARY KEY (folder, path))')
+        self.db.execute('CREATE TABLE IF NOT EXISTS runs '
+                        '(id INTEGER PRIMARY KEY, options TEXT, started REAL, finished REAL, kind TEXT, pid INTEGER)')
+        columns = {row[1] for row in self.db.execute('PRAGMA table_info(runs)')}
+        for column, column_type in (('kind', 'TEXT'), ('pid', 'INTEGER')):
+            if column not in columns:
+                self.db.execute(f'ALTER TABLE runs ADD COLUMN {column} {column_type}')
+        self.db.execute('CREATE TABLE IF NOT EXISTS run_folders '
+                        '(run_id INTEGER, folder TEXT, PRIMARY KEY (run_id, folder))')
+        self.db.commit()
+        self.signatures = dict(self.db.execute('SELECT name, signature FROM folders'))
+        self.seen = set()
+        self.full_scan = False
+        self.run_id = None
+
+    def scan(self, data_folder, skip_names=(), since=None, force=False, exclude=()):
+        # Yields only folders whose file listing (path, size, mtime) differs from the last committed run.
+        # `since` (a timestamp) keeps folders with a file modified at or after it; `force` ignores the manifest.
+        self.full_scan = since is None
+        since_ns = int(since * 1e9) if since is not None else None
+        with os.scandir(data_folder) as entries:
+            for entry in entries:
+                if entry.name in skip_names or not entry.is_dir(follow_symlinks=False):
+                    continue
+                self.seen.add(entry.name)
+                if entry.name in exclude:
+                    continue
+                try:
+                    files = scan_files(entry.path)
+                except OSError:
+                    continue
+                if since_ns is not None and not any(mtime_ns >= since_ns for _, _, mtime_ns in files):
+                    continue
+                if force or self.signatures.get(entry.name) != files_signature(files):
+                    yield entry.name
+
+    def hashes(self, folder_name):
+        return dict(self.db.execute('SELECT path, hash FROM files WHERE folder = ?', (folder_name,)))
+
+    def commit(self, folder_name, complaint_id, files):
+        # A file whose extraction failed transiently is recorded without a hash and its folder without a
+        # signature: the next scan picks the folder up again and only that file is re-extracted.
+        files = sorted(files, key=lambda file: file['path'])
+        signature = files_signature([(file['path'], file['size'], file['mtime_ns']) for file in files])
+        if any(file.get('transient') for file in files):
+            signature = None
+        self.db.execute('INSERT OR REPLACE INTO folders (name, complaint_id, signature) VALUES (?, ?, ?)',
+                        (folder_name, complaint_id, signature))
+        self.db.execute('DELETE FROM files WHERE folder = ?', (folder_name,))
+        self.db.executemany('INSERT INTO files (folder, path, size, mtime_ns, hash) VALUES (?, ?, ?, ?, ?)',
+                            [(folder_name, file['path'], file['size'], file['mtime_ns'],
+                              None if file.get('transient') else file['hash'])
+                             for file in files])
+        self.signatures[folder_name] = signature
+        if self.run_id is not None:
+            self.db.execute('INSERT OR IGNORE INTO run_folders (run_id, folder) VALUES (?, ?)',
+                            (self.run_id, folder_name))
+
+    def start_run(self, options, kind=FULL_RUN):
+        self.run_id = self.db.execute('INSERT INTO runs (options, started, kind, pid) VALUES (?, ?, ?, ?)',
+                                      (json.dumps(options), time.time(), kind, os.getpid())).lastrowid
+        self.db.commit()
+        return self.run_id
+
+    def resume_run(self, kind=FULL_RUN):
+        # Picks up the latest run of `kind` that never finished and whose process is gone (a watcher batch or
+        # a queued ingest is never adopted by the nightly scan); its completed folders are its checkpoint.
+        rows = self.db.execute('SELECT id, options, pid FROM runs WHERE finished IS NULL AND kind = ? '
+                               'ORDER BY id DESC', (kind,)).fetchall()
+        for run_id, options, pid in rows:
+            if process_alive(pid):
+                continue
+            self.run_id = run_id
+            completed = {folder for folder, in self.db.execute('SELECT folder FROM run_folders WHERE run_id = ?',
+                                                                (run_id,))}
+            return run_id, json.loads(options), completed
+        return None, None, set()
+
+    def finish_run(self):
+        if self.run_id is None:
+            return
+        self.db.execute('UPDATE runs SET finished = ? WHERE id = ?', (time.time(), self.run_id))
+        self.db.execute('DELETE FROM run_folders WHERE run_id = ?', (self.run_id,))
+        self.db.commit()
+
+    def deleted(self):
+        # Only meaningful after a full, unfiltered scan(): folders that were committed before but are gone now.
+        if not self.full_scan or not self.seen:
+            return {}
+        return {name: complaint_id for name, complaint_id in self.db.execute('SELECT name, complaint_id FROM folders')
+                if name not in self.seen}
+
+    def complaint_ids(self, folder_names):
+        return {name: complaint_id for name, complaint_id in self.db.execute('SELECT name, complaint_id FROM folders')
+                if name in folder_names}
+
+    def forget(self, folder_names):
+        self.db.executemany('DELETE FROM folders WHERE name = ?', [(name,) for name in folder_names])
+        self.db.executemany('DELETE FROM files WHERE folder = ?', [(name,) for name in folder_names])
+        for name in folder_names:
+            self.signatures.pop(name, None)
+
+    def save(self):
+        self.db.commit()
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
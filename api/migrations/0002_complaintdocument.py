@@ -0,0 +1,36 @@
+# Generated by Django 4.2 on 2026-10-17 12:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ComplaintDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('complaint', 'Жалоба'), ('solution', 'Решение'), ('prescription', 'Предписание')], max_length=20)),
+                ('path', models.TextField()),
+                ('size', models.BigIntegerField()),
+                ('sha256', models.CharField(max_length=64)),
+                ('page_count', models.IntegerField(blank=True, null=True)),
+                ('text', models.TextField(blank=True, null=True)),
+                ('page_offsets', models.JSONField(blank=True, null=True)),
+                ('complaint', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='documents', to='api.complaint')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='complaintdocument',
+            index=models.Index(fields=['complaint', 'kind'], name='idx_complaint_document_kind'),
+        ),
+        migrations.AddConstraint(
+            model_name='complaintdocument',
+            constraint=models.UniqueConstraint(fields=('complaint', 'path'), name='uniq_complaint_document_path'),
+        ),
+    ]
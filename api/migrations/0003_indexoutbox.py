@@ -0,0 +1,29 @@
+# Generated by Django 4.2 on 2026-10-17 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_complaintdocument'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IndexOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('complaint_id', models.CharField(max_length=150)),
+                ('action', models.CharField(choices=[('index', 'index'), ('delete', 'delete')], max_length=10)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('attempts', models.IntegerField(default=0)),
+                ('available_at', models.DateTimeField(auto_now_add=True)),
+                ('error', models.TextField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='indexoutbox',
+            index=models.Index(fields=['available_at', 'id'], name='idx_index_outbox_available'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_indexoutbox_applied_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='indexoutbox',
+            name='dead_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
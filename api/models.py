@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.postgres.indexes import GinIndex
 
 
@@ -26,3 +26,62 @@ class Complaint(models.Model):
             GinIndex(fields=['docs_complaints', 'docs_solutions', 'docs_prescriptions'],
                      name='idx_docs_gin', opclasses=['gin_trgm_ops', 'gin_trgm_ops', 'gin_trgm_ops'])
         ]
+
+    def save(self, *args, **kwargs):
+        # Django sends post_save after the write has committed in autocommit mode; inside this block the
+        # IndexOutbox row queued by api.signals commits or rolls back together with it. Deletes need no such
+        # block: the deletion collector already sends post_delete inside its own transaction.
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+
+
+class ComplaintDocument(models.Model):
+    KIND_CHOICES = [
+        ('complaint', 'Жалоба'),
+        ('solution', 'Решение'),
+        ('prescription', 'Предписание'),
+    ]
+
+    complaint = models.ForeignKey(Complaint, on_delete=models.CASCADE, related_name='documents')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    path = models.TextField()
+    size = models.BigIntegerField()
+    sha256 = models.CharField(max_length=64)
+    page_count = models.IntegerField(null=True, blank=True)
+    text = models.TextField(null=True, blank=True)
+    page_offsets = models.JSONField(null=True, blank=True)
+
+    class Meta:
+        app_label = 'api'
+        constraints = [
+            models.UniqueConstraint(fields=['complaint', 'path'], name='uniq_complaint_document_path')
+        ]
+        indexes = [
+            models.Index(fields=['complaint', 'kind'], name='idx_complaint_document_kind')
+        ]
+
+
+class IndexOutbox(models.Model):
+    # Search index changes, written in the same transaction as the Complaint change they describe
+    # and applied to Elasticsearch by `manage.py drain_index_outbox`.
+    ACTION_CHOICES = [
+        ('index', 'index'),
+        ('delete', 'delete'),
+    ]
+
+    complaint_id = models.CharField(max_length=150)
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    created = models.DateTimeField(auto_now_add=True)
+    attempts = models.IntegerField(default=0)
+    available_at = models.DateTimeField(auto_now_add=True)
+    error = models.TextField(null=True, blank=True)
+    # Set instead of deleting the entry while a rebuild loads a new version; the rebuild deletes it.
+    applied_at = models.DateTimeField(null=True, blank=True)
+    # Set once the entry failed max_attempts times; it stays, with its error, until requeued.
+    dead_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        app_label = 'api'
+        indexes = [
+            models.Index(fields=['available_at', 'id'], name='idx_index_outbox_available')
+        ]
@@ -0,0 +1,18 @@
+from rest_framework.pagination import LimitOffsetPagination
+
+
+class RankedPagination(LimitOffsetPagination):
+    # ComplaintFilter's text filters may already have fetched just the requested page from Elasticsearch,
+    # ranked; they leave its total on the request and the page is passed through as is.
+    default_limit = 10
+    max_limit = 20
+
+    def paginate_queryset(self, queryset, request, view=None):
+        search_page = getattr(request, 'search_page', None)
+        if search_page is None:
+            return super().paginate_queryset(queryset, request, view)
+        self.request = request
+        self.limit = self.get_limit(request)
+        self.offset = self.get_offset(request)
+        self.count = search_page['count']
+        return list(queryset)
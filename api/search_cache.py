@@ -0,0 +1,211 @@
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qs, urlparse
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+
+def read_generation(path):
+    try:
+        with open(path) as f:
+            return int(f.read().strip() or 0)
+    except (OSError, ValueError):
+        return 0
+
+
+def bump_generation_file(path):
+    if not path:
+        return None
+    generation = read_generation(path) + 1
+    directory = os.path.dirname(path) or '.'
+    with tempfile.NamedTemporaryFile('w', dir=directory, delete=False) as f:
+        f.write(str(generation))
+    os.replace(f.name, path)
+    return generation
+
+
+class LocalCache:
+    # One per process; the generation lives in a file so every worker on the host sees a bump.
+    def __init__(self, max_entries=2000, ttl=600, generation_path=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.generation_path = generation_path
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def generation(self):
+        return read_generation(self.generation_path) if self.generation_path else 0
+
+    def bump_generation(self):
+        return bump_generation_file(self.generation_path)
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+class FileCache:
+    # Shared by every worker process on the host; least recently used entries go first.
+    def __init__(self, path, max_entries=20000, ttl=600):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.local = threading.local()
+        db = self._db()
+        db.execute('CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value BLOB, expires REAL, last_used REAL)')
+        db.execute('CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER)')
+        db.commit()
+
+    def _db(self):
+        db = getattr(self.local, 'db', None)
+        if db is None:
+            db = self.local.db = sqlite3.connect(self.path, timeout=5)
+            db.execute('PRAGMA journal_mode=WAL')
+        return db
+
+    def generation(self):
+        row = self._db().execute("SELECT value FROM meta WHERE name = 'generation'").fetchone()
+        return row[0] if row is not None else 0
+
+    def bump_generation(self):
+        db = self._db()
+        db.execute("INSERT INTO meta VALUES ('generation', 1) ON CONFLICT (name) DO UPDATE SET value = value + 1")
+        db.commit()
+        return self.generation()
+
+    def get(self, key):
+        db = self._db()
+        row = db.execute('SELECT value, expires FROM results WHERE key = ?', (key,)).fetchone()
+        if row is None or row[1] < time.time():
+            return None
+        db.execute('UPDATE results SET last_used = ? WHERE key = ?', (time.time(), key))
+        db.commit()
+        return pickle.loads(row[0])
+
+    def set(self, key, value):
+        db = self._db()
+        now = time.time()
+        db.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)',
+                   (key, pickle.dumps(value), now + self.ttl, now))
+        db.execute('DELETE FROM results WHERE expires < ?', (now,))
+        db.execute('DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY last_used DESC LIMIT -1 '
+                   'OFFSET ?)', (self.max_entries,))
+        db.commit()
+
+
+class RedisCache:
+    # LRU eviction is left to the server (maxmemory-policy allkeys-lru).
+    def __init__(self, url, ttl=600, prefix='search:'):
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def generation(self):
+        return int(self.client.get(self.prefix + 'generation') or 0)
+
+    def bump_generation(self):
+        return self.client.incr(self.prefix + 'generation')
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return pickle.loads(value) if value is not None else None
+
+    def set(self, key, value):
+        self.client.set(self.prefix + key, pickle.dumps(value), ex=int(self.ttl))
+
+
+def make_backend(url, generation_path=None):
+    # locmem://?max_entries=2000&ttl=600, file:///path/to/cache.sqlite3?ttl=600, redis://host:6379/0?ttl=600
+    # Only locmem:// needs generation_path; the other backends keep the generation next to the results they share.
+    if not url:
+        return None
+    parsed = urlparse(url)
+    options = {key: float(values[-1]) for key, values in parse_qs(parsed.query).items()}
+    ttl = options.pop('ttl', 600)
+    if parsed.scheme == 'locmem':
+        return LocalCache(int(options.get('max_entries', 2000)), ttl, generation_path)
+    if parsed.scheme == 'file':
+        return FileCache(parsed.path, int(options.get('max_entries', 20000)), ttl)
+    if parsed.scheme in ('redis', 'rediss'):
+        if redis is None:
+            raise ImportError('SEARCH_CACHE_URL points at Redis but the redis package is not installed')
+        return RedisCache(parsed._replace(query='').geturl(), ttl)
+    raise ValueError(f'Unknown search cache backend: {parsed.scheme}')
+
+
+def bump_generation(url, generation_path=None):
+    # Called after the searchable data changed; every cached search result made before is stale from now on.
+    backend = make_backend(url, generation_path)
+    return backend.bump_generation() if backend is not None else None
+
+
+class SearchCache:
+    def __init__(self, backend):
+        self.backend = backend
+        self.locks = {}
+        self.locks_lock = threading.Lock()
+
+    def key(self, scope, query, params):
+        payload = {
+            'scope': scope,
+            # The query as given: the cached response embeds links (next, previous, highlights_url) built from it.
+            'query': query,
+            'params': sorted((key, value) for key, value in params.items()),
+            'generation': self.backend.generation() if self.backend is not None else 0,
+        }
+        return hashlib.sha1(json.dumps(payload, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        return self.backend.get(key) if self.backend is not None else None
+
+    def set(self, key, value):
+        if self.backend is not None:
+            self.backend.set(key, value)
+
+    def get_or_compute(self, key, compute):
+        if self.backend is None:
+            return compute()
+        value = self.backend.get(key)
+        if value is not None:
+            return value
+        # Identical requests arriving together wait for the first one instead of all hitting Elasticsearch.
+        with self.locks_lock:
+            lock = self.locks.setdefault(key, [threading.Lock(), 0])
+            lock[1] += 1
+        try:
+            with lock[0]:
+                value = self.backend.get(key)
+                if value is None:
+                    value = compute()
+                    self.backend.set(key, value)
+                return value
+        finally:
+            with self.locks_lock:
+                lock[1] -= 1
+                if not lock[1]:
+                    del self.locks[key]
@@ -0,0 +1,238 @@
+import base64
+import datetime
+import json
+import re
+
+from django import forms
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from elasticsearch.exceptions import NotFoundError
+from elasticsearch_dsl import Q
+
+from api.documents import AllDocument
+from api.es_client import execute, timeout
+
+
+SEARCH_INDEX = AllDocument._index._name
+DOCS_FIELDS = ['docs_complaints', 'docs_solutions', 'docs_prescriptions']
+# What the search serializers output; the long docs_* texts are only searched and highlighted.
+META_FIELDS = ['complaint_id', 'date', 'region', 'customer_name', 'customer_inn', 'complainant_name',
+               'complainant_inn', 'status', 'numb_purchase', 'justification', 'list_docs']
+# index.max_result_window: Elasticsearch refuses a from + size beyond it.
+MAX_RESULT_WINDOW = 10000
+# Characters of a docs_* text analyzed for highlighting while the index holds no offsets for them.
+MAX_ANALYZED_OFFSET = 1000000
+# ComplaintFilter parameters accepted by the search endpoints, as filter clauses on keyword subfields.
+FILTER_FIELDS = {
+    'complaint_id': ('term', 'complaint_id.raw'),
+    'region': ('term', 'region.raw'),
+    'customer_name': ('contains', 'customer_name.raw'),
+    'customer_inn': ('term', 'customer_inn.raw'),
+    'complainant_name': ('contains', 'complainant_name.raw'),
+    'complainant_inn': ('term', 'complainant_inn.raw'),
+    'status': ('terms', 'status.raw'),
+    'numb_purchase': ('term', 'numb_purchase.raw'),
+    'justification': ('terms', 'justification.raw'),
+}
+WILDCARD_SPECIAL = re.compile(r'([\\*?])')
+# ?highlight= on the search endpoints: fragments in every hit (the default), none, or a link per hit to fetch them.
+HIGHLIGHT_MODES = ('inline', 'none', 'deferred')
+# How long a point in time stays open between two cursor pages, unless ES_PIT_KEEP_ALIVE says otherwise.
+PIT_KEEP_ALIVE = '10m'
+
+
+def default_clause():
+    return Q(
+        should=[
+            Q("match", is_default=True),
+        ],
+        minimum_should_match=1,
+    )
+
+
+def exact_query(fields, query):
+    return Q("multi_match", query=query, fields=fields, type='phrase')
+
+
+def inexact_query(field, query, slop=2):
+    return Q("match_phrase", **{field: {"query": query, "slop": slop}})
+
+
+class InvalidFilter(ValueError):
+    pass
+
+
+class CursorExpired(Exception):
+    # The point in time of a cursor walk was closed by Elasticsearch after ES_PIT_KEEP_ALIVE without a request.
+    pass
+
+
+def parse_date(value):
+    # The formats ComplaintFilter's date range accepts: ISO and those of the active locale (01.02.2023 for ru).
+    try:
+        return forms.DateField().clean(value)
+    except ValidationError:
+        raise InvalidFilter(f'Invalid date: {value}')
+
+
+def as_date(value):
+    return value.date() if isinstance(value, datetime.datetime) else value
+
+
+def date_clause(after=None, before=None):
+    date_range = {}
+    if after:
+        date_range['gte'] = as_date(after).isoformat()
+    if before:
+        date_range['lte'] = as_date(before).isoformat()
+    return Q('range', date=date_range) if date_range else None
+
+
+def filter_clauses(params, date_range=None):
+    # Same semantics as ComplaintFilter: exact matches, icontains for names, any-of for status and
+    # justification, an inclusive date range. Filter context: no scoring, cached by Elasticsearch.
+    # `date_range` is ComplaintFilter's cleaned slice when it already parsed date_after/date_before.
+    clauses = []
+    for name, (kind, field) in FILTER_FIELDS.items():
+        values = [value for value in params.getlist(name) if value]
+        if not values:
+            continue
+        if kind == 'terms':
+            clauses.append(Q('terms', **{field: values}))
+        elif kind == 'term':
+            clauses.append(Q('term', **{field: values[-1]}))
+        else:
+            pattern = '*' + WILDCARD_SPECIAL.sub(r'\\\1', values[-1]) + '*'
+            clauses.append(Q('wildcard', **{field: {'value': pattern, 'case_insensitive': True}}))
+    if date_range is not None:
+        clause = date_clause(date_range.start, date_range.stop)
+    else:
+        clause = date_clause(parse_date(params['date_after']) if params.get('date_after') else None,
+                             parse_date(params['date_before']) if params.get('date_before') else None)
+    if clause is not None:
+        clauses.append(clause)
+    return clauses
+
+
+def apply_filters(search, params, date_range=None):
+    for clause in filter_clauses(params, date_range):
+        search = search.filter(clause)
+    return search
+
+
+def highlight_mode(params):
+    mode = params.get('highlight') or 'inline'
+    if mode not in HIGHLIGHT_MODES:
+        raise InvalidFilter(f'Unknown highlight mode: {mode}')
+    return mode
+
+
+def highlight_sources(params):
+    # ?highlight_source=1 adds the attachment and page of every highlight. They are found by scanning the
+    # attachment texts in Postgres, so only when a client asks for them.
+    value = (params.get('highlight_source') or '0').lower()
+    if value not in ('0', '1', 'false', 'true'):
+        raise InvalidFilter(f'highlight_source must be 0 or 1, not {value}')
+    return value in ('1', 'true')
+
+
+def highlight(search, fields, fragment_size=400, **options):
+    # ES_HIGHLIGHT picks the highlighter and may override the fragment settings of every endpoint.
+    options = {'fragment_size': fragment_size, 'number_of_fragments': 1, **options,
+               **getattr(settings, 'ES_HIGHLIGHT', {})}
+    if not getattr(settings, 'ES_DOCS_OFFSETS_INDEXED', False):
+        # An index built before the offsets mapping is highlighted by re-analyzing the text, and Elasticsearch
+        # fails the whole search on a text longer than index.highlight.max_analyzed_offset; this caps it instead.
+        options.setdefault('max_analyzed_offset', MAX_ANALYZED_OFFSET)
+    for field in fields:
+        search = search.highlight(field, pre_tags='<b>', post_tags='</b>', **options)
+    return search
+
+
+def page_link(request, path='', base=None, **params):
+    # Keeps the filter parameters of the current request (or of `base`); only the paging ones change.
+    query = (request.GET if base is None else base).copy()
+    for key in ('size', 'from', 'cursor'):
+        query.pop(key, None)
+    for key, value in params.items():
+        query[key] = value
+    return request.build_absolute_uri('{}?{}'.format(path, query.urlencode()))
+
+
+def check_window(from_value, size):
+    # Fail as a bad request instead of letting Elasticsearch fail the search; deeper pages take ?cursor=.
+    window = getattr(settings, 'ES_MAX_RESULT_WINDOW', MAX_RESULT_WINDOW)
+    if from_value + size > window:
+        raise InvalidFilter(f'Only the first {window} hits can be paged to by offset')
+
+
+def page_links(request, total, size, from_value, path='', base=None):
+    next_link = None
+    previous_link = None
+    if from_value + size < total:
+        next_link = page_link(request, path, base, size=str(size), **{'from': str(from_value + size)})
+    if from_value - size >= 0:
+        previous_link = page_link(request, path, base, size=str(size), **{'from': str(max(from_value - size, 0))})
+    return next_link, previous_link
+
+
+def encode_cursor(cursor):
+    return base64.urlsafe_b64encode(json.dumps(cursor, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    # The token comes from the client: anything but a cursor made by encode_cursor() is a bad request.
+    try:
+        cursor = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except ValueError:
+        raise InvalidFilter('Invalid cursor')
+    if (not isinstance(cursor, dict) or not isinstance(cursor.get('pit'), str)
+            or not isinstance(cursor.get('after'), list) or not isinstance(cursor.get('count'), int)):
+        raise InvalidFilter('Invalid cursor')
+    return cursor
+
+
+def pit_keep_alive():
+    return getattr(settings, 'ES_PIT_KEEP_ALIVE', PIT_KEEP_ALIVE)
+
+
+def cursor_page(client, search, size, token=None):
+    # Point in time + search_after: every page costs the same however deep it is. The total is
+    # counted on the first page only and carried along in the cursor.
+    cursor = decode_cursor(token) if token else None
+    keep_alive = pit_keep_alive()
+    if cursor is None:
+        pit_id = client.open_point_in_time(index=search._index, keep_alive=keep_alive,
+                                          request_timeout=timeout('pit'))['id']
+        search = search.extra(track_total_hits=True)
+    else:
+        pit_id = cursor['pit']
+        search = search.extra(search_after=cursor['after'], track_total_hits=False)
+    search = (search.index()
+              .sort('_score', {'_shard_doc': 'asc'})
+              .extra(size=size, pit={'id': pit_id, 'keep_alive': keep_alive}))
+    try:
+        response = execute(search)
+    except NotFoundError:
+        if cursor is None:
+            raise
+        raise CursorExpired('The cursor has expired')
+    count = response.hits.total.value if cursor is None else cursor['count']
+    hits = response.hits
+    next_token = None
+    if len(hits) == size:
+        next_token = encode_cursor({'pit': response.pit_id, 'after': list(hits[-1].meta.sort), 'count': count})
+    else:
+        client.close_point_in_time(body={'id': response.pit_id}, request_timeout=timeout('pit'))
+    return response, count, next_token
+
+
+def cursor_link(request, size, token):
+    if token is None:
+        return None
+    return page_link(request, size=str(size), cursor=token)
+
+
+def restart_link(request):
+    # The first page of the same cursor walk: ?cursor= with an empty token opens a new point in time.
+    return page_link(request, size=request.GET.get('size', '10'), cursor='')
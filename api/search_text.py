@@ -1,45 +1,186 @@
+import multiprocessing
 import os
+import re
+import resource
+import signal
+import time
+from collections import namedtuple
+
 import textract
 from PyPDF2 import PdfReader
 from PyPDF2.errors import EmptyFileError, PdfReadError
 
 
+# Bump whenever extraction or normalization output changes, so cached texts are re-extracted.
+EXTRACTOR_VERSION = 2
+SUPPORTED_EXTENSIONS = ['.pdf', '.docx', '.rtf', '.odt', '.txt']
+DEFAULT_TIMEOUT = 120
+DEFAULT_MEMORY_LIMIT = 2 * 1024 ** 3
+DEFAULT_MAX_PAGES = 2000
+DEFAULT_MAX_BYTES = 50 * 1024 ** 2
+# Failures that come from the file's content: cached like a text, so the file is not tried again until it
+# changes. Anything else (timeout, memory, crashed, OSError such as EMFILE or EIO, textract's ShellError for a
+# missing or failing antiword/pdftotext, ...) depends on the host and is retried on the next run.
+CONTENT_ERRORS = ('unsupported', 'EmptyFileError', 'PdfReadError', 'AttributeError', 'UnicodeDecodeError',
+                  'BadZipFile', 'ExtensionNotSupported')
+
+
+class ExtractionResult(namedtuple('ExtractionResult',
+                                  ['text', 'page_count', 'extractor', 'elapsed', 'error', 'page_offsets'],
+                                  defaults=[None])):
+    __slots__ = ()
+
+    @property
+    def transient(self):
+        return self.error is not None and self.error.split(':', 1)[0] not in CONTENT_ERRORS
+
+
+def normalize_text(content):
+    content = content.replace('\n', ' ').replace('\f', '').replace('\t', '').replace("   ", "")
+    return re.sub('[a-zA-Z]', '', content)
+
+
+def iter_pdf_pages(file_path, max_pages=DEFAULT_MAX_PAGES):
+    with open(file_path, 'rb') as f:
+        pdf = PdfReader(f)
+        for page_num, page in enumerate(pdf.pages):
+            if page_num >= max_pages:
+                return
+            yield page.extract_text() or ''
+
+
+def join_limited(chunks, max_bytes, normalize=None):
+    # Returns the joined text and the character offset at which every chunk (page) starts.
+    parts = []
+    offsets = []
+    length = 0
+    size = 0
+    for chunk in chunks:
+        if normalize is not None:
+            chunk = normalize(chunk)
+        offsets.append(length)
+        parts.append(chunk)
+        length += len(chunk)
+        size += len(chunk.encode('utf-8'))
+        if size >= max_bytes:
+            break
+    return ''.join(parts).encode('utf-8')[:max_bytes].decode('utf-8', 'ignore'), offsets
+
+
+def extract_file(file_path, max_pages=DEFAULT_MAX_PAGES, max_bytes=DEFAULT_MAX_BYTES, normalize=None):
+    started = time.monotonic()
+    file_extension = os.path.splitext(file_path)[1].lower()
+    text = None
+    page_offsets = None
+    error = None
+    if file_extension not in SUPPORTED_EXTENSIONS:
+        extractor = None
+        error = 'unsupported'
+    elif file_extension == '.txt':
+        extractor = 'txt'
+        with open(file_path, 'rb') as f:
+            text = f.read(max_bytes).decode('utf-8', 'ignore')
+    elif file_extension == '.pdf':
+        extractor = 'pypdf2'
+        try:
+            text, page_offsets = join_limited(iter_pdf_pages(file_path, max_pages), max_bytes, normalize)
+        except (EmptyFileError, PdfReadError, OSError, AttributeError, UnicodeDecodeError) as e:
+            # PyPDF2 raises AttributeError on some malformed files.
+            error = f'{type(e).__name__}: {e}'
+    else:
+        extractor = 'textract'
+        try:
+            text = textract.process(file_path)[:max_bytes].decode('utf-8', 'ignore')
+        except MemoryError:
+            error = 'memory'
+        except Exception as e:
+            error = f'{type(e).__name__}: {e}'
+    if text is not None and page_offsets is None:
+        page_offsets = [0]
+        if normalize is not None:
+            text = normalize(text)
+    page_count = len(page_offsets) if page_offsets is not None else None
+    return ExtractionResult(text, page_count, extractor, time.monotonic() - started, error, page_offsets)
+
+
+def extract_text(file_path):
+    return extract_file(file_path).text
+
+
 def search_text_in_folder(list_docs_path):
     folder_path = list_docs_path
-    supported_extensions = ['.pdf', '.docx', '.rtf', '.odt', '.txt']
     for root, dirs, files in os.walk(folder_path):
         for file in files:
-            file_path = os.path.join(root, file)
-            file_extension = os.path.splitext(file_path)[1].lower()
-            if file_extension in supported_extensions:
-                if file_extension == '.txt':
-                    with open(file_path, 'rb') as f:
-                        text = f.read().decode('utf-8', 'ignore')
-                        return text
-                elif file_extension == '.pdf':
-                    with open(file_path, 'rb') as f:
-                        try:
-                            pdf = PdfReader(f)
-                            num_pages = len(pdf.pages)
-                            text = ''
-                            for page_num in range(num_pages):
-                                page = pdf.pages[page_num]
-                                page_text = page.extract_text()
-                                text += page_text
-                            return text
-                        except EmptyFileError:
-                            pass
-                        except PdfReadError:
-                            pass
-                        except OSError:
-                            pass
-                        except AttributeError:
-                            pass
-                        except UnicodeDecodeError:
-                            pass
-                else:
-                    try:
-                        text = textract.process(file_path).decode('utf-8', 'ignore')
-                        return text
-                    except Exception:
-                        continue
+            text = extract_text(os.path.join(root, file))
+            if text is not None:
+                return text
+
+
+def _serve(conn, memory_limit, max_pages, max_bytes, normalize):
+    # Own process group, so textract's helper processes die together with the worker.
+    os.setsid()
+    if memory_limit:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+    while True:
+        try:
+            file_path = conn.recv()
+        except EOFError:
+            return
+        try:
+            result = extract_file(file_path, max_pages, max_bytes, normalize)
+        except MemoryError:
+            result = ExtractionResult(None, None, None, 0, 'memory')
+        except Exception as e:
+            # The worker lives on; CONTENT_ERRORS decides whether the failure is cached.
+            result = ExtractionResult(None, None, None, 0, f'{type(e).__name__}: {e}')
+        conn.send(result)
+
+
+class SupervisedExtractor:
+    def __init__(self, timeout=DEFAULT_TIMEOUT, memory_limit=DEFAULT_MEMORY_LIMIT,
+                 max_pages=DEFAULT_MAX_PAGES, max_bytes=DEFAULT_MAX_BYTES, normalize=None):
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self.max_pages = max_pages
+        self.max_bytes = max_bytes
+        self.normalize = normalize
+        self.process = None
+        self.conn = None
+
+    def start(self):
+        context = multiprocessing.get_context('fork')
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_serve,
+                                       args=(child_conn, self.memory_limit, self.max_pages, self.max_bytes,
+                                             self.normalize),
+                                       daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def stop(self):
+        if self.process is None:
+            return
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+        self.process.join()
+        self.conn.close()
+        self.process = None
+        self.conn = None
+
+    def extract(self, file_path):
+        if self.process is None or not self.process.is_alive():
+            self.stop()
+            self.start()
+        started = time.monotonic()
+        try:
+            self.conn.send(file_path)
+            if self.conn.poll(self.timeout):
+                return self.conn.recv()
+            error = 'timeout'
+        except (EOFError, OSError):
+            self.process.join(1)
+            error = 'memory' if self.process.exitcode == -signal.SIGKILL else 'crashed'
+        self.stop()
+        return ExtractionResult(None, None, None, time.monotonic() - started, error)
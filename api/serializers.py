@@ -1,5 +1,8 @@
+from django.db import models
 from rest_framework import serializers
 from api.models import Complaint
+from api.document_sources import locate_highlights
+from api.search_queries import InvalidFilter, highlight_sources
 import urllib.parse
 from django.urls import reverse
 from urllib.parse import quote_plus
@@ -12,15 +15,30 @@ class CustomDateTimeField(serializers.ReadOnlyField):
         return None
 
 
+class ComplaintListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        # Locates the highlights of the whole page in one query instead of one per complaint.
+        complaints = list(data.all() if isinstance(data, models.Manager) else data)
+        self.child.highlight_sources = {}
+        if self.child.wants_highlight_sources():
+            self.child.highlight_sources = locate_highlights({
+                (complaint.complaint_id, complaint.highlight_field): complaint.highlights
+                for complaint in complaints if getattr(complaint, 'highlight_field', None) is not None
+            })
+        return super().to_representation(complaints)
+
+
 class ComplaintSerializer(serializers.ModelSerializer):
     list_docs = serializers.SerializerMethodField()
     highlights = serializers.SerializerMethodField()
+    highlight_source = serializers.SerializerMethodField()
     class Meta:
         model = Complaint
         fields = [
             'complaint_id', 'date', 'region', 'customer_name', 'customer_inn', 'complainant_name', 'complainant_inn',
-            'status', 'numb_purchase', 'justification', 'list_docs', 'json_data', 'highlights'
+            'status', 'numb_purchase', 'justification', 'list_docs', 'json_data', 'highlights', 'highlight_source'
         ]
+        list_serializer_class = ComplaintListSerializer
 
     def get_list_docs(self, obj):
         empty_folder = 'Нет файлов'
@@ -37,6 +55,22 @@ class ComplaintSerializer(serializers.ModelSerializer):
         except:
             return "Нет запроса"
 
+    def wants_highlight_sources(self):
+        request = self.context.get('request')
+        try:
+            return request is not None and highlight_sources(request.GET)
+        except InvalidFilter as e:
+            raise serializers.ValidationError({'highlight_source': str(e)})
+
+    def get_highlight_source(self, obj):
+        highlight_field = getattr(obj, 'highlight_field', None)
+        if highlight_field is None or not self.wants_highlight_sources():
+            return None
+        sources = getattr(self, 'highlight_sources', None)
+        if sources is None:
+            sources = locate_highlights({(obj.complaint_id, highlight_field): obj.highlights})
+        return sources.get((obj.complaint_id, highlight_field))
+
 class ComplaintsSearchSerializer(serializers.ModelSerializer):
     list_docs = serializers.SerializerMethodField()
     date = CustomDateTimeField()
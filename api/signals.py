@@ -1,10 +1,16 @@
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from django_elasticsearch_dsl.registries import registry
-from api.models import Complaint
+from api.models import Complaint, IndexOutbox
 
 
-@receiver([post_save, post_delete], sender=Complaint)
-def update_complaint_index(sender, instance, **kwargs):
-    for document in registry.get_documents():
-        document.update(instance)
\ No newline at end of file
+# The index is not touched here: the change is queued in the same transaction as the write (Complaint.save
+# opens one for post_save, the deletion collector for post_delete) and applied in batches by
+# `manage.py drain_index_outbox`. QuerySet.update() and bulk_create() send no signals and queue nothing.
+@receiver(post_save, sender=Complaint)
+def queue_complaint_index(sender, instance, **kwargs):
+    IndexOutbox.objects.create(complaint_id=instance.pk, action='index')
+
+
+@receiver(post_delete, sender=Complaint)
+def queue_complaint_delete(sender, instance, **kwargs):
+    IndexOutbox.objects.create(complaint_id=instance.pk, action='delete')
@@ -0,0 +1,62 @@
+import datetime
+import io
+import json
+import unittest
+
+from api.complaint_fields import NO_DATA, FieldExtractor, ijson, parse_projection
+
+CARD = {
+    'cardHeaderBlock_dict': {
+        'number': '07/123',
+        'status': 'Рассмотрено',
+        'dates_dict': {'Размещено': '02.03.2021', 'Поступление жалобы': '01.03.2021'},
+        'dop_data': {'Орган контроля': 'Московское УФАС', 'Лицо, подавшее жалобу': 'ООО "Ромашка"'},
+        'obosnovanie': '',
+        'tags': [{'name': 'a'}, ['b', 1.5]],
+    },
+    'section_card_common_dict': {
+        'Информация о субъекте контроля': {'Наименование организации': 'ГБУ', 'ИНН': '7701234567'},
+        'Сведения о закупке': {'Номер извещения': '0373100000121000001', 'Сумма': 1250.75},
+    },
+    'other_dict': {'number': 'not the card header'},
+}
+
+
+@unittest.skipIf(ijson is None, 'ijson is not installed')
+class FieldExtractorTests(unittest.TestCase):
+    def both(self, data, card_key='07/123', **options):
+        extractor = FieldExtractor(**options)
+        in_memory = extractor.extract_data(json.loads(json.dumps(data)), card_key)
+        streamed = extractor.extract_stream(io.BytesIO(json.dumps(data, ensure_ascii=False).encode()), card_key)
+        return in_memory, streamed
+
+    def test_fields(self):
+        in_memory, streamed = self.both({'07/123': CARD})
+        self.assertEqual(streamed[0], in_memory[0])
+        fields = streamed[0]
+        self.assertEqual(fields['complaint_id'], '07/123')
+        self.assertEqual(fields['date'], datetime.date(2021, 3, 1))
+        self.assertEqual(fields['region'], 'МОСКОВСКОЕ УФАС')
+        self.assertEqual(fields['justification'], 'Статус еще не определён')
+        self.assertEqual(fields['complainant_inn'], NO_DATA)
+
+    def test_default_projection(self):
+        in_memory, streamed = self.both({'07/123': CARD})
+        self.assertEqual(streamed, in_memory)
+        self.assertEqual(set(streamed[1]['07/123']), {'cardHeaderBlock_dict', 'section_card_common_dict'})
+
+    def test_nested_and_whole_card_projections(self):
+        for projection in (parse_projection('section_card_common_dict/Сведения о закупке,cardHeaderBlock_dict/tags'),
+                           parse_projection('*')):
+            in_memory, streamed = self.both({'07/123': CARD}, projection=projection)
+            self.assertEqual(streamed, in_memory)
+
+    def test_other_top_level_keys_are_ignored(self):
+        in_memory, streamed = self.both({'meta': {'number': 'x'}, '07/123': CARD})
+        self.assertEqual(streamed, in_memory)
+
+    def test_missing_card(self):
+        in_memory, streamed = self.both({'meta': CARD})
+        self.assertEqual(streamed, in_memory)
+        self.assertEqual(streamed[1], {})
+        self.assertIsNone(streamed[0]['complaint_id'])
@@ -0,0 +1,92 @@
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import docx_script
+from api.conversion import ConversionError, ConversionPool, ConversionTimeout, FakeConverter
+from api.job_queue import DONE, PENDING, JobQueue
+
+
+class ConversionPoolTests(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = directory.name
+        self.folder = os.path.join(self.root, 'complaint-1')
+        os.mkdir(self.folder)
+        self.converters = []
+
+    def doc(self, name):
+        path = os.path.join(self.folder, name)
+        with open(path, 'w') as f:
+            f.write(name)
+        return path
+
+    def factory(self, **options):
+        def make(index):
+            converter = FakeConverter(index, **options)
+            self.converters.append(converter)
+            return converter
+        return make
+
+    def convert(self, files, workers=1, timeout=5, **options):
+        with ConversionPool(self.factory(**options), workers, timeout) as pool:
+            return {src: (dst, error) for src, dst, error, elapsed in pool.map(files)}
+
+    def test_converts_next_to_the_source(self):
+        src = self.doc('a.doc')
+        results = self.convert([src])
+        self.assertEqual(results, {src: (os.path.join(self.folder, 'a.docx'), None)})
+        self.assertTrue(os.path.exists(os.path.join(self.folder, 'a.docx')))
+
+    def test_hung_conversion_times_out_and_restarts_the_worker(self):
+        hung, after = self.doc('hung.doc'), self.doc('after.doc')
+        results = self.convert([hung, after], timeout=0.2, hang=[hung])
+        self.assertIsNone(results[hung][0])
+        self.assertIsInstance(results[hung][1], ConversionTimeout)
+        self.assertEqual(results[after], (os.path.join(self.folder, 'after.docx'), None))
+        converter, = self.converters
+        self.assertEqual(converter.started, 2)
+        self.assertEqual(converter.converted, [after])
+
+    def test_failed_conversion_keeps_the_source_and_reports_the_error(self):
+        src = self.doc('broken.doc')
+        jobs = JobQueue(os.path.join(self.root, 'jobs.sqlite3'), max_attempts=2, backoff=0)
+        self.addCleanup(jobs.close)
+        jobs.enqueue('convert', src, {'path': src})
+        job, = jobs.claim('convert')
+        results = self.convert([src], fail=[src])
+        dst, error = results[src]
+        self.assertIsNone(dst)
+        self.assertIsInstance(error, ConversionError)
+        with mock.patch.object(docx_script, 'DATA_FOLDER', self.root), \
+                contextlib.redirect_stdout(io.StringIO()):
+            docx_script.finish(jobs, job, dst, error, 0.1)
+        self.assertTrue(os.path.exists(src))
+        self.assertEqual(jobs.db.execute('SELECT state, error FROM jobs WHERE key = ?', (src,)).fetchone(),
+                         (PENDING, f'ConversionError: Cannot convert {src}'))
+        self.assertEqual(jobs.stats(), {'convert': {PENDING: 1}})
+
+    def test_successful_conversion_removes_the_source_and_queues_extraction(self):
+        src = self.doc('a.doc')
+        jobs = JobQueue(os.path.join(self.root, 'jobs.sqlite3'))
+        self.addCleanup(jobs.close)
+        jobs.enqueue('convert', src, {'path': src})
+        job, = jobs.claim('convert')
+        dst, error = self.convert([src])[src]
+        with mock.patch.object(docx_script, 'DATA_FOLDER', self.root), \
+                contextlib.redirect_stdout(io.StringIO()):
+            docx_script.finish(jobs, job, dst, error, 0.1)
+        self.assertFalse(os.path.exists(src))
+        self.assertEqual(jobs.stats(), {'convert': {DONE: 1}, 'extract': {PENDING: 1}})
+
+    def test_worker_is_restarted_after_max_files(self):
+        files = [self.doc(f'{number}.doc') for number in range(5)]
+        with ConversionPool(self.factory(), workers=1, timeout=5, max_files_per_worker=2) as pool:
+            results = list(pool.map(files))
+        self.assertEqual(len(results), 5)
+        converter, = self.converters
+        self.assertEqual(converter.started, 3)
@@ -0,0 +1,99 @@
+import os
+import tempfile
+import unittest
+
+from api.job_queue import DEAD, DONE, PENDING, RUNNING, JobQueue
+
+
+class JobQueueTests(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.jobs = JobQueue(os.path.join(directory.name, 'jobs.sqlite3'), max_attempts=2, backoff=0)
+        self.addCleanup(self.jobs.close)
+
+    def state(self, key, kind='convert'):
+        return self.jobs.db.execute('SELECT state, attempts, rerun FROM jobs WHERE kind = ? AND key = ?',
+                                    (kind, key)).fetchone()
+
+    def fail_out(self, key):
+        for _ in range(self.jobs.max_attempts):
+            job, = self.jobs.claim('convert')
+            self.assertEqual(job.key, key)
+            self.jobs.fail(job, 'ValueError: broken')
+
+    def test_enqueue_is_idempotent_for_pending_jobs(self):
+        self.jobs.enqueue_many('convert', [('a', {'path': 'a'}), ('a', {'path': 'a'})])
+        self.jobs.enqueue('convert', 'a', {'path': 'a'})
+        self.assertEqual(self.jobs.stats(), {'convert': {PENDING: 1}})
+
+    def test_failed_job_is_retried_then_dead(self):
+        self.jobs.enqueue('convert', 'a', {'path': 'a'})
+        job, = self.jobs.claim('convert')
+        self.assertTrue(self.jobs.fail(job, 'ValueError: broken'))
+        self.assertEqual(self.state('a')[:2], (PENDING, 1))
+        job, = self.jobs.claim('convert')
+        self.assertEqual(job.attempts, 2)
+        self.assertFalse(self.jobs.fail(job, 'ValueError: broken'))
+        self.assertEqual(self.state('a')[:2], (DEAD, 2))
+        self.assertEqual(self.jobs.claim('convert'), [])
+        self.assertEqual([(job['key'], job['error']) for job in self.jobs.dead()], [('a', 'ValueError: broken')])
+
+    def test_enqueue_leaves_dead_jobs_dead(self):
+        self.jobs.enqueue('convert', 'a', {'path': 'a'})
+        self.fail_out('a')
+        self.jobs.enqueue_many('convert', [('a', {'path': 'a'})])
+        self.assertEqual(self.state('a')[:2], (DEAD, 2))
+        self.assertEqual(self.jobs.claim('convert'), [])
+
+    def test_retry_dead_requeues_with_fresh_attempts(self):
+        self.jobs.enqueue('convert', 'a', {'path': 'a'})
+        self.fail_out('a')
+        self.assertEqual(self.jobs.retry_dead('convert'), 1)
+        job, = self.jobs.claim('convert')
+        self.assertEqual((job.key, job.attempts), ('a', 1))
+
+    def test_rerun_does_not_rescue_a_job_from_dead(self):
+        self.jobs.enqueue('convert', 'a', {'path': 'a'})
+        job, = self.jobs.claim('convert')
+        self.jobs.fail(job, 'ValueError: broken')
+        job, = self.jobs.claim('convert')
+        self.jobs.enqueue('convert', 'a', {'path': 'a'})
+        self.assertEqual(self.state('a'), (RUNNING, 2, 1))
+        self.jobs.fail(job, 'ValueError: broken')
+        self.assertEqual(self.state('a'), (DEAD, 2, 0))
+
+    def test_done_job_is_queued_again(self):
+        self.jobs.enqueue('extract', 'folder', {'folder': 'folder'})
+        job, = self.jobs.claim('extract')
+        self.jobs.complete(job)
+        self.assertEqual(self.state('folder', 'extract')[0], DONE)
+        self.jobs.enqueue('extract', 'folder', {'folder': 'folder'})
+        self.assertEqual(self.state('folder', 'extract')[:2], (PENDING, 0))
+
+    def test_job_enqueued_while_running_runs_again(self):
+        self.jobs.enqueue('extract', 'folder', {'folder': 'folder'})
+        job, = self.jobs.claim('extract')
+        self.jobs.enqueue('extract', 'folder', {'folder': 'folder'})
+        self.jobs.complete(job)
+        self.assertEqual(self.state('folder', 'extract'), (PENDING, 0, 0))
+
+    def test_expired_lease_is_claimed_again(self):
+        self.jobs.enqueue('convert', 'a', {'path': 'a'})
+        self.jobs.claim('convert', lease=-1)
+        job, = self.jobs.claim('convert')
+        self.assertEqual((job.key, job.attempts), ('a', 2))
+
+    def test_expired_lease_on_last_attempt_is_dead(self):
+        self.jobs.enqueue('convert', 'a', {'path': 'a'})
+        self.jobs.claim('convert', lease=-1)
+        self.jobs.claim('convert', lease=-1)
+        self.jobs.enqueue('convert', 'b', {'path': 'b'})
+        job, = self.jobs.claim('convert', limit=2)
+        self.assertEqual(job.key, 'b')
+        self.assertEqual(self.state('a')[:2], (DEAD, 2))
+        self.assertEqual([(job['key'], job['error']) for job in self.jobs.dead()], [('a', 'lease expired')])
+
+
+if __name__ == '__main__':
+    unittest.main()
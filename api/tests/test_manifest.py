@@ -0,0 +1,106 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from api.manifest import FULL_RUN, PARTIAL_RUN, Manifest, scan_files
+
+
+class ManifestTests(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = directory.name
+        self.data = os.path.join(self.root, 'data')
+        os.mkdir(self.data)
+        self.path = os.path.join(self.root, 'manifest.sqlite3')
+        self.manifest = self.open()
+
+    def open(self):
+        manifest = Manifest(self.path)
+        self.addCleanup(manifest.db.close)
+        return manifest
+
+    def write(self, folder, name='a.json', content='{}'):
+        os.makedirs(os.path.join(self.data, folder), exist_ok=True)
+        path = os.path.join(self.data, folder, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def commit(self, manifest, folder, transient=()):
+        files = [{'path': path, 'size': size, 'mtime_ns': mtime_ns, 'hash': path, 'transient': path in transient}
+                 for path, size, mtime_ns in scan_files(os.path.join(self.data, folder))]
+        manifest.commit(folder, f'id-{folder}', files)
+        manifest.save()
+
+    def scan(self, manifest=None, **options):
+        return sorted((manifest or self.manifest).scan(self.data, **options))
+
+    def test_unchanged_folders_are_skipped(self):
+        self.write('1')
+        self.write('2')
+        self.assertEqual(self.scan(), ['1', '2'])
+        self.commit(self.manifest, '1')
+        self.commit(self.manifest, '2')
+        self.assertEqual(self.scan(self.open()), [])
+
+    def test_changed_and_new_files_are_picked_up(self):
+        self.write('1')
+        self.write('2')
+        self.commit(self.manifest, '1')
+        self.commit(self.manifest, '2')
+        self.write('1', content='{"changed": true}')
+        self.write('2', name='b.pdf')
+        self.assertEqual(self.scan(self.open()), ['1', '2'])
+
+    def test_force_and_skip_names(self):
+        self.write('1')
+        self.write('docs_Жалоба')
+        self.commit(self.manifest, '1')
+        self.assertEqual(self.scan(skip_names=['docs_Жалоба']), [])
+        self.assertEqual(self.scan(skip_names=['docs_Жалоба'], force=True), ['1'])
+
+    def test_folder_with_a_transient_failure_is_scanned_again(self):
+        path = self.write('1', name='a.pdf')
+        self.commit(self.manifest, '1', transient=[path])
+        manifest = self.open()
+        self.assertEqual(self.scan(manifest), ['1'])
+        self.assertEqual(manifest.hashes('1'), {path: None})
+
+    def test_since_keeps_only_recently_modified_folders(self):
+        old, new = self.write('old'), self.write('new')
+        os.utime(old, (1000, 1000))
+        os.utime(new, (2000, 2000))
+        self.assertEqual(self.scan(since=1500), ['new'])
+
+    def test_deleted_folders_after_a_full_scan(self):
+        self.write('1')
+        self.write('2')
+        self.commit(self.manifest, '1')
+        self.commit(self.manifest, '2')
+        manifest = self.open()
+        self.assertEqual(manifest.deleted(), {})
+        os.remove(os.path.join(self.data, '2', 'a.json'))
+        os.rmdir(os.path.join(self.data, '2'))
+        self.scan(manifest)
+        self.assertEqual(manifest.deleted(), {'2': 'id-2'})
+        self.scan(manifest, since=0)
+        self.assertEqual(manifest.deleted(), {})
+
+    def test_interrupted_run_is_resumed_with_its_completed_folders(self):
+        self.write('1')
+        self.write('2')
+        run_id = self.manifest.start_run({'force': True})
+        self.commit(self.manifest, '1')
+        with mock.patch('api.manifest.process_alive', return_value=False):
+            self.assertEqual(self.open().resume_run(), (run_id, {'force': True}, {'1'}))
+            self.assertEqual(self.open().resume_run(PARTIAL_RUN), (None, None, set()))
+
+    def test_run_of_a_live_process_or_a_finished_run_is_not_resumed(self):
+        self.manifest.start_run({}, FULL_RUN)
+        with mock.patch('api.manifest.process_alive', return_value=True):
+            self.assertEqual(self.open().resume_run(), (None, None, set()))
+        self.manifest.finish_run()
+        with mock.patch('api.manifest.process_alive', return_value=False):
+            self.assertEqual(self.open().resume_run(), (None, None, set()))
@@ -0,0 +1,123 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from api.search_cache import FileCache, LocalCache, RedisCache, SearchCache, bump_generation, make_backend
+
+
+class FakeRedis:
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value, ex=None):
+        self.values[key] = value
+
+    def incr(self, key):
+        self.values[key] = int(self.values.get(key, 0)) + 1
+        return self.values[key]
+
+
+class SearchCacheTests(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = directory.name
+
+    def redis_backend(self):
+        backend = RedisCache.__new__(RedisCache)
+        backend.client, backend.ttl, backend.prefix = FakeRedis(), 600, 'search:'
+        return backend
+
+    def backends(self):
+        generation_path = os.path.join(self.root, 'generation')
+        return {
+            'locmem': ('locmem://', generation_path),
+            'file': (f'file://{self.root}/cache.sqlite3', None),
+        }
+
+    def test_key_depends_on_scope_query_and_params_not_their_order(self):
+        cache = SearchCache(LocalCache())
+        key = cache.key(['view', 'host'], 'поставка', {'size': '10', 'from': '0'})
+        self.assertEqual(key, cache.key(['view', 'host'], 'поставка', {'from': '0', 'size': '10'}))
+        self.assertNotEqual(key, cache.key(['other', 'host'], 'поставка', {'size': '10', 'from': '0'}))
+        self.assertNotEqual(key, cache.key(['view', 'host'], 'Поставка', {'size': '10', 'from': '0'}))
+        self.assertNotEqual(key, cache.key(['view', 'host'], 'поставка', {'size': '10', 'from': '10'}))
+
+    def test_bump_makes_earlier_entries_unreachable(self):
+        for name, (url, generation_path) in self.backends().items():
+            with self.subTest(name):
+                cache = SearchCache(make_backend(url, generation_path))
+                key = cache.key('scope', 'q', {})
+                cache.set(key, {'count': 1})
+                self.assertEqual(cache.get(cache.key('scope', 'q', {})), {'count': 1})
+                self.assertEqual(bump_generation(url, generation_path), 1)
+                self.assertIsNone(cache.get(cache.key('scope', 'q', {})))
+                self.assertEqual(bump_generation(url, generation_path), 2)
+
+    def test_file_cache_generation_is_shared_through_the_file(self):
+        path = os.path.join(self.root, 'cache.sqlite3')
+        reader, writer = FileCache(path), FileCache(path)
+        self.assertEqual(reader.generation(), 0)
+        writer.bump_generation()
+        self.assertEqual(reader.generation(), 1)
+
+    def test_redis_generation_is_a_counter_next_to_the_entries(self):
+        backend = self.redis_backend()
+        self.assertEqual(backend.generation(), 0)
+        self.assertEqual(backend.bump_generation(), 1)
+        self.assertEqual(backend.client.values['search:generation'], 1)
+        self.assertEqual(backend.generation(), 1)
+
+    def test_local_cache_without_generation_path(self):
+        backend = LocalCache()
+        self.assertEqual(backend.generation(), 0)
+        self.assertIsNone(backend.bump_generation())
+        self.assertIsNone(bump_generation('', None))
+
+    def test_local_cache_evicts_least_recently_used_and_expired(self):
+        backend = LocalCache(max_entries=2, ttl=600)
+        backend.set('a', 1)
+        backend.set('b', 2)
+        backend.get('a')
+        backend.set('c', 3)
+        self.assertEqual((backend.get('a'), backend.get('b'), backend.get('c')), (1, None, 3))
+        backend.ttl = -1
+        backend.set('d', 4)
+        self.assertIsNone(backend.get('d'))
+
+    def test_without_backend_every_call_computes(self):
+        cache = SearchCache(None)
+        calls = []
+        for _ in range(2):
+            cache.get_or_compute(cache.key('scope', 'q', {}), lambda: calls.append(1) or len(calls))
+        self.assertEqual(len(calls), 2)
+
+    def test_concurrent_identical_requests_compute_once(self):
+        cache = SearchCache(LocalCache())
+        key = cache.key('scope', 'q', {})
+        calls = []
+        start = threading.Barrier(5)
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.1)
+            return {'count': 7}
+
+        def request():
+            start.wait()
+            results.append(cache.get_or_compute(key, compute))
+
+        results = []
+        threads = [threading.Thread(target=request) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{'count': 7}] * 5)
+        self.assertEqual(cache.locks, {})
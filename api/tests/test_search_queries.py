@@ -0,0 +1,81 @@
+import datetime
+import unittest
+
+import django
+from django.conf import settings
+
+if not settings.configured:
+    # The project settings need Elasticsearch credentials from the environment; nothing here connects anywhere.
+    settings.configure(
+        INSTALLED_APPS=['django.contrib.auth', 'django.contrib.contenttypes', 'django_elasticsearch_dsl', 'api'],
+        ELASTICSEARCH_DSL={'default': {'hosts': 'localhost:9200'}},
+        ELASTICSEARCH_DSL_AUTOSYNC=False,
+        LANGUAGE_CODE='ru',
+        USE_I18N=True,
+        USE_TZ=True,
+    )
+    django.setup()
+
+from django.http import QueryDict
+
+from api.search_queries import InvalidFilter, decode_cursor, encode_cursor, filter_clauses, parse_date
+
+
+def clauses(query, date_range=None):
+    return [clause.to_dict() for clause in filter_clauses(QueryDict(query), date_range)]
+
+
+class FilterClausesTests(unittest.TestCase):
+    def test_no_filters(self):
+        self.assertEqual(clauses('q=x&size=10&date_after='), [])
+
+    def test_exact_and_any_of_fields(self):
+        self.assertEqual(clauses('region=УФАС&status=a&status=b&status='), [
+            {'term': {'region.raw': 'УФАС'}},
+            {'terms': {'status.raw': ['a', 'b']}},
+        ])
+
+    def test_names_are_case_insensitive_substrings_with_wildcards_escaped(self):
+        self.assertEqual(clauses('customer_name=ГБУ*%3F'), [
+            {'wildcard': {'customer_name.raw': {'value': '*ГБУ\\*\\?*', 'case_insensitive': True}}},
+        ])
+
+    def test_date_range_in_either_format(self):
+        self.assertEqual(clauses('date_after=01.02.2023&date_before=2023-03-01'), [
+            {'range': {'date': {'gte': '2023-02-01', 'lte': '2023-03-01'}}},
+        ])
+        self.assertEqual(clauses('date_after=2023-02-01'), [{'range': {'date': {'gte': '2023-02-01'}}}])
+
+    def test_date_range_already_parsed_by_the_filterset(self):
+        date_range = slice(datetime.datetime(2023, 2, 1), None)
+        self.assertEqual(clauses('date_after=garbage', date_range), [{'range': {'date': {'gte': '2023-02-01'}}}])
+
+    def test_invalid_date(self):
+        with self.assertRaises(InvalidFilter):
+            clauses('date_before=31.02.2023')
+
+
+class ParseDateTests(unittest.TestCase):
+    def test_formats(self):
+        self.assertEqual(parse_date('2023-02-01'), datetime.date(2023, 2, 1))
+        self.assertEqual(parse_date('01.02.2023'), datetime.date(2023, 2, 1))
+
+    def test_invalid(self):
+        for value in ('', 'yesterday', '2023-13-01'):
+            with self.assertRaises(InvalidFilter):
+                parse_date(value)
+
+
+class CursorTests(unittest.TestCase):
+    def test_round_trip(self):
+        cursor = {'pit': 'p1==', 'after': [1.5, 'x', 3], 'count': 42}
+        token = encode_cursor(cursor)
+        self.assertNotIn('=', token)
+        self.assertEqual(decode_cursor(token), cursor)
+
+    def test_invalid_tokens(self):
+        for token in ('%%%', 'bm90anNvbg', encode_cursor([1]), encode_cursor({'pit': 1, 'after': [], 'count': 0}),
+                      encode_cursor({'pit': 'p', 'after': {}, 'count': 0}),
+                      encode_cursor({'pit': 'p', 'after': [], 'count': '0'})):
+            with self.assertRaises(InvalidFilter):
+                decode_cursor(token)
@@ -1,11 +1,17 @@
 from django.urls import path
 from urllib.parse import quote_plus
 from api.views import ComplaintList, ComplaintDetail, SearchComplaintsView, SearchComplaintsView_70, \
-    SearchPrescriptionsView, SearchPrescriptionsView_70, SearchSolutionsView, SearchSolutionsView_70, SearchAllView, SearchAllView_70, SearchAllView
+    SearchPrescriptionsView, SearchPrescriptionsView_70, SearchSolutionsView, SearchSolutionsView_70, SearchAllView, SearchAllView_70, SearchAllView, \
+    BatchSearchView, ComplaintHighlightsView
+from api.async_views import AsyncSearchComplaintsView, AsyncSearchComplaintsView_70, AsyncSearchSolutionsView, \
+    AsyncSearchSolutionsView_70, AsyncSearchPrescriptionsView, AsyncSearchPrescriptionsView_70, AsyncSearchAllView, \
+    AsyncSearchAllView_70
 
 urlpatterns = [
     path('complaints/', ComplaintList.as_view(), name='complaint_list'),
     path('complaint/<str:pk>/', ComplaintDetail.as_view(), name='complaint_detail'),
+    path('complaint/<str:pk>/highlights/<str:query>/', ComplaintHighlightsView.as_view(),
+         name='complaint_highlights'),
     path('complaints/exact/search/<str:query>/', SearchComplaintsView.as_view(), name='search_complaints'),
     path('complaints/inexact/search/<str:query>/', SearchComplaintsView_70.as_view(), name='search_complaints_70'),
     path('solutions/exact/search/<str:query>/', SearchSolutionsView.as_view(), name='search_solutions'),
@@ -16,5 +22,22 @@ urlpatterns = [
     path('alldocuments/inexact/search/<str:query>/', SearchAllView_70.as_view(),
          name='search_all_70'),
     path('alldocuments/exact/search/<str:query>/', SearchAllView.as_view(), name='search_all'),
+    path('search/batch/', BatchSearchView.as_view(), name='search_batch'),
+    # The same searches as async views, for deployments served by the ASGI application.
+    path('async/complaints/exact/search/<str:query>/', AsyncSearchComplaintsView.as_view(),
+         name='async_search_complaints'),
+    path('async/complaints/inexact/search/<str:query>/', AsyncSearchComplaintsView_70.as_view(),
+         name='async_search_complaints_70'),
+    path('async/solutions/exact/search/<str:query>/', AsyncSearchSolutionsView.as_view(),
+         name='async_search_solutions'),
+    path('async/solutions/inexact/search/<str:query>/', AsyncSearchSolutionsView_70.as_view(),
+         name='async_search_solutions_70'),
+    path('async/prescriptions/exact/search/<str:query>/', AsyncSearchPrescriptionsView.as_view(),
+         name='async_search_prescriptions'),
+    path('async/prescriptions/inexact/search/<str:query>/', AsyncSearchPrescriptionsView_70.as_view(),
+         name='async_search_prescriptions_70'),
+    path('async/alldocuments/inexact/search/<str:query>/', AsyncSearchAllView_70.as_view(),
+         name='async_search_all_70'),
+    path('async/alldocuments/exact/search/<str:query>/', AsyncSearchAllView.as_view(), name='async_search_all'),
     # path('user_auntification_token/', CustomAuthToken.as_view()),
 ]
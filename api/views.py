@@ -9,15 +9,32 @@ from rest_framework.response import Response
 from api.models import Complaint
 from api.serializers import ComplaintSerializer, ComplaintsSearchSerializer, SolutionsSearchSerializer, PrescriptionsSearchSerializer, AllSearch
 from api.filters import ComplaintFilter
+from api.pagination import RankedPagination
 import os
-from django.http import FileResponse, HttpResponse
+from django.http import FileResponse, HttpResponse, QueryDict
 from django.shortcuts import redirect
+from django.urls import NoReverseMatch, reverse
+from elasticsearch_dsl import MultiSearch
 from rest_framework.pagination import LimitOffsetPagination
 from rest_framework.views import APIView
-from api.documents import ComplaintsDocument, SolutionsDocument, PrescriptionsDocument, AllDocument
-from elasticsearch_dsl import Q
+from api.documents import AllDocument
+from api.document_sources import locate_highlights
+from api.search_queries import META_FIELDS, CursorExpired, InvalidFilter, apply_filters, check_window, cursor_link, \
+    cursor_page, default_clause, exact_query, highlight, highlight_mode, highlight_sources, inexact_query, page_links, \
+    restart_link
+from api.es_client import execute, get_client, healthy
+from api.search_cache import SearchCache, make_backend
+from django.conf import settings
 from urllib.parse import quote_plus, urlencode
 
+search_cache = SearchCache(make_backend(settings.SEARCH_CACHE_URL, settings.DATA_GENERATION_PATH))
+
+
+def cache_params(params):
+    # Paging parameters with their defaults filled in, so a GET relying on them and a batch item (which always
+    # spells them out) share one cache key.
+    return {'size': ['10'], 'from': ['0'], **dict(params.lists())}
+
 
 def redirect_to_api_v1(request):
     return redirect('http://svoyaproverka.ru/api/v2/complaints/?limit=10')
@@ -38,7 +55,7 @@ class ComplaintList(generics.ListAPIView):
     serializer_class = ComplaintSerializer
     filter_backends = [DjangoFilterBackend]
     filterset_class = ComplaintFilter
-    pagination_class = LimitOffsetPagination
+    pagination_class = RankedPagination
     pagination_class.default_limit = 10
     pagination_class.max_limit = 20
 
@@ -64,456 +81,311 @@ class CustomAuthToken(ObtainAuthToken):
         return Response({'token': token.key})
 
 
-class SearchComplaintsView(APIView):
+class SearchUnavailable(Exception):
+    pass
+
+
+class SearchView(APIView, LimitOffsetPagination):
+    # All search endpoints query the single AllDocument index; subclasses pick the docs_* field(s).
     productinventory_serializer = ComplaintsSearchSerializer
-    search_document = ComplaintsDocument
+    search_document = AllDocument
+    search_fields = ['docs_complaints']
+    fragment_size = 400
+
+    def build_query(self, query):
+        return exact_query(self.search_fields, query) & default_clause()
+
+    def hit_fragments(self, hit):
+        if 'highlight' not in hit.meta:
+            return {}
+        return {field: hit.meta.highlight[field][0] for field in self.search_fields if field in hit.meta.highlight}
+
+    def get_highlights(self, hits, with_sources=False):
+        # (highlights, highlight_source) of every hit, or None. Sources are only looked up `with_sources`,
+        # and then take one query for the whole page.
+        fragments = [self.hit_fragments(hit) for hit in hits]
+        sources = {}
+        if with_sources:
+            sources = locate_highlights({(hit.meta.id, field): fragment
+                                         for hit, hit_fragments in zip(hits, fragments)
+                                         for field, fragment in hit_fragments.items()})
+        return [self.format_highlights(hit.meta.id, hit_fragments, sources)
+                for hit, hit_fragments in zip(hits, fragments)]
+
+    def format_highlights(self, complaint_id, fragments, sources):
+        field = self.search_fields[0]
+        if field not in fragments:
+            return None
+        return fragments[field], sources.get((complaint_id, field))
 
     def get(self, request, query):
         try:
-            q = Q(
-                "multi_match",
-                query=query,
-                fields=["docs_complaints"],
-                type='phrase'
-            ) & Q(
-                should=[
-                    Q("match", is_default=True),
-                ],
-                minimum_should_match=1,
-            )
-            search = self.search_document.search().query(q)
-            search = search.highlight('docs_complaints', fragment_size=400, number_of_fragments=1, pre_tags='<b>',
-                                      post_tags='</b>')
-            size = int(request.GET.get('size', 10))
-            from_value = int(request.GET.get('from', 0))
-            search = search.extra(size=size, from_=from_value, track_total_hits=True)
-            response = search.execute()
-            results = response.hits
-            serializer = self.productinventory_serializer(results, many=True)
-            for hit, serialized_data in zip(results, serializer.data):
-                if 'highlight' in hit.meta:
-                    serialized_data['highlights'] = hit.meta.highlight.docs_complaints[0]
-            next_link = None
-            previous_link = None
-            if from_value + size < response.hits.total.value:
-                params = {
-                    'size': str(size),
-                    'from': str(from_value + size)
-                }
-                next_link = request.build_absolute_uri('?{}'.format(urlencode(params)))
-            if from_value - size >= 0:
-                params = {
-                    'size': str(size),
-                    'from': str(max(from_value - size, 0))
-                }
-                previous_link = request.build_absolute_uri('?{}'.format(urlencode(params)))
-            data = {
-                'count': response.hits.total.value,
-                'next': next_link,
-                'previous': previous_link,
-                'results': serializer.data
-            }
-            return Response(data)
+            if 'cursor' in request.GET:
+                # Cursor pages hold a point in time of their own and are never cached.
+                return Response(self.search(request, query))
+            scope = [type(self).__name__, request.get_host()]
+            key = search_cache.key(scope, query, cache_params(request.GET))
+            return Response(search_cache.get_or_compute(key, lambda: self.search(request, query)))
+        except SearchUnavailable:
+            return HttpResponse('Search is temporarily unavailable', status=503)
+        except InvalidFilter as e:
+            return HttpResponse(str(e), status=400)
+        except CursorExpired as e:
+            return HttpResponse(f'{e}; restart the walk from {restart_link(request)}', status=410)
         except Exception as e:
             return HttpResponse(str(e), status=500)
 
-
-class SearchComplaintsView_70(APIView, LimitOffsetPagination):
-    productinventory_serializer = ComplaintsSearchSerializer
-    search_document = ComplaintsDocument
-
-    def get(self, request, query):
-        try:
-            q = Q(
-                "match_phrase",
-                docs_complaints={
-                    "query": query,
-                    "slop": 2
-                }
-            ) & Q(
-                should=[
-                    Q("match", is_default=True),
-                ],
-                minimum_should_match=1,
-            )
-            search = self.search_document.search().query(q)
-            search = search.highlight('docs_complaints', fragment_size=400, number_of_fragments=1, pre_tags='<b>',
-                                      post_tags='</b>')
-            size = int(request.GET.get('size', 10))
+    def prepare(self, query, params):
+        search = self.search_document.search(using=get_client()).query(self.build_query(query))
+        search = search.source(includes=META_FIELDS)
+        search = apply_filters(search, params)
+        if highlight_mode(params) != 'inline':
+            # Highlighting the long docs_* texts is most of the cost of a page; deferred hits link to
+            # ComplaintHighlightsView instead, which highlights the one complaint asked for.
+            return search
+        return highlight(search, self.search_fields, self.fragment_size)
+
+    def render(self, response, count, next_link, previous_link, highlights='inline', highlights_url=None,
+               highlight_source=False):
+        results = response.hits
+        serializer = self.productinventory_serializer(results, many=True)
+        if highlights == 'deferred':
+            for hit, serialized_data in zip(results, serializer.data):
+                serialized_data['highlights_url'] = highlights_url(hit.meta.id)
+        elif highlights == 'inline':
+            for serialized_data, hit_highlights in zip(serializer.data,
+                                                       self.get_highlights(results, highlight_source)):
+                if hit_highlights is None:
+                    continue
+                serialized_data['highlights'] = hit_highlights[0]
+                if highlight_source:
+                    serialized_data['highlight_source'] = hit_highlights[1]
+        return {
+            'count': count,
+            'next': next_link,
+            'previous': previous_link,
+            'results': serializer.data
+        }
+
+    def render_options(self, request, query, params):
+        mode = highlight_mode(params)
+        with_sources = highlight_sources(params)
+        if mode != 'deferred':
+            return {'highlights': mode, 'highlight_source': with_sources}
+        scope, search_mode = SEARCH_SCOPES[type(self)]
+        options = {'scope': scope, 'mode': search_mode}
+        if with_sources:
+            options['highlight_source'] = '1'
+        options = urlencode(options)
+        return {
+            'highlights': mode,
+            'highlights_url': lambda complaint_id: request.build_absolute_uri('{}?{}'.format(
+                reverse('complaint_highlights', args=[complaint_id, query]), options)),
+        }
+
+    def search(self, request, query):
+        if not healthy():
+            raise SearchUnavailable()
+        search = self.prepare(query, request.GET)
+        size = int(request.GET.get('size', 10))
+        if 'cursor' in request.GET:
+            # ?cursor= starts a cursor walk; the next link carries the opaque token for the following page.
+            response, count, next_token = cursor_page(get_client(), search, size, request.GET['cursor'])
+            next_link, previous_link = cursor_link(request, size, next_token), None
+        else:
             from_value = int(request.GET.get('from', 0))
+            check_window(from_value, size)
             search = search.extra(size=size, from_=from_value, track_total_hits=True)
-            response = search.execute()
-            results = response.hits
-            serializer = self.productinventory_serializer(results, many=True)
-            for hit, serialized_data in zip(results, serializer.data):
-                if 'highlight' in hit.meta:
-                    serialized_data['highlights'] = hit.meta.highlight.docs_complaints[0]
-            next_link = None
-            previous_link = None
-            if from_value + size < response.hits.total.value:
-                params = {
-                    'size': str(size),
-                    'from': str(from_value + size)
-                }
-                next_link = request.build_absolute_uri('?{}'.format(urlencode(params)))
-            if from_value - size >= 0:
-                params = {
-                    'size': str(size),
-                    'from': str(max(from_value - size, 0))
-                }
-                previous_link = request.build_absolute_uri('?{}'.format(urlencode(params)))
-            data = {
-                'count': response.hits.total.value,
-                'next': next_link,
-                'previous': previous_link,
-                'results': serializer.data
-            }
-            return Response(data)
-        except Exception as e:
-            return HttpResponse(str(e), status=500)
+            response = execute(search)
+            count = response.hits.total.value
+            next_link, previous_link = page_links(request, count, size, from_value)
+        return self.render(response, count, next_link, previous_link,
+                           **self.render_options(request, query, request.GET))
 
 
-class SearchSolutionsView(APIView, LimitOffsetPagination):
-    productinventory_serializer = SolutionsSearchSerializer
-    search_document = SolutionsDocument
+class InexactSearchView(SearchView):
+    def build_query(self, query):
+        return inexact_query(self.search_fields[0], query) & default_clause()
 
-    def get(self, request, query):
-        try:
-            q = Q(
-                "multi_match",
-                query=query,
-                fields=["docs_solutions"],
-                type='phrase'
-            ) & Q(
-                should=[
-                    Q("match", is_default=True),
-                ],
-                minimum_should_match=1,
-            )
-            search = self.search_document.search().query(q)
-            search = search.highlight('docs_solutions', fragment_size=400, number_of_fragments=1, pre_tags='<b>',
-                                      post_tags='</b>')
-            size = int(request.GET.get('size', 10))
-            from_value = int(request.GET.get('from', 0))
-            search = search.extra(size=size, from_=from_value, track_total_hits=True)
-            response = search.execute()
-            results = response.hits
-            serializer = self.productinventory_serializer(results, many=True)
-            for hit, serialized_data in zip(results, serializer.data):
-                if 'highlight' in hit.meta:
-                    serialized_data['highlights'] = hit.meta.highlight.docs_solutions[0]
-            next_link = None
-            previous_link = None
-            if from_value + size < response.hits.total.value:
-                params = {
-                    'size': str(size),
-                    'from': str(from_value + size)
-                }
-                next_link = request.build_absolute_uri('?{}'.format(urlencode(params)))
-            if from_value - size >= 0:
-                params = {
-                    'size': str(size),
-                    'from': str(max(from_value - size, 0))
-                }
-                previous_link = request.build_absolute_uri('?{}'.format(urlencode(params)))
-            data = {
-                'count': response.hits.total.value,
-                'next': next_link,
-                'previous': previous_link,
-                'results': serializer.data
-            }
-            return Response(data)
-        except Exception as e:
-            return HttpResponse(str(e), status=500)
 
+class SearchComplaintsView(SearchView):
+    productinventory_serializer = ComplaintsSearchSerializer
+    search_fields = ['docs_complaints']
 
-class SearchSolutionsView_70(APIView, LimitOffsetPagination):
-    productinventory_serializer = SolutionsSearchSerializer
-    search_document = SolutionsDocument
 
-    def get(self, request, query):
-        try:
-            q = Q(
-                "match_phrase",
-                docs_solutions={
-                    "query": query,
-                    "slop": 2
-                }
-            ) & Q(
-                should=[
-                    Q("match", is_default=True),
-                ],
-                minimum_should_match=1,
-            )
-            search = self.search_document.search().query(q)
-            search = search.highlight('docs_solutions', fragment_size=400, number_of_fragments=1, pre_tags='<b>',
-                                      post_tags='</b>')
-            size = int(request.GET.get('size', 10))
-            from_value = int(request.GET.get('from', 0))
-            search = search.extra(size=size, from_=from_value, track_total_hits=True)
-            response = search.execute()
-            results = response.hits
-            serializer = self.productinventory_serializer(results, many=True)
-            for hit, serialized_data in zip(results, serializer.data):
-                if 'highlight' in hit.meta:
-                    serialized_data['highlights'] = hit.meta.highlight.docs_solutions[0]
-            next_link = None
-            previous_link = None
-            if from_value + size < response.hits.total.value:
-                params = {
-                    'size': str(size),
-                    'from': str(from_value + size)
-                }
-                next_link = request.build_absolute_uri('?{}'.format(urlencode(params)))
-            if from_value - size >= 0:
-                params = {
-                    'size': str(size),
-                    'from': str(max(from_value - size, 0))
-                }
-                previous_link = request.build_absolute_uri('?{}'.format(urlencode(params)))
-            data = {
-                'count': response.hits.total.value,
-                'next': next_link,
-                'previous': previous_link,
-                'results': serializer.data
-            }
-            return Response(data)
-        except Exception as e:
-            return HttpResponse(str(e), status=500)
+class SearchComplaintsView_70(InexactSearchView):
+    productinventory_serializer = ComplaintsSearchSerializer
+    search_fields = ['docs_complaints']
 
 
-class SearchPrescriptionsView(APIView, LimitOffsetPagination):
-    productinventory_serializer = PrescriptionsSearchSerializer
-    search_document = PrescriptionsDocument
+class SearchSolutionsView(SearchView):
+    productinventory_serializer = SolutionsSearchSerializer
+    search_fields = ['docs_solutions']
 
-    def get(self, request, query):
-        try:
-            q = Q(
-                "multi_match",
-                query=query,
-                fields=["docs_prescriptions"],
-                type='phrase'
-            ) & Q(
-                should=[
-                    Q("match", is_default=True),
-                ],
-                minimum_should_match=1,
-            )
-            search = self.search_document.search().query(q)
-            search = search.highlight('docs_prescriptions', fragment_size=400, number_of_fragments=1, pre_tags='<b>',
-                                      post_tags='</b>')
-            size = int(request.GET.get('size', 10))
-            from_value = int(request.GET.get('from', 0))
-            search = search.extra(size=size, from_=from_value, track_total_hits=True)
-            response = search.execute()
-            results = response.hits
-            serializer = self.productinventory_serializer(results, many=True)
-            for hit, serialized_data in zip(results, serializer.data):
-                if 'highlight' in hit.meta:
-                    serialized_data['highlights'] = hit.meta.highlight.docs_prescriptions[0]
-            next_link = None
-            previous_link = None
-            if from_value + size < response.hits.total.value:
-                params = {
-                    'size': str(size),
-                    'from': str(from_value + size)
-                }
-                next_link = request.build_absolute_uri('?{}'.format(urlencode(params)))
-            if from_value - size >= 0:
-                params = {
-                    'size': str(size),
-                    'from': str(max(from_value - size, 0))
-                }
-                previous_link = request.build_absolute_uri('?{}'.format(urlencode(params)))
-            data = {
-                'count': response.hits.total.value,
-                'next': next_link,
-                'previous': previous_link,
-                'results': serializer.data
-            }
-            return Response(data)
-        except Exception as e:
-            return HttpResponse(str(e), status=500)
+
+class SearchSolutionsView_70(InexactSearchView):
+    productinventory_serializer = SolutionsSearchSerializer
+    search_fields = ['docs_solutions']
 
 
-class SearchPrescriptionsView_70(APIView, LimitOffsetPagination):
+class SearchPrescriptionsView(SearchView):
     productinventory_serializer = PrescriptionsSearchSerializer
-    search_document = PrescriptionsDocument
+    search_fields = ['docs_prescriptions']
 
-    def get(self, request, query):
-        try:
-            q = Q(
-                "match_phrase",
-                docs_prescriptions={
-                    "query": query,
-                    "slop": 2
-                }
-            ) & Q(
-                should=[
-                    Q("match", is_default=True),
-                ],
-                minimum_should_match=1,
-            )
-            search = self.search_document.search().query(q)
-            search = search.highlight('docs_prescriptions', fragment_size=400, number_of_fragments=1, pre_tags='<b>',
-                                      post_tags='</b>')
-            size = int(request.GET.get('size', 10))
-            from_value = int(request.GET.get('from', 0))
-            search = search.extra(size=size, from_=from_value, track_total_hits=True)
-            response = search.execute()
-            results = response.hits
-            serializer = self.productinventory_serializer(results, many=True)
-            for hit, serialized_data in zip(results, serializer.data):
-                if 'highlight' in hit.meta:
-                    serialized_data['highlights'] = hit.meta.highlight.docs_prescriptions[0]
-            next_link = None
-            previous_link = None
-            if from_value + size < response.hits.total.value:
-                params = {
-                    'size': str(size),
-                    'from': str(from_value + size)
-                }
-                next_link = request.build_absolute_uri('?{}'.format(urlencode(params)))
-            if from_value - size >= 0:
-                params = {
-                    'size': str(size),
-                    'from': str(max(from_value - size, 0))
-                }
-                previous_link = request.build_absolute_uri('?{}'.format(urlencode(params)))
-            data = {
-                'count': response.hits.total.value,
-                'next': next_link,
-                'previous': previous_link,
-                'results': serializer.data
-            }
-            return Response(data)
-        except Exception as e:
-            return HttpResponse(str(e), status=500)
 
+class SearchPrescriptionsView_70(InexactSearchView):
+    productinventory_serializer = PrescriptionsSearchSerializer
+    search_fields = ['docs_prescriptions']
 
-class SearchAllView(APIView, LimitOffsetPagination):
-    productinventory_serializer = AllSearch
-    search_document = AllDocument
 
-    def get(self, request, query):
+class SearchAllView(SearchView):
+    productinventory_serializer = AllSearch
+    search_fields = ["docs_prescriptions", "docs_solutions", "docs_complaints"]
+    fragment_size = 200
+
+    def format_highlights(self, complaint_id, fragments, sources):
+        return fragments, {field: sources.get((complaint_id, field)) for field in fragments}
+
+
+class SearchAllView_70(SearchAllView):
+    fragment_size = 400
+
+    def build_query(self, query):
+        # Operator precedence as before: the is_default clause only binds to the complaints phrase.
+        return (inexact_query("docs_prescriptions", query) | inexact_query("docs_solutions", query)
+                | inexact_query("docs_complaints", query) & default_clause())
+
+
+# (scope, mode) of a batch item or a highlights request -> the endpoint answering the same query on its own.
+SEARCH_VIEWS = {
+    ('complaints', 'exact'): ('search_complaints', SearchComplaintsView),
+    ('complaints', 'inexact'): ('search_complaints_70', SearchComplaintsView_70),
+    ('solutions', 'exact'): ('search_solutions', SearchSolutionsView),
+    ('solutions', 'inexact'): ('search_solutions_70', SearchSolutionsView_70),
+    ('prescriptions', 'exact'): ('search_prescriptions', SearchPrescriptionsView),
+    ('prescriptions', 'inexact'): ('search_prescriptions_70', SearchPrescriptionsView_70),
+    ('alldocuments', 'exact'): ('search_all', SearchAllView),
+    ('alldocuments', 'inexact'): ('search_all_70', SearchAllView_70),
+}
+SEARCH_SCOPES = {view_class: scope for scope, (url_name, view_class) in SEARCH_VIEWS.items()}
+
+
+def parse_batch_item(item):
+    if not isinstance(item, dict) or not str(item.get('query') or '').strip():
+        raise InvalidFilter('Every batch item needs a query')
+    scope, mode = item.get('scope', 'complaints'), item.get('mode', 'exact')
+    if (scope, mode) not in SEARCH_VIEWS:
+        raise InvalidFilter(f'Unknown scope or mode: {scope}/{mode}')
+    filters = item.get('filters') or {}
+    if not isinstance(filters, dict):
+        raise InvalidFilter('filters must be an object')
+    params = QueryDict(mutable=True)
+    for name, value in filters.items():
+        params.setlist(name, [str(v) for v in (value if isinstance(value, list) else [value])])
+    if item.get('highlight'):
+        params['highlight'] = str(item['highlight'])
+    if item.get('highlight_source'):
+        params['highlight_source'] = '1'
+    try:
+        params['size'] = str(int(item.get('size', 10)))
+        params['from'] = str(int(item.get('from', 0)))
+    except (TypeError, ValueError):
+        raise InvalidFilter('size and from must be integers')
+    check_window(int(params['from']), int(params['size']))
+    url_name, view_class = SEARCH_VIEWS[(scope, mode)]
+    try:
+        path = reverse(url_name, args=[str(item['query'])])
+    except NoReverseMatch:
+        raise InvalidFilter(f'Query not accepted by the search endpoints: {item["query"]}')
+    return path, view_class(), str(item['query']), params
+
+
+class BatchSearchView(APIView):
+    # POST [{"query": ..., "mode": "exact"|"inexact", "scope": "complaints"|"solutions"|"prescriptions"|
+    # "alldocuments", "size": 10, "from": 0, "highlight": "inline", "highlight_source": false, "filters": {...}},
+    # ...] answers each item
+    # like the GET endpoint for its scope and mode, in order. Cached items come from the search cache, the rest
+    # take one _msearch.
+    def post(self, request):
         try:
-            q = Q(
-                "multi_match",
-                query=query,
-                fields=["docs_prescriptions", "docs_solutions", "docs_complaints"],
-                type='phrase'
-            ) & Q(
-                should=[
-                    Q("match", is_default=True),
-                ],
-                minimum_should_match=1,
-            )
-            search = self.search_document.search().query(q)
-            size = int(request.GET.get('size', 10))
-            from_value = int(request.GET.get('from', 0))
-            search = search.extra(size=size, from_=from_value, track_total_hits=True)
-            for field in ["docs_prescriptions", "docs_solutions", "docs_complaints"]:
-                search = search.highlight(field, fragment_size=200, number_of_fragments=1, pre_tags='<b>',
-                                          post_tags='</b>')
-            response = search.execute()
-            results = response.hits
-            serializer = self.productinventory_serializer(results, many=True)
-            for hit, serialized_data in zip(results, serializer.data):
-                highlights_dict = {}
-                for field in ["docs_prescriptions", "docs_solutions", "docs_complaints"]:
-                    if 'highlight' in hit.meta and field in hit.meta.highlight:
-                        highlights_dict[field] = hit.meta.highlight[field][0]
-                serialized_data['highlights'] = highlights_dict
-            next_link = None
-            previous_link = None
-            if from_value + size < response.hits.total.value:
-                params = {
-                    'size': str(size),
-                    'from': str(from_value + size)
-                }
-                next_link = request.build_absolute_uri('?{}'.format(urlencode(params)))
-            if from_value - size >= 0:
-                params = {
-                    'size': str(size),
-                    'from': str(max(from_value - size, 0))
-                }
-                previous_link = request.build_absolute_uri('?{}'.format(urlencode(params)))
-            data = {
-                'count': response.hits.total.value,
-                'next': next_link,
-                'previous': previous_link,
-                'results': serializer.data
-            }
-            return Response(data)
+            items = request.data.get('queries') if isinstance(request.data, dict) else request.data
+            if not isinstance(items, list):
+                raise InvalidFilter('Expected a list of queries')
+            if len(items) > settings.SEARCH_BATCH_MAX_QUERIES:
+                raise InvalidFilter(f'At most {settings.SEARCH_BATCH_MAX_QUERIES} queries per batch')
+            return Response(self.search(request, [parse_batch_item(item) for item in items]))
+        except SearchUnavailable:
+            return HttpResponse('Search is temporarily unavailable', status=503)
+        except InvalidFilter as e:
+            return HttpResponse(str(e), status=400)
         except Exception as e:
             return HttpResponse(str(e), status=500)
 
-
-class SearchAllView_70(APIView, LimitOffsetPagination):
-    productinventory_serializer = AllSearch
-    search_document = AllDocument
-
-    def get(self, request, query):
+    def search(self, request, items):
+        results = [None] * len(items)
+        keys = []
+        for position, (path, view, query, params) in enumerate(items):
+            # The same key as the GET endpoint with these parameters, so both share cached results.
+            key = search_cache.key([type(view).__name__, request.get_host()], query, cache_params(params))
+            results[position] = search_cache.get(key)
+            keys.append(key)
+        pending = [position for position, result in enumerate(results) if result is None]
+        if not pending:
+            return results
+        if not healthy():
+            raise SearchUnavailable()
+        multi_search = MultiSearch(using=get_client())
+        for position in pending:
+            path, view, query, params = items[position]
+            size, from_value = int(params['size']), int(params['from'])
+            multi_search = multi_search.add(
+                view.prepare(query, params).extra(size=size, from_=from_value, track_total_hits=True))
+        # One failing item (e.g. a too-deep page) does not fail the others.
+        responses = execute(multi_search, 'msearch', raise_on_error=False)
+        for position, response in zip(pending, responses):
+            if response is None:
+                results[position] = {'error': 'Search failed'}
+                continue
+            path, view, query, params = items[position]
+            size, from_value = int(params['size']), int(params['from'])
+            count = response.hits.total.value
+            links = page_links(request, count, size, from_value, path, params)
+            results[position] = view.render(response, count, *links, **view.render_options(request, query, params))
+            search_cache.set(keys[position], results[position])
+        return results
+
+
+class ComplaintHighlightsView(APIView):
+    # GET complaint/<pk>/highlights/<query>/?scope=...&mode=...[&highlight_source=1] returns the highlights the
+    # search endpoint for that scope and mode gives inline, for this one complaint: its query plus an ids filter.
+    def get(self, request, pk, query):
         try:
-            q = Q(
-                "match_phrase",
-                docs_prescriptions={
-                    "query": query,
-                    "slop": 2
-                }
-            ) | Q(
-                "match_phrase",
-                docs_solutions={
-                    "query": query,
-                    "slop": 2
-                }
-            ) | Q(
-                "match_phrase",
-                docs_complaints={
-                    "query": query,
-                    "slop": 2
-                }
-            ) & Q(
-                should=[
-                    Q("match", is_default=True),
-                ],
-                minimum_should_match=1,
-            )
-            search = self.search_document.search().query(q)
-            for field in ["docs_prescriptions", "docs_solutions", "docs_complaints"]:
-                search = search.highlight(field, fragment_size=400, number_of_fragments=1, pre_tags='<b>',
-                                          post_tags='</b>')
-            size = int(request.GET.get('size', 10))
-            from_value = int(request.GET.get('from', 0))
-            search = search.extra(size=size, from_=from_value, track_total_hits=True)
-            response = search.execute()
-            results = response.hits
-            serializer = self.productinventory_serializer(results, many=True)
-            for hit, serialized_data in zip(results, serializer.data):
-                highlights_dict = {}
-                for field in ["docs_prescriptions", "docs_solutions", "docs_complaints"]:
-                    if 'highlight' in hit.meta and field in hit.meta.highlight:
-                        highlights_dict[field] = hit.meta.highlight[field][0]
-            next_link = None
-            previous_link = None
-            if from_value + size < response.hits.total.value:
-                params = {
-                    'size': str(size),
-                    'from': str(from_value + size)
-                }
-                next_link = request.build_absolute_uri('?{}'.format(urlencode(params)))
-            if from_value - size >= 0:
-                params = {
-                    'size': str(size),
-                    'from': str(max(from_value - size, 0))
-                }
-                previous_link = request.build_absolute_uri('?{}'.format(urlencode(params)))
-            data = {
-                'count': response.hits.total.value,
-                'next': next_link,
-                'previous': previous_link,
-                'results': serializer.data
-            }
-            return Response(data)
+            search_key = (request.GET.get('scope', 'complaints'), request.GET.get('mode', 'exact'))
+            if search_key not in SEARCH_VIEWS:
+                raise InvalidFilter('Unknown scope or mode: {}/{}'.format(*search_key))
+            view = SEARCH_VIEWS[search_key][1]()
+            with_sources = highlight_sources(request.GET)
+            key = search_cache.key([type(self).__name__, pk] + list(search_key), query,
+                                   {'highlight_source': with_sources})
+            return Response(search_cache.get_or_compute(key, lambda: self.highlights(view, pk, query, with_sources)))
+        except SearchUnavailable:
+            return HttpResponse('Search is temporarily unavailable', status=503)
+        except InvalidFilter as e:
+            return HttpResponse(str(e), status=400)
         except Exception as e:
             return HttpResponse(str(e), status=500)
+
+    def highlights(self, view, pk, query, with_sources=False):
+        if not healthy():
+            raise SearchUnavailable()
+        search = view.prepare(query, QueryDict()).filter('ids', values=[pk]).source(False).extra(size=1)
+        result = {'complaint_id': pk, 'highlights': None}
+        if with_sources:
+            result['highlight_source'] = None
+        # No hit: the complaint does not match the query (any more).
+        for hit_highlights in view.get_highlights(execute(search).hits, with_sources):
+            if hit_highlights is not None:
+                result['highlights'] = hit_highlights[0]
+                if with_sources:
+                    result['highlight_source'] = hit_highlights[1]
+        return result
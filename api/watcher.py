@@ -0,0 +1,189 @@
+import os
+import time
+
+try:
+    from inotify_simple import INotify, flags
+except ImportError:
+    INotify = None
+    flags = None
+
+
+class Debouncer:
+    # Coalesces repeated events per complaint folder and releases a folder once it has been quiet for `delay`.
+    def __init__(self, delay):
+        self.delay = delay
+        self.pending = {}
+
+    def touch(self, folder_name, now=None):
+        self.pending[folder_name] = now if now is not None else time.monotonic()
+
+    def ready(self, now=None, limit=None):
+        now = now if now is not None else time.monotonic()
+        folders = [name for name, last in self.pending.items() if now - last >= self.delay]
+        folders = folders[:limit] if limit is not None else folders
+        for name in folders:
+            del self.pending[name]
+        return folders
+
+    def next_deadline(self):
+        if not self.pending:
+            return None
+        return min(self.pending.values()) + self.delay
+
+
+class PollingWatcher:
+    # Lists DATA_FOLDER itself each interval and only stats the folders seen active recently,
+    # so a poll never walks the whole tree.
+    def __init__(self, data_folder, skip_names=(), interval=30, hot_ttl=7 * 24 * 3600):
+        self.data_folder = data_folder
+        self.skip_names = set(skip_names)
+        self.interval = interval
+        self.hot_ttl = hot_ttl
+        self.known = None
+        self.hot = {}
+
+    def _folder_mtime(self, folder_name):
+        folder_path = os.path.join(self.data_folder, folder_name)
+        mtimes = [os.stat(folder_path).st_mtime_ns]
+        with os.scandir(folder_path) as entries:
+            for entry in entries:
+                mtimes.append(entry.stat(follow_symlinks=False).st_mtime_ns)
+        return max(mtimes)
+
+    def poll(self):
+        names = {name for name in os.listdir(self.data_folder) if name not in self.skip_names}
+        changed = set()
+        if self.known is not None:
+            changed |= names - self.known
+            changed |= self.known - names
+        self.known = names
+        now = time.time()
+        for name in changed & names:
+            self.hot[name] = [None, now]
+        for name in list(self.hot):
+            mtime, last_change = self.hot[name]
+            if name not in names:
+                del self.hot[name]
+                continue
+            try:
+                current = self._folder_mtime(name)
+            except OSError:
+                continue
+            if mtime is not None and current != mtime:
+                changed.add(name)
+                last_change = now
+            elif now - last_change > self.hot_ttl:
+                del self.hot[name]
+                continue
+            self.hot[name] = [current, last_change]
+        return changed
+
+    def events(self, timeout):
+        time.sleep(min(timeout, self.interval) if timeout is not None else self.interval)
+        return self.poll()
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    # Watches DATA_FOLDER plus every complaint folder created while running (and its docs_* subfolders).
+    # Folder watches expire after `hot_ttl` idle seconds to stay within fs.inotify.max_user_watches.
+    def __init__(self, data_folder, skip_names=(), hot_ttl=7 * 24 * 3600, max_watches=100000):
+        self.data_folder = data_folder
+        self.skip_names = set(skip_names)
+        self.hot_ttl = hot_ttl
+        self.max_watches = max_watches
+        self.inotify = INotify()
+        self.top_mask = flags.CREATE | flags.DELETE | flags.MOVED_TO | flags.MOVED_FROM | flags.ONLYDIR
+        self.folder_mask = (flags.CREATE | flags.DELETE | flags.MOVED_TO | flags.MOVED_FROM | flags.CLOSE_WRITE
+                            | flags.ONLYDIR)
+        self.top_wd = self.inotify.add_watch(data_folder, self.top_mask)
+        self.watches = {}
+        self.last_event = {}
+
+    def _watch(self, folder_name, path):
+        if len(self.watches) >= self.max_watches:
+            self._expire(force=True)
+        try:
+            wd = self.inotify.add_watch(path, self.folder_mask)
+        except OSError:
+            return
+        self.watches[wd] = folder_name
+        self.last_event[folder_name] = time.monotonic()
+
+    def _watch_folder(self, folder_name):
+        folder_path = os.path.join(self.data_folder, folder_name)
+        self._watch(folder_name, folder_path)
+        try:
+            with os.scandir(folder_path) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        self._watch(folder_name, entry.path)
+        except OSError:
+            pass
+
+    def _expire(self, force=False):
+        now = time.monotonic()
+        idle = sorted(self.last_event.items(), key=lambda item: item[1])
+        for folder_name, last in idle:
+            if not force and now - last < self.hot_ttl:
+                break
+            for wd in [wd for wd, name in self.watches.items() if name == folder_name]:
+                try:
+                    self.inotify.rm_watch(wd)
+                except OSError:
+                    pass
+                del self.watches[wd]
+            del self.last_event[folder_name]
+            if force and len(self.watches) < self.max_watches * 0.9:
+                break
+
+    def events(self, timeout):
+        changed = set()
+        timeout_ms = int(timeout * 1000) if timeout is not None else None
+        for event in self.inotify.read(timeout=timeout_ms, read_delay=100):
+            is_dir = event.mask & flags.ISDIR
+            if event.wd == self.top_wd:
+                if event.name in self.skip_names:
+                    continue
+                changed.add(event.name)
+                if is_dir and event.mask & (flags.CREATE | flags.MOVED_TO):
+                    self._watch_folder(event.name)
+                continue
+            folder_name = self.watches.get(event.wd)
+            if folder_name is None:
+                continue
+            if event.mask & flags.IGNORED:
+                del self.watches[event.wd]
+                continue
+            changed.add(folder_name)
+            self.last_event[folder_name] = time.monotonic()
+            if is_dir and event.mask & (flags.CREATE | flags.MOVED_TO):
+                self._watch(folder_name, os.path.join(self.data_folder, folder_name, event.name))
+        self._expire()
+        return changed
+
+    def close(self):
+        self.inotify.close()
+
+
+def make_watcher(data_folder, skip_names=(), force_polling=False, poll_interval=30):
+    if INotify is not None and not force_polling:
+        try:
+            return InotifyWatcher(data_folder, skip_names)
+        except OSError:
+            pass
+    return PollingWatcher(data_folder, skip_names, poll_interval)
+
+
+def watch(watcher, debouncer, handle, max_batch=500):
+    # Feeds debounced folder batches to `handle` until interrupted.
+    while True:
+        deadline = debouncer.next_deadline()
+        timeout = max(deadline - time.monotonic(), 0) if deadline is not None else None
+        for folder_name in watcher.events(timeout):
+            debouncer.touch(folder_name)
+        folders = debouncer.ready(limit=max_batch)
+        if folders:
+            handle(folders)
@@ -1,11 +1,46 @@
 import json
 import os
 import psycopg2
-import re
+import time
 
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from decouple import config
-import datetime
-from api.search_text import search_text_in_folder
+from api.complaint_fields import FieldExtractor, parse_projection
+from api.complaint_writer import ComplaintWriter
+from api.extract_cache import ExtractCache, file_sha256
+from api.job_queue import JobQueue
+from api.manifest import FULL_RUN, PARTIAL_RUN, Manifest, scan_files
+from api.search_cache import bump_generation
+from api.search_text import SupervisedExtractor, normalize_text
+
+
+DATA_FOLDER = config("DATA_FOLDER", default='/complaints/prs/ALL_DATA')
+INGEST_WORKERS = config("INGEST_WORKERS", default=os.cpu_count() or 1, cast=int)
+INGEST_QUEUE_SIZE = config("INGEST_QUEUE_SIZE", default=64, cast=int)
+INGEST_BATCH_SIZE = config("INGEST_BATCH_SIZE", default=500, cast=int)
+SKIP_NAMES = ['.DS_Store', 'docs_Решение', 'docs_Жалоба', 'docs_Предписание', ' .json']
+DOCS_FOLDERS = {
+    'complaint': 'docs_Жалоба',
+    'solution': 'docs_Решение',
+    'prescription': 'docs_Предписание',
+}
+EXTRACT_CACHE_PATH = config("EXTRACT_CACHE_PATH", default='/complaints/prs/extract_cache.sqlite3')
+EXTRACT_CACHE_MAX_BYTES = config("EXTRACT_CACHE_MAX_BYTES", default=20 * 1024 ** 3, cast=int)
+EXTRACT_TIMEOUT = config("EXTRACT_TIMEOUT", default=120, cast=int)
+EXTRACT_MEMORY_LIMIT = config("EXTRACT_MEMORY_LIMIT", default=2 * 1024 ** 3, cast=int)
+EXTRACT_MAX_PAGES = config("EXTRACT_MAX_PAGES", default=2000, cast=int)
+EXTRACT_MAX_BYTES = config("EXTRACT_MAX_BYTES", default=50 * 1024 ** 2, cast=int)
+JSON_DATA_PROJECTION = config("JSON_DATA_PROJECTION", default='cardHeaderBlock_dict,section_card_common_dict')
+JSON_STREAMING_THRESHOLD = config("JSON_STREAMING_THRESHOLD", default=20 * 1024 ** 2, cast=int)
+MANIFEST_PATH = config("MANIFEST_PATH", default='/complaints/prs/ingest_manifest.sqlite3')
+JOB_QUEUE_PATH = config("JOB_QUEUE_PATH", default='/complaints/prs/jobs.sqlite3')
+SEARCH_CACHE_URL = config("SEARCH_CACHE_URL", default='locmem://?max_entries=2000&ttl=600')
+DATA_GENERATION_PATH = config("DATA_GENERATION_PATH", default='/complaints/prs/data_generation')
+
+_extract_cache = None
+_extractor = None
+_field_extractor = None
 
 
 def connect():
@@ -33,247 +68,256 @@ def connect():
         return db, cur
 
 
-data_folder = '/complaints/prs/ALL_DATA'
-folders = os.listdir(data_folder)
-current_date = datetime.datetime.now()
-three_days_ago = current_date - datetime.timedelta(days=3)
-three_days_ago_str = three_days_ago.strftime("%d.%m.%Y")
-days = datetime.datetime.strptime(three_days_ago_str, '%d.%m.%Y').date()
-db, cur = connect()
-list_for_update = []
-list_for_passing = []
-try:
-    cur.execute(f"SELECT complaint_id FROM api_complaint WHERE date >= '{days}'")
-    list_for_update = [folder[0] for folder in cur.fetchall()]
-    cur.execute(f"SELECT complaint_id FROM api_complaint WHERE date < '{days}'")
-    list_for_passing = [folder[0] for folder in cur.fetchall()]
-finally:
-    db.close()
-    cur.close()
-folder_num = 0
-for folder_name in folders:
-    if folder_name in ['.DS_Store', 'docs_Решение', 'docs_Жалоба', 'docs_Предписание', ' .json']:
-        pass
-    if folder_name in list_for_passing:
-        folder_num += 1
-        print(f"\rPassing {folder_num} of {len(list_for_passing)} existing folders", end='')
-    else:
-        if "/" in str(folder_name):
-            folder_name = folder_name.replace('/', '_')
-        try:
-            json_path = os.path.join(data_folder, folder_name, folder_name + '.json')
-            with open(json_path, 'r') as f:
-                json_data = json.load(f)
-        except NotADirectoryError:
-            pass
-        except KeyError:
-            pass
-        except FileNotFoundError:
+def get_extractor():
+    global _extractor
+    if _extractor is None:
+        _extractor = SupervisedExtractor(EXTRACT_TIMEOUT, EXTRACT_MEMORY_LIMIT, EXTRACT_MAX_PAGES, EXTRACT_MAX_BYTES,
+                                         normalize=normalize_text)
+    return _extractor
+
+
+def extract_normalized(file_path):
+    result = get_extractor().extract(file_path)
+    if result.error is not None and result.error != 'unsupported':
+        print(f'\nExtraction of {file_path} failed after {result.elapsed:.1f}s: {result.error}')
+    return result
+
+
+def get_extract_cache():
+    # One cache connection per worker process; sqlite handles them concurrently in WAL mode.
+    global _extract_cache
+    if _extract_cache is None and EXTRACT_CACHE_PATH:
+        _extract_cache = ExtractCache(EXTRACT_CACHE_PATH, EXTRACT_CACHE_MAX_BYTES)
+    return _extract_cache
+
+
+def read_file_document(file_path, digest=None):
+    # Also says whether the extraction failed for a reason of the host rather than the file (see CONTENT_ERRORS).
+    cache = get_extract_cache()
+    if cache is None:
+        result = extract_normalized(file_path)
+        return result.text, result.page_offsets, result.transient
+    results = []
+
+    def extract(path):
+        results.append(extract_normalized(path))
+        return results[-1]
+
+    text, page_offsets = cache.get_document(file_path, extract, digest)
+    return text, page_offsets, bool(results) and results[-1].transient
+
+
+def folder_files(folder_path):
+    cache = get_extract_cache()
+    files = []
+    for path, size, mtime_ns in scan_files(folder_path):
+        digest = cache.file_hash(path) if cache is not None else file_sha256(path)
+        files.append({'path': path, 'size': size, 'mtime_ns': mtime_ns, 'hash': digest})
+    return files
+
+
+def read_docs(folder_path, kind, files, known_hashes):
+    # Only attachments whose hash differs from the last ingested one are extracted and sent to the writer.
+    list_docs_path = os.path.join(folder_path, DOCS_FOLDERS[kind]) + os.sep
+    paths = []
+    documents = []
+    for file in files:
+        if not file['path'].startswith(list_docs_path):
             continue
+        paths.append(file['path'])
+        if known_hashes.get(file['path']) == file['hash']:
+            continue
+        text, page_offsets, transient = read_file_document(file['path'], file['hash'])
+        if transient:
+            # Keeps the file (and its folder) out of the manifest, so the next run extracts it again.
+            file['transient'] = True
+        documents.append({
+            'kind': kind,
+            'path': file['path'],
+            'size': file['size'],
+            'sha256': file['hash'],
+            'page_count': len(page_offsets) if page_offsets is not None else None,
+            'text': text,
+            'page_offsets': page_offsets,
+        })
+    return paths, documents
+
+
+def get_field_extractor():
+    global _field_extractor
+    if _field_extractor is None:
+        _field_extractor = FieldExtractor(projection=parse_projection(JSON_DATA_PROJECTION),
+                                          streaming_threshold=JSON_STREAMING_THRESHOLD)
+    return _field_extractor
+
+
+def parse_folder(folder_name, data_folder=DATA_FOLDER, known_hashes=None):
+    folder_path = os.path.join(data_folder, folder_name)
+    json_path = os.path.join(folder_path, folder_name + '.json')
+    fields, json_data = get_field_extractor().extract(json_path, folder_name.replace('_', '/'))
 
-        try:
-            file_paths = ''
-            docs_complaint = ""
-            docs_solution = ""
-            docs_prescriptions = ""
-            list_docs_path_1 = os.path.join(data_folder, folder_name, 'docs_Жалоба')
-            if len(os.listdir(list_docs_path_1)) == 0:
-                pass
-            else:
-                for item in os.listdir(list_docs_path_1):
-                    item_path = os.path.join(list_docs_path_1, item)
-                    if os.path.isfile(item_path):
-                        file_paths += f'{item_path};'
-                        content = search_text_in_folder(list_docs_path_1)
-                        if content is not None:
-                            content = content.replace('\n', ' ').replace('\f', '').replace('\t', '').replace("   ", "")
-                            content = re.sub('[a-zA-Z]', '', content)
-                            docs_complaint += f'{content} '
-
-            if len(file_paths) == 1:
-                docs_complaint = ''
-                file_paths += file_paths[0] + ';'
-                content = search_text_in_folder(list_docs_path_1)
-                if content is not None:
-                    content = content.replace('\n', ' ').replace('\f', '').replace('\t', '').replace("   ", "")
-                    content = re.sub('[a-zA-Z]', '', content)
-                    docs_complaint += f'{content} '
-
-            list_docs_path_2 = os.path.join(data_folder, folder_name, 'docs_Решение')
-            if len(os.listdir(list_docs_path_2)) == 0:
-                pass
-            else:
-                for item in os.listdir(list_docs_path_2):
-                    item_path = os.path.join(list_docs_path_2, item)
-                    if os.path.isfile(item_path):
-                        file_paths += f'{item_path};'
-                        content = search_text_in_folder(list_docs_path_2)
-                        if content is not None:
-                            content = content.replace('\n', ' ').replace('\f', '').replace('\t', '').replace("   ", "")
-                            content = re.sub('[a-zA-Z]', '', content)
-                            docs_solution += f'{content} '
-            if len(file_paths) == 1:
-                docs_solution = ''
-                file_paths += file_paths[0] + ';'
-                content = search_text_in_folder(list_docs_path_2)
-                if content is not None:
-                    content = content.replace('\n', ' ').replace('\f', '').replace('\t', '').replace("   ", "")
-                    content = re.sub('[a-zA-Z]', '', content)
-                    docs_solution += f'{content} '
-            list_docs_path_3 = os.path.join(data_folder, folder_name, 'docs_Предписание')
-            if len(os.listdir(list_docs_path_3)) == 0:
-                pass
-            else:
-                for item in os.listdir(list_docs_path_3):
-                    item_path = os.path.join(list_docs_path_3, item)
-                    if os.path.isfile(item_path):
-                        file_paths += f'{item_path};'
-                        content = search_text_in_folder(list_docs_path_3)
-                        if content is not None:
-                            content = content.replace('\n', ' ').replace('\f', '').replace('\t', '').replace("   ", "")
-                            content = re.sub('[a-zA-Z]', '', content)
-                            docs_prescriptions += f'{content} '
-            if len(file_paths) == 1:
-                docs_prescriptions = ''
-                file_paths += file_paths[0] + ';'
-                content = search_text_in_folder(list_docs_path_3)
-                if content is not None:
-                    content = content.replace('\n', ' ').replace('\f', '').replace('\t', '').replace("   ", "")
-                    content = re.sub('[a-zA-Z]', '', content)
-                    docs_prescriptions += f'{content} '
-        except KeyError:
-            file_paths = 'Нет файлов'
-            file_content = ""
-        except NotADirectoryError:
-            pass
-        if "_" in str(folder_name):
-            folder_name = folder_name.replace('_', '/')
-        try:
-            complaint_id = json_data[f'{folder_name}']['cardHeaderBlock_dict']['number']
-        except KeyError:
-            complaint_id = 'Нет данных'
-        try:
-            status = json_data[f'{folder_name}']['cardHeaderBlock_dict']['status']
-        except KeyError:
-            status = 'Статус не определён'
-        try:
-            date_str = json_data[f'{folder_name}']['cardHeaderBlock_dict']['dates_dict']['Поступление жалобы']
-            if date_str:
-                date = datetime.datetime.strptime(date_str, '%d.%m.%Y').date()
-            else:
-                date = None
-        except KeyError:
-            try:
-                date_str = json_data[f'{folder_name}']['cardHeaderBlock_dict']['dates_dict']['Размещено']
-                if date_str:
-                    date = datetime.datetime.strptime(date_str, '%d.%m.%Y').date()
+    row = {'folder_name': folder_name, 'files': folder_files(folder_path), 'document_paths': [], 'documents': []}
+    for kind in DOCS_FOLDERS:
+        paths, documents = read_docs(folder_path, kind, row['files'], known_hashes or {})
+        row['document_paths'] += paths
+        row['documents'] += documents
+    row.update(fields)
+    row['complaint_id'] = (fields['complaint_id'] or folder_name).replace('/', '_')
+    row['list_docs'] = ''.join(f'{path};' for path in row['document_paths']) or 'Нет файлов'
+    row['json_data'] = json.dumps(json_data, ensure_ascii=False)
+    return row
+
+
+def process_folder(folder_name, data_folder=DATA_FOLDER, known_hashes=None):
+    try:
+        return folder_name, parse_folder(folder_name, data_folder, known_hashes), None
+    except Exception as e:
+        return folder_name, None, f'{type(e).__name__}: {e}'
+
+
+def iter_processed(folder_names, workers=INGEST_WORKERS, queue_size=INGEST_QUEUE_SIZE, data_folder=DATA_FOLDER,
+                   known_hashes=None):
+    # Results are yielded in submission order; at most `queue_size` folders are in flight,
+    # so memory stays bounded no matter how large the corpus is.
+    known_hashes = known_hashes or (lambda folder_name: {})
+    if workers <= 1:
+        for folder_name in folder_names:
+            yield process_folder(folder_name, data_folder, known_hashes(folder_name))
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for folder_name in folder_names:
+            pending.append(executor.submit(process_folder, folder_name, data_folder, known_hashes(folder_name)))
+            if len(pending) >= queue_size:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+class IngestStats:
+    def __init__(self, total=None):
+        self.started = time.monotonic()
+        self.total = total
+        self.scanned = 0
+        self.folders = 0
+        self.failed = 0
+        self.deleted = 0
+        self.bytes_extracted = 0
+        self.db_rows = 0
+
+    def add(self, row):
+        self.folders += 1
+        self.bytes_extracted += sum(len(document['text'].encode('utf-8'))
+                                    for document in row['documents'] if document['text'] is not None)
+
+    def summary(self):
+        elapsed = time.monotonic() - self.started
+        progress = min(self.scanned / self.total, 1.0) if self.total else None
+        return {
+            'elapsed_s': round(elapsed, 1),
+            'scanned': self.scanned,
+            'total': self.total,
+            'folders': self.folders,
+            'failed': self.failed,
+            'deleted': self.deleted,
+            'db_rows': self.db_rows,
+            'bytes_extracted': self.bytes_extracted,
+            'folders_per_s': round(self.folders / elapsed, 2) if elapsed else None,
+            'bytes_extracted_per_s': round(self.bytes_extracted / elapsed) if elapsed else None,
+            'db_rows_per_s': round(self.db_rows / elapsed, 2) if elapsed else None,
+            'eta_s': round(elapsed * (1 - progress) / progress) if progress else None,
+        }
+
+
+def script(workers=INGEST_WORKERS, queue_size=INGEST_QUEUE_SIZE, data_folder=DATA_FOLDER,
+           batch_size=INGEST_BATCH_SIZE, manifest_path=MANIFEST_PATH, only=None, since=None, force=False,
+           resume=False, on_progress=None, progress_every=10):
+    manifest = Manifest(manifest_path)
+    completed = set()
+    if resume:
+        run_id, options, completed = manifest.resume_run()
+        if run_id is not None:
+            only, since, force = options['only'], options['since'], options['force']
+    if manifest.run_id is None:
+        manifest.start_run({'only': only, 'since': since, 'force': force},
+                           FULL_RUN if only is None and since is None else PARTIAL_RUN)
+    gone = set()
+    if only is not None:
+        stats = IngestStats(len(only))
+        manifest.seen.update(only)
+        gone = {name for name in only if not os.path.isdir(os.path.join(data_folder, name))}
+        candidates = [name for name in only if name not in completed and name not in gone]
+    else:
+        stats = IngestStats(sum(1 for name in os.listdir(data_folder) if name not in SKIP_NAMES))
+        candidates = manifest.scan(data_folder, SKIP_NAMES, since, force, completed)
+
+    def commit_manifest(rows):
+        # Folders are marked as done only once their rows are committed to Postgres.
+        for written in rows:
+            manifest.commit(written['folder_name'], written['complaint_id'], written['files'])
+        manifest.save()
+        stats.db_rows = writer.written + writer.documents_written
+
+    errors = []
+    last_progress = time.monotonic()
+    try:
+        with ComplaintWriter(connect, batch_size, on_flush=commit_manifest) as writer:
+            processed = iter_processed(candidates, workers, queue_size, data_folder, manifest.hashes)
+            for folder_name, row, error in processed:
+                stats.scanned = len(manifest.seen)
+                if error is not None:
+                    errors.append((folder_name, error))
+                    stats.failed += 1
+                    print(f'\nHave an error: \n{error} \nWith folder:\n {folder_name}')
+                else:
+                    writer.add(row)
+                    stats.add(row)
+                if on_progress is not None and time.monotonic() - last_progress >= progress_every:
+                    last_progress = time.monotonic()
+                    on_progress(stats.summary())
+            stats.scanned = len(manifest.seen)
+            deleted = manifest.complaint_ids(gone) if gone else manifest.deleted()
+            if deleted:
+                writer.delete(deleted.values())
+                manifest.forget(deleted)
+                manifest.save()
+                stats.deleted = len(deleted)
+        stats.db_rows = writer.written + writer.documents_written + stats.deleted
+        if writer.written or stats.deleted:
+            bump_generation(SEARCH_CACHE_URL, DATA_GENERATION_PATH)
+        manifest.finish_run()
+    finally:
+        manifest.close()
+    for folder_name, error in writer.errors:
+        print(f'\nHave an error: \n{error} \nWith folder:\n {folder_name}')
+    errors += writer.errors
+    stats.failed = len(errors)
+    summary = stats.summary()
+    summary['errors'] = [{'folder': folder_name, 'error': error} for folder_name, error in errors]
+    return summary
+
+
+def script_queued(job_queue_path=JOB_QUEUE_PATH, batch_folders=INGEST_BATCH_SIZE, lease=3600, **options):
+    # Drains the 'extract' jobs (one per complaint folder, enqueued by docx_script.py after conversions).
+    jobs = JobQueue(job_queue_path)
+    summaries = []
+    try:
+        while True:
+            claimed = {job.key: job for job in jobs.claim('extract', batch_folders, lease)}
+            if not claimed:
+                break
+            summary = script(only=list(claimed), force=True, **options)
+            failed = {error['folder']: error['error'] for error in summary['errors']}
+            for folder_name, job in claimed.items():
+                if folder_name in failed:
+                    jobs.fail(job, failed[folder_name])
                 else:
-                    date = None
-            except KeyError:
-                date_str = "Нет данных"
-                date = None
-        try:
-            region = json_data[f'{folder_name}']['cardHeaderBlock_dict']['dop_data']['Орган контроля']
-        except KeyError:
-            region = 'Нет данных'
-        try:
-            customer_name = json_data[f'{folder_name}']['section_card_common_dict']['Информация о субъекте контроля'][
-                'Наименование организации']
-        except KeyError:
-            customer_name = 'Нет данных'
-        try:
-            customer_inn = json_data[f'{folder_name}']['section_card_common_dict']['Информация о субъекте контроля'][
-                'ИНН']
-            print(customer_inn)
-        except KeyError:
-            customer_inn = 'Нет данных'
-        try:
-            complainant_name = json_data[f'{folder_name}']['cardHeaderBlock_dict']['dop_data']['Лицо, подавшее жалобу']
-        except KeyError:
-            complainant_name = 'Нет данных'
-        try:
-            complainant_inn = json_data[f'{folder_name}']['section_card_common_dict'][
-                'Данные участника контрактной системы в сфере закупок, подавшего жалобу']['ИНН']
-        except KeyError:
-            complainant_inn = 'Нет данных'
-        try:
-            justification = json_data[f'{folder_name}']['cardHeaderBlock_dict']['obosnovanie']
-            if justification == '':
-                justification = 'Статус еще не определён'
-        except KeyError:
-            justification = 'Статус еще не определён'
-        try:
-            numb_purchase = json_data[f'{folder_name}']['section_card_common_dict']['Сведения о закупке'][
-                'Номер извещения']
-        except KeyError:
-            numb_purchase = 'Нет данных'
-        try:
-            prescription = json_data[f'{folder_name}']['cardHeaderBlock_dict']['predpisnaie']
-            if prescription == '':
-                prescription = "Нет данных"
-        except KeyError:
-            prescription = 'Нет данных'
-        try:
-            if file_paths == '':
-                file_paths = 'Нет файлов'
-            if docs_complaint == '':
-                docs_complaint = None
-            else:
-                words = docs_complaint.split()
-                contains_long_word = any(len(word) > 3 for word in words)
-                if not contains_long_word:
-                    docs_complaint = None
-            if docs_solution == '':
-                docs_solution = None
-            else:
-                words = docs_solution.split()
-                contains_long_word = any(len(word) > 3 for word in words)
-                if not contains_long_word:
-                    docs_solution = None
-            if docs_prescriptions == '':
-                docs_prescriptions = None
-            else:
-                words = docs_prescriptions.split()
-                contains_long_word = any(len(word) > 3 for word in words)
-                if not contains_long_word:
-                    docs_prescriptions = None
-            if folder_name in list_for_update:
-                db, cur = connect()
-                try:
-                    cur.execute("UPDATE api_complaint SET status = %s, date = %s, region = %s, customer_name = %s, "
-                                "customer_inn = %s, complainant_name = %s, complainant_inn = %s, justification = %s, "
-                                "numb_purchase = %s, prescription = %s, list_docs = %s, json_data = %s, docs_complaints = %s,"
-                                " docs_solutions = %s, docs_prescriptions = %s WHERE complaint_id = %s",
-                                (status, date, region.upper(), customer_name, customer_inn, complainant_name,
-                                 complainant_inn,
-                                 justification, numb_purchase, prescription, file_paths, json.dumps(json_data),
-                                 docs_complaint, docs_solution, docs_prescriptions, folder_name))
-                    db.commit()
-                finally:
-                    cur.close()
-                    db.close()
-                folder_num = folder_num + 1
-            else:
-                db, cur = connect()
-                try:
-                    cur.execute(
-                        f"INSERT INTO api_complaint (complaint_id, status, date, region, customer_name, customer_inn, "
-                        f"complainant_name, complainant_inn, justification, numb_purchase, prescription, list_docs, "
-                        f"json_data, docs_complaints, docs_solutions, docs_prescriptions)"
-                        f"VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)",
-                        (complaint_id.replace('/', '_'), status, date, region.upper(), customer_name, customer_inn,
-                         complainant_name,
-                         complainant_inn, justification, numb_purchase, prescription, file_paths,
-                         json.dumps(json_data), docs_complaint, docs_solution, docs_prescriptions))
-                    db.commit()
-                finally:
-                    cur.close()
-                    db.close()
-                folder_num = folder_num + 1
-                folder_amount = len(folders)
-                print(f'\rInserted {folder_num} of {folder_amount} existing folders', end='')
-        except ValueError:
-            pass
-        except Exception as e:
-            print(f'Have an error: \n{e} \nWith folder:\n {folder_name}')
-            continue
\ No newline at end of file
+                    jobs.complete(job)
+            summaries.append(summary)
+        return {'runs': summaries, 'jobs': jobs.stats()}
+    finally:
+        jobs.close()
+
+
+if __name__ == '__main__':
+    print(json.dumps(script(on_progress=print), ensure_ascii=False))
@@ -1,31 +1,110 @@
 import os
-import subprocess
-import time
-
-while True:
-    folder_path = '/complaints/prs/ALL_DATA'
-    doc_files = []
-    count_files = 0
-    for root, dirs, files in os.walk(folder_path):
-        for file in files:
-            file_path = os.path.join(root, file)
-            if file_path.endswith('.doc'):
-                count_files += 1
-                print(f'Convert file #{count_files}. Folder name: {file_path.split("/")[4]}')
-                output_path = os.path.splitext(file_path)[0] + ".docx"
-                process = subprocess.Popen(['soffice', '--headless', '--convert-to', 'docx', '--outdir',
-                                            os.path.dirname(file_path), file_path],
-                                           stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                try:
-                    process.wait(timeout=10)
-                except subprocess.TimeoutExpired:
-                    print(f"Timeout expired for file: {file_path}")
-                    process.terminate()
-                    print(f"Process terminated for file: {file_path}")
-                    os.remove(file_path)
-                    print(f'File {file_path} successfully deleted!')
-                try: 
-                    os.remove(file_path)
-                except FileNotFoundError:
-                    pass
-                    
\ No newline at end of file
+import sys
+import threading
+
+from decouple import config
+
+from api.conversion import ConversionPool, make_converter
+from api.job_queue import JobQueue
+from api.watcher import make_watcher
+
+DATA_FOLDER = config('DATA_FOLDER', default='/complaints/prs/ALL_DATA')
+CONVERT_WORKERS = config('CONVERT_WORKERS', default=4, cast=int)
+CONVERT_TIMEOUT = config('CONVERT_TIMEOUT', default=60, cast=float)
+CONVERTER = config('CONVERTER', default='auto')
+SOFFICE_BINARY = config('SOFFICE_BINARY', default='soffice')
+CONVERT_POLL_INTERVAL = config('CONVERT_POLL_INTERVAL', default=30, cast=float)
+CONVERT_IDLE_WAIT = config('CONVERT_IDLE_WAIT', default=5, cast=float)
+CONVERT_MAX_ATTEMPTS = config('CONVERT_MAX_ATTEMPTS', default=5, cast=int)
+JOB_QUEUE_PATH = config('JOB_QUEUE_PATH', default='/complaints/prs/jobs.sqlite3')
+
+
+def scan_doc_files(path):
+    # os.scandir instead of os.walk: the entry type comes from the directory listing, no stat per file.
+    try:
+        entries = list(os.scandir(path))
+    except OSError:
+        return
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            yield from scan_doc_files(entry.path)
+        elif entry.name.endswith('.doc') and entry.is_file(follow_symlinks=False):
+            yield entry.path
+
+
+def enqueue_doc_files(jobs, path, batch_size=1000):
+    # The key includes mtime: a file that ended up dead is only retried once it is replaced.
+    batch = []
+    for file_path in scan_doc_files(path):
+        try:
+            mtime_ns = os.stat(file_path).st_mtime_ns
+        except OSError:
+            continue
+        batch.append((f'{file_path}:{mtime_ns}', {'path': file_path}))
+        if len(batch) >= batch_size:
+            jobs.enqueue_many('convert', batch)
+            batch = []
+    jobs.enqueue_many('convert', batch)
+
+
+def watch_folders():
+    # Runs in its own thread with its own queue connection; only changed complaint folders are rescanned.
+    jobs = JobQueue(JOB_QUEUE_PATH, CONVERT_MAX_ATTEMPTS)
+    watcher = make_watcher(DATA_FOLDER, poll_interval=CONVERT_POLL_INTERVAL)
+    try:
+        while True:
+            for folder_name in watcher.events(None):
+                enqueue_doc_files(jobs, os.path.join(DATA_FOLDER, folder_name))
+    finally:
+        watcher.close()
+        jobs.close()
+
+
+def finish(jobs, job, output_path, error, elapsed):
+    file_path = job.payload['path']
+    folder_name = os.path.relpath(file_path, DATA_FOLDER).split(os.sep)[0]
+    if error is not None:
+        # The source stays in place; the job is retried later or parked as dead with the reason.
+        retry = jobs.fail(job, f'{type(error).__name__}: {error}')
+        print(f'Failed to convert {file_path} ({elapsed:.1f}s, attempt {job.attempts}, '
+              f'{"will retry" if retry else "dead"}): {error}')
+        return
+    print(f'Converted {file_path} ({elapsed:.1f}s). Folder name: {folder_name}')
+    try:
+        os.remove(file_path)
+    except FileNotFoundError:
+        pass
+    jobs.complete(job)
+    jobs.enqueue('extract', folder_name, {'folder': folder_name})
+
+
+def main():
+    jobs = JobQueue(JOB_QUEUE_PATH, CONVERT_MAX_ATTEMPTS)
+    enqueue_doc_files(jobs, DATA_FOLDER)
+    threading.Thread(target=watch_folders, daemon=True).start()
+    # A job outlives a hung conversion; if this process dies its running jobs are claimed again after the lease.
+    lease = CONVERT_TIMEOUT * 3 + 60
+    in_flight = {}
+    with ConversionPool(make_converter(CONVERTER, SOFFICE_BINARY), CONVERT_WORKERS, CONVERT_TIMEOUT) as pool:
+        while True:
+            for job in jobs.claim('convert', CONVERT_WORKERS * 2 - len(in_flight), lease):
+                file_path = job.payload['path']
+                if file_path in in_flight or not os.path.exists(file_path):
+                    jobs.complete(job)
+                    continue
+                in_flight[file_path] = job
+                pool.submit(file_path)
+            result = pool.get(timeout=1 if in_flight else CONVERT_IDLE_WAIT)
+            if result is not None:
+                file_path, output_path, error, elapsed = result
+                finish(jobs, in_flight.pop(file_path), output_path, error, elapsed)
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] == ['--retry-dead']:
+        # Dead conversions stay dead across restarts and rescans until requeued explicitly.
+        jobs = JobQueue(JOB_QUEUE_PATH, CONVERT_MAX_ATTEMPTS)
+        print(f'Requeued {jobs.retry_dead("convert")} dead conversions')
+        jobs.close()
+    else:
+        main()
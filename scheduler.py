@@ -1,5 +1,7 @@
 import asyncio
 import datetime
+import json
+
 from database_script import script
 
 
@@ -8,9 +10,10 @@ async def start_tasks():
     while True:
         now = datetime.datetime.now()
         if now.hour == 3:
-            script()
+            summary = script(resume=True)
+            print(json.dumps(summary, ensure_ascii=False))
             print(f"Выгрузка завершена: {datetime.datetime.now()}")
         await asyncio.sleep(60*60)
 
 if __name__ == '__main__':
-    asyncio.run(start_tasks())
\ No newline at end of file
+    asyncio.run(start_tasks())
@@ -38,11 +38,59 @@ ELASTICSEARCH_DSL = {
         'http_auth': (config('ELASTIC_USER'), config('ELASTIC_PASSWORD')),
         'use_ssl': True,
         'verify_certs': False,
+        # Shared by every filter and view in the process (see api/es_client.py).
+        'maxsize': config('ELASTIC_POOL_SIZE', default=25, cast=int),
+        # Another node right away for connection errors and gateway statuses, never a timed out search;
+        # 429 and 503 are retried after a backoff by api.es_client.execute (ELASTICSEARCH_RETRY).
+        'max_retries': 2,
+        'retry_on_timeout': False,
+        'retry_on_status': (502, 504),
     },
 }
+# How the docs_* fields keep offsets for highlighting: 'postings' (smaller, unified highlighter)
+# or 'term_vectors' (needed for 'fvh'). Changing it takes a reindex_fast.
+ES_DOCS_OFFSETS = config('ES_DOCS_OFFSETS', default='postings')
+# Set once reindex_fast has built the index with those offsets; until then highlighting re-analyzes the texts
+# and only looks at their first million characters (max_analyzed_offset).
+ES_DOCS_OFFSETS_INDEXED = config('ES_DOCS_OFFSETS_INDEXED', default=False, cast=bool)
+# Keep the docs_* texts out of the stored _source (they are stored as fields for highlighting instead).
+ES_DOCS_OUTSIDE_SOURCE = config('ES_DOCS_OUTSIDE_SOURCE', default=False, cast=bool)
+# How long a cursor walk (?cursor=) may wait between two pages before its point in time is closed.
+ES_PIT_KEEP_ALIVE = config('ES_PIT_KEEP_ALIVE', default='10m')
+ES_HIGHLIGHT = {
+    'type': config('ES_HIGHLIGHTER', default='unified'),
+}
+# The async views (api/async_views.py) wait on Elasticsearch without a thread each, so their pool can be larger;
+# Postgres work of those views (auth, highlight sources, cache) runs on a pool of ASYNC_DB_THREADS threads.
+ELASTICSEARCH_ASYNC_MAXSIZE = config('ELASTIC_ASYNC_POOL_SIZE', default=100, cast=int)
+ASYNC_DB_THREADS = config('ASYNC_DB_THREADS', default=8, cast=int)
+# Attempts of a search answered 429 or 503, with a pause of backoff seconds doubled up to max_backoff between them.
+ELASTICSEARCH_RETRY = {
+    'attempts': config('ELASTIC_RETRY_ATTEMPTS', default=3, cast=int),
+    'backoff': 0.2,
+    'max_backoff': 1,
+}
+ELASTICSEARCH_TIMEOUTS = {
+    'search': config('ELASTIC_SEARCH_TIMEOUT', default=30, cast=int),
+    'msearch': config('ELASTIC_MSEARCH_TIMEOUT', default=60, cast=int),
+    'count': 10,
+    'pit': 10,
+    'health': 2,
+}
+
 
+# Index updates go through the IndexOutbox table (see api/signals.py), never inline with a request.
+ELASTICSEARCH_DSL_AUTOSYNC = False
+ELASTICSEARCH_DSL_AUTO_REFRESH = False
 
-ELASTICSEARCH_DSL_AUTO_REFRESH = True
+# Search responses are cached until they expire or the data generation is bumped by ingest,
+# the index outbox drainer or a reindex. locmem://, file:///path.sqlite3 or redis://host:port/db; empty disables.
+# The generation is kept by the backend itself (a Redis key, a table of the sqlite file); locmem:// keeps it
+# in DATA_GENERATION_PATH, shared by the workers of one host.
+SEARCH_CACHE_URL = config("SEARCH_CACHE_URL", default='locmem://?max_entries=2000&ttl=600')
+DATA_GENERATION_PATH = config("DATA_GENERATION_PATH", default='/complaints/prs/data_generation')
+# Items accepted by one POST to search/batch/; they all go to Elasticsearch as a single _msearch.
+SEARCH_BATCH_MAX_QUERIES = config("SEARCH_BATCH_MAX_QUERIES", default=50, cast=int)
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',